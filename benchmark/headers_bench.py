@@ -0,0 +1,59 @@
+# Compare the header lookups of the indexed headers with the previous linear scan.
+#
+# Usage: python benchmark/headers_bench.py [headers] [lookups]
+
+import sys
+import os
+import timeit
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(root, 'reqable'))
+
+from reqable import HttpHeaders
+
+# The lookups before the index was introduced.
+class LinearHttpHeaders(HttpHeaders):
+
+  def index(self, name: str) -> int:
+    for i in range(len(self._entries)):
+      if self._entries[i].lower().startswith(name.lower() + ': '):
+        return i
+    return -1
+
+  def indexes(self, name: str) -> list:
+    indexes = []
+    for i in range(len(self._entries)):
+      if self._entries[i].lower().startswith(name.lower() + ': '):
+        indexes.append(i)
+    return indexes
+
+NAMES = ['Content-Type', 'content-length', 'X-Request-Id', 'Set-Cookie', 'Missing']
+
+def entries(count: int) -> list:
+  lines = [f'X-Header-{i}: value-{i}' for i in range(count - 4)]
+  lines.insert(count // 2, 'Content-Type: application/json; charset=utf-8')
+  lines.append('Content-Length: 128')
+  lines.append('X-Request-Id: 123456')
+  lines.append('set-cookie: a=1')
+  return lines
+
+def hook(cls, lines: list, lookups: int):
+  headers = cls(list(lines))
+  for i in range(lookups):
+    name = NAMES[i % len(NAMES)]
+    headers[name]
+  headers['X-Script'] = 'reqable'
+  headers.remove('set-cookie')
+  headers['content-type']
+
+def main():
+  count = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+  lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+  lines = entries(count)
+  for name, cls in (('linear', LinearHttpHeaders), ('indexed', HttpHeaders)):
+    number = 2000
+    elapsed = min(timeit.repeat(lambda: hook(cls, lines, lookups), number=number, repeat=5))
+    print(f'{name:<8} headers={count} lookups={lookups} {elapsed / number * 1e6:8.2f}us/hook')
+
+if __name__ == '__main__':
+  main()
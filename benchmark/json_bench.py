@@ -0,0 +1,55 @@
+# Compare the installed JSON codec backends on the capture payloads: decoding a capture file,
+# jsonifying its body and encoding the result frame.
+#
+# Usage: python benchmark/json_bench.py [iterations]
+
+import sys
+import os
+import json
+import timeit
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(root, 'reqable'))
+
+from reqable import JsonCodec
+
+def capture(users: int) -> bytes:
+  with open(os.path.join(root, 'test', 'data', 'capture_request.json'), 'r', encoding='UTF-8') as content:
+    data = json.load(content)
+  body = json.dumps({
+    'page': 1,
+    'users': [{
+      'id': 10000000 + i,
+      'name': f'用户 {i}',
+      'email': f'user{i}@reqable.com',
+      'score': i * 0.25,
+      'tags': ['a', 'b', 'c'],
+      'active': i % 2 == 0,
+    } for i in range(users)],
+  })
+  data['request']['headers'] += [f'x-header-{i}: value-{i}' for i in range(40)]
+  data['request']['body'] = {'type': 1, 'payload': {'text': body, 'charset': 'UTF-8'}}
+  return json.dumps(data).encode('UTF-8')
+
+def run(codec: JsonCodec, data: bytes):
+  message = codec.loads(data)
+  body = codec.loads(message['request']['body']['payload']['text'])
+  codec.dumps({'id': 1, 'result': {'request': message['request'], 'body': body}})
+
+def main():
+  iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+  for users in (1, 100, 10000):
+    data = capture(users)
+    for name in JsonCodec.backends:
+      codec = JsonCodec(name)
+      try:
+        codec.name
+      except ImportError:
+        print(f'{name:<7} not installed')
+        continue
+      number = max(1, iterations // max(1, users // 100))
+      elapsed = min(timeit.repeat(lambda: run(codec, data), number=number, repeat=3))
+      print(f'{name:<7} size={len(data):>9} {elapsed / number * 1e6:12.1f}us/message')
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,78 @@
+# Measure the serve mode throughput with different worker pool sizes.
+#
+# Usage: python benchmark/pool_bench.py [messages]
+
+import sys
+import os
+import json
+import struct
+import subprocess
+import shutil
+import tempfile
+import threading
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# A CPU heavy addon, signs the request queries and body like `test/case4/addons.py` but rounds
+# the digest many times.
+ADDONS = '''
+from reqable import *
+import hashlib
+
+def onRequest(context, request):
+  queries = sorted(request.queries)
+  text = '&'.join(['='.join(query) for query in queries]) + str(request.body)
+  signature = text.encode(encoding='UTF-8')
+  for _ in range(20000):
+    signature = hashlib.md5(signature).digest()
+  request.headers['signature'] = signature.hex()
+  return request
+
+def onResponse(context, response):
+  return response
+'''
+
+def frame(job: dict) -> bytes:
+  payload = json.dumps(job).encode('UTF-8')
+  return struct.pack('>I', len(payload)) + payload
+
+def run(directory: str, workers: int, messages: int) -> float:
+  with open(os.path.join(root, 'test', 'data', 'capture_request.json'), 'r', encoding='UTF-8') as content:
+    data = json.load(content)
+  jobs = bytearray()
+  for i in range(messages):
+    data['context']['id'] = i
+    jobs += frame({'id': i, 'type': 'request', 'data': data})
+  env = dict(os.environ, PYTHONPATH=os.path.join(root, 'reqable'))
+  process = subprocess.Popen([sys.executable, os.path.join(directory, 'main.py'), 'serve', '--workers', str(workers)],
+    stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env)
+  # Wait the workers to be ready.
+  time.sleep(0.5)
+  start = time.perf_counter()
+  writer = threading.Thread(target=lambda: (process.stdin.write(jobs), process.stdin.close()))
+  writer.start()
+  received = 0
+  while received < messages:
+    header = process.stdout.read(4)
+    process.stdout.read(struct.unpack('>I', header)[0])
+    received += 1
+  elapsed = time.perf_counter() - start
+  writer.join()
+  process.wait()
+  return messages / elapsed
+
+def main():
+  messages = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+  with tempfile.TemporaryDirectory() as directory:
+    # Copy rather than link, the script directory is resolved to the link target.
+    shutil.copy(os.path.join(root, 'reqable', 'main.py'), directory)
+    with open(os.path.join(directory, 'addons.py'), 'w', encoding='UTF-8') as file:
+      file.write(ADDONS)
+    workers = 1
+    while workers <= max(2, os.cpu_count() or 1):
+      print(f'workers={workers:<3} {run(directory, workers, messages):10.1f} msg/s')
+      workers *= 2
+
+if __name__ == '__main__':
+  main()
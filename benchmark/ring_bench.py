@@ -0,0 +1,129 @@
+# A local stand-in of the host for the persistent serve mode, compare the round trip latency of
+# the body transports: the JSON frames with the body files, the binary frames with the inline
+# bodies and the binary frames with the shared memory ring buffer.
+#
+# Usage: python benchmark/ring_bench.py [messages] [body size in MB]
+#
+# Run with `REQABLE_CALLBACK=delta` to leave the unchanged bodies out of the results.
+
+import sys
+import os
+import json
+import statistics
+import struct
+import subprocess
+import tempfile
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+script = os.path.join(root, 'reqable', 'main.py')
+sys.path.append(os.path.join(root, 'reqable'))
+
+from reqable import BinaryCodec, RingBuffer
+
+class Host:
+  def __init__(self, protocol: str, directory: str, capacity: int):
+    self.protocol = protocol
+    self.directory = directory
+    options = ['--protocol', 'json' if protocol == 'json' else 'binary']
+    self.rings = None
+    if protocol == 'ring':
+      # The ring file is created by the host, in the memory file system if available.
+      base = '/dev/shm' if os.path.isdir('/dev/shm') else directory
+      self.path = os.path.join(base, f'reqable-ring-{os.getpid()}')
+      self.rings = RingBuffer.open(self.path, capacity)
+      options += ['--ring', self.path]
+    self.process = subprocess.Popen([sys.executable, script, 'serve'] + options,
+      stdin=subprocess.PIPE, stdout=subprocess.PIPE, cwd=directory)
+
+  def close(self):
+    self.process.stdin.close()
+    self.process.wait()
+    if self.rings is not None:
+      os.remove(self.path)
+
+  # Encode the frame with the length header.
+  def _encode(self, frame: dict) -> bytes:
+    if self.protocol == 'json':
+      payload = json.dumps(frame).encode('UTF-8')
+      return struct.pack('>I', len(payload)) + payload
+    buffer = bytearray(4)
+    BinaryCodec.encodeInto(buffer, frame)
+    struct.pack_into('>I', buffer, 0, len(buffer) - 4)
+    return buffer
+
+  def _decode(self, payload: bytes) -> dict:
+    if self.protocol == 'json':
+      return json.loads(payload)
+    return BinaryCodec.decode(payload)
+
+  # Send the request with the body, returns the size of the body in the result.
+  def send(self, id: int, data: dict, body: bytes) -> int:
+    if self.protocol == 'json':
+      path = os.path.join(self.directory, f'body-{id}')
+      with open(path, 'wb') as file:
+        file.write(body)
+      payload = path
+    elif self.protocol == 'ring':
+      region = self.rings[0].write(body)
+      payload = body if region is None else {'offset': region[0], 'length': region[1]}
+    else:
+      payload = body
+    data['request']['body'] = {'type': 2, 'payload': payload}
+    self.process.stdin.write(self._encode({'id': id, 'type': 'request', 'data': data}))
+    self.process.stdin.flush()
+    size = struct.unpack('>I', self.process.stdout.read(4))[0]
+    result = self._decode(self.process.stdout.read(size))['result']['request'].get('body')
+    if result is None:
+      # The unchanged body is omitted with `REQABLE_CALLBACK=delta`.
+      if self.protocol == 'json':
+        os.remove(path)
+      return len(body)
+    result = result['payload']
+    if self.protocol == 'json':
+      # Read the body file back, it is the same file if the body is not changed.
+      with open(result, 'rb') as file:
+        size = len(file.read())
+      os.remove(path)
+      if result != path:
+        os.remove(result)
+      return size
+    if isinstance(result, dict):
+      if result['offset'] < RingBuffer.headerSize + self.rings[0].capacity:
+        # The unchanged body is passed through as the job region.
+        return len(body)
+      size = len(self.rings[1].region(result['offset'], result['length']))
+      self.rings[1].release(result['offset'])
+      return size
+    return len(result)
+
+def report(name: str, latencies: list):
+  latencies = sorted(latencies)
+  p50 = latencies[len(latencies) // 2]
+  p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+  print(f'{name:<8} mean={statistics.mean(latencies):8.3f}ms p50={p50:8.3f}ms p99={p99:8.3f}ms')
+
+def main():
+  messages = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+  size = int(float(sys.argv[2] if len(sys.argv) > 2 else 4) * 1024 * 1024)
+  body = os.urandom(size)
+  with open(os.path.join(root, 'test', 'data', 'capture_request.json'), 'r', encoding='UTF-8') as content:
+    data = json.load(content)
+  for protocol in ('json', 'binary', 'ring'):
+    with tempfile.TemporaryDirectory() as directory:
+      host = Host(protocol, directory, 4 * size)
+      latencies = []
+      try:
+        # The first round trip waits for the process boot, don't count it.
+        for i in range(messages + 1):
+          start = time.perf_counter()
+          if host.send(i, data, body) != size:
+            raise Exception('Unexpected result body size')
+          if i > 0:
+            latencies.append((time.perf_counter() - start) * 1000)
+      finally:
+        host.close()
+      report(protocol, latencies)
+
+if __name__ == '__main__':
+  main()
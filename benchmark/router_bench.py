@@ -0,0 +1,64 @@
+# Compare the route dispatch of the compiled `Router` with the linear if/elif chain of the host and
+# path checks which are evaluated in order, at 1k and 10k routes.
+#
+# Usage: python benchmark/router_bench.py [lookups]
+
+import sys
+import os
+import random
+import re
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(root, 'reqable'))
+
+from reqable import Router
+
+# The route i is `*.service{i}.example.com` with the path `/v1/resource{i % 50}/*`.
+def routes(count: int) -> list:
+  return [(f'*.service{i}.example.com', f'/v1/resource{i % 50}/*', 'POST' if i % 2 else 'GET') for i in range(count)]
+
+# The same routes checked one by one like the hand written chain.
+def linear(routes: list):
+  compiled = []
+  for i, (host, path, method) in enumerate(routes):
+    hostPattern = re.compile('.*' + re.escape(host[1:]) + r'\Z', re.IGNORECASE)
+    pathPattern = re.compile(re.escape(path[:-1]) + r'[^/]+\Z')
+    compiled.append((hostPattern, pathPattern, method, i))
+  def match(host: str, method: str, path: str):
+    for hostPattern, pathPattern, routeMethod, handler in compiled:
+      if routeMethod == method and hostPattern.match(host) and pathPattern.match(path):
+        return handler
+    return None
+  return match
+
+def lookups(count: int, routes: int) -> list:
+  generator = random.Random(0)
+  items = []
+  for _ in range(count):
+    i = generator.randrange(routes)
+    items.append((f'api.service{i}.example.com', 'POST' if i % 2 else 'GET', f'/v1/resource{i % 50}/{i}'))
+  return items
+
+def measure(match, items: list) -> float:
+  start = time.perf_counter()
+  for host, method, path in items:
+    if match(host, method, path) is None:
+      raise Exception('The route is not matched')
+  return (time.perf_counter() - start) / len(items) * 1e6
+
+def main():
+  count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+  for size in (1000, 10000):
+    table = routes(size)
+    router = Router()
+    start = time.perf_counter()
+    for i, (host, path, method) in enumerate(table):
+      router.add(lambda context, message, i = i: i, host, path, method)
+    build = (time.perf_counter() - start) * 1000
+    items = lookups(count, size)
+    print(f'{size:>6} routes: router {measure(router.match, items):8.2f}us/lookup (built in {build:.1f}ms), '
+      f'linear {measure(linear(table), items):8.2f}us/lookup')
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,66 @@
+# Compare the per-message latency of the spawn-per-message model with the zygote and the
+# persistent serve modes.
+#
+# Usage: python benchmark/zygote_bench.py [messages]
+
+import sys
+import os
+import json
+import shutil
+import statistics
+import struct
+import subprocess
+import tempfile
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+script = os.path.join(root, 'reqable', 'main.py')
+
+def frame(job: dict) -> bytes:
+  payload = json.dumps(job).encode('UTF-8')
+  return struct.pack('>I', len(payload)) + payload
+
+def report(name: str, latencies: list):
+  latencies = sorted(latencies)
+  p50 = latencies[len(latencies) // 2]
+  p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+  print(f'{name:<10} mean={statistics.mean(latencies):8.3f}ms p50={p50:8.3f}ms p99={p99:8.3f}ms')
+
+def spawn(path: str, messages: int) -> list:
+  latencies = []
+  for _ in range(messages):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, script, 'request', path], check=True)
+    latencies.append((time.perf_counter() - start) * 1000)
+  return latencies
+
+def serve(path: str, messages: int, options: list) -> list:
+  with open(path, 'r', encoding='UTF-8') as content:
+    job = frame({'id': 0, 'type': 'request', 'data': json.load(content)})
+  process = subprocess.Popen([sys.executable, script, 'serve'] + options,
+    stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+  latencies = []
+  # The first round trip waits for the process boot, don't count it.
+  for i in range(messages + 1):
+    start = time.perf_counter()
+    process.stdin.write(job)
+    process.stdin.flush()
+    header = process.stdout.read(4)
+    process.stdout.read(struct.unpack('>I', header)[0])
+    if i > 0:
+      latencies.append((time.perf_counter() - start) * 1000)
+  process.stdin.close()
+  process.wait()
+  return latencies
+
+def main():
+  messages = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+  with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, 'request.json')
+    shutil.copy(os.path.join(root, 'test', 'data', 'capture_request.json'), path)
+    report('spawn', spawn(path, messages))
+    report('zygote', serve(path, messages, ['--zygote']))
+    report('serve', serve(path, messages, []))
+
+if __name__ == '__main__':
+  main()
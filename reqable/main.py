@@ -6,13 +6,42 @@ if pwd not in sys.path:
   sys.path.append(pwd)
 
 import json
-from reqable import CaptureContext, CaptureHttpRequest, CaptureHttpResponse
+import struct
+from collections import deque
+from time import perf_counter_ns
+from json.encoder import encode_basestring_ascii
+from reqable import CaptureContext, CaptureHttpRequest, CaptureHttpResponse, AddonManifest, BinaryCodec, \
+  RingBuffer, jsonCodec
 import addons
 
+# Usage:
+#   python main.py request <file> [--profile cprofile | tracemalloc]
+#   python main.py response <file> [--profile cprofile | tracemalloc]
+#   python main.py serve [--socket <path>] [--workers <count> | --zygote] [--protocol json | binary]
+#     [--ring <file>] [--profile cprofile | tracemalloc] [--profile-sample <n>]
+#   python main.py batch <directory | glob | jsonl> [--output <jsonl>]
+#     [--profile cprofile | tracemalloc] [--profile-sample <n>]
+#   python main.py manifest
 def main():
   argv = sys.argv[1:]
-  if len(argv) != 2:
+  if len(argv) == 1 and argv[0] == 'manifest':
+    # Print the addon manifest for the host, null if the addon doesn't declare it.
+    print('null' if manifest is None else manifest.toJson())
+    return
+  if len(argv) >= 1 and argv[0] == 'serve':
+    serve(argv[1:])
+    return
+  if len(argv) >= 1 and argv[0] == 'batch':
+    batch(argv[1:])
+    return
+  if len(argv) < 2:
     raise Exception('Invalid reqable script arguments')
+  _useProfile(_parseOptions(argv[2:], {
+    '--profile': None,
+  }))
+  # The import of the accelerated JSON codecs costs more than they save for a single message.
+  if not os.environ.get('REQABLE_JSON_CODEC'):
+    jsonCodec.use('json')
   type = argv[0]
   if type == 'request':
     onRequest(argv[1])
@@ -22,34 +51,1138 @@ def main():
     raise Exception('Unexpected type ' + type)
 
 def onRequest(request):
-  with open(request, 'r', encoding='UTF-8') as content:
-    data = json.load(content)
-    context = CaptureContext(data['context'])
-    result = addons.onRequest(context, CaptureHttpRequest(data['request']))
-    if result is not None:
-      with open(request + '.cb', 'w', encoding='UTF-8') as callback:
-        callback.write(json.dumps({
-          'request': result.serialize(),
-          'env': context.env,
-          'highlight': context.highlight,
-          'comment': context.comment,
-          'shared': context.shared,
-        }))
+  _onMessage(request, handleRequest)
 
 def onResponse(response):
-  with open(response, 'r', encoding='UTF-8') as content:
-    data = json.load(content)
-    context = CaptureContext(data['context'])
-    result = addons.onResponse(context, CaptureHttpResponse(data['response']))
-    if result is not None:
-      with open(response + '.cb', 'w', encoding='UTF-8') as callback:
-        callback.write(json.dumps({
-          'response': result.serialize(),
-          'env': context.env,
-          'highlight': context.highlight,
-          'comment': context.comment,
-          'shared': context.shared,
-        }))
+  _onMessage(response, handleResponse)
+
+# Process the message file with the handler and write the callback file.
+def _onMessage(path: str, handler):
+  timing = {} if timingMode is not None else None
+  start = perf_counter_ns() if timing is not None else 0
+  with open(path, 'rb') as content:
+    data = jsonCodec.loadsLazy(content.read())
+  if timing is not None:
+    _lap(timing, 'read', start)
+  callback = _profile(path, lambda: handler(data, timing))
+  _writeCallbackTiming(path, callback, timing)
+
+# Write the callback file, and report the timing of the message if it is not None.
+def _writeCallbackTiming(path: str, callback, timing: dict):
+  if timing is None:
+    _writeCallback(path, callback)
+    return
+  if timingMode == 'callback' and callback is not None:
+    callback['timing'] = timing
+  start = perf_counter_ns()
+  _writeCallback(path, callback)
+  if timingMode == 'file':
+    _lap(timing, 'write', start)
+    with open(path + '.timing', 'w', encoding='UTF-8') as file:
+      json.dump(timing, file)
+
+def _writeCallback(path: str, callback):
+  if callback is not None:
+    with open(path + '.cb', 'w', encoding='UTF-8') as file:
+      writeJson(file, callback)
+
+# The strings longer than this are escaped and written by chunks.
+_chunkSize = 1 << 16
+
+# Write the value to the text file, the output is the same as `json.dumps(value)`. The dicts and
+# lists are written item by item and the long strings are escaped by chunks, so neither the encoded
+# callback nor the escaped body text is held in memory as a whole.
+def writeJson(file, value):
+  if isinstance(value, str):
+    if len(value) <= _chunkSize:
+      file.write(encode_basestring_ascii(value))
+      return
+    file.write('"')
+    for i in range(0, len(value), _chunkSize):
+      file.write(encode_basestring_ascii(value[i:i + _chunkSize])[1:-1])
+    file.write('"')
+  elif isinstance(value, dict) and all(isinstance(key, str) for key in value):
+    file.write('{')
+    first = True
+    for key, item in value.items():
+      if not first:
+        file.write(', ')
+      first = False
+      file.write(encode_basestring_ascii(key))
+      file.write(': ')
+      writeJson(file, item)
+    file.write('}')
+  elif isinstance(value, (list, tuple)):
+    file.write('[')
+    for i, item in enumerate(value):
+      if i > 0:
+        file.write(', ')
+      writeJson(file, item)
+    file.write(']')
+  else:
+    file.write(json.dumps(value))
+
+# Run the addon with a parsed request message, returns the callback dict or None.
+# The async hook is awaited in a new event loop.
+def handleRequest(data: dict, timing: dict = None):
+  return _handle('request', CaptureHttpRequest, data, timing)
+
+# Run the addon with a parsed response message, returns the callback dict or None.
+# The async hook is awaited in a new event loop.
+def handleResponse(data: dict, timing: dict = None):
+  return _handle('response', CaptureHttpResponse, data, timing)
+
+# Run the addon with a parsed request message in the running event loop.
+async def handleRequestAsync(data: dict, timing: dict = None):
+  return await _handleAsync('request', CaptureHttpRequest, data, timing)
+
+# Run the addon with a parsed response message in the running event loop.
+async def handleResponseAsync(data: dict, timing: dict = None):
+  return await _handleAsync('response', CaptureHttpResponse, data, timing)
+
+# Run the addon hook with the message of the name, the nanoseconds of the parse, addon and
+# serialize phases are recorded to the timing dict if it is not None. Returns None without parsing
+# the message if it is not matched by the manifest.
+def _handle(name: str, type, data: dict, timing: dict):
+  if not _matchManifest(name, data):
+    return None
+  hook = getattr(addons, _hooks[name])
+  start = perf_counter_ns() if timing is not None else 0
+  context = CaptureContext(data['context'])
+  message = type(data[name])
+  if timing is not None:
+    start = _lap(timing, 'parse', start)
+  result = hook(context, message)
+  if hasattr(result, '__await__'):
+    result = _await(result)
+  if timing is not None:
+    start = _lap(timing, 'addon', start)
+  callback = _callback(name, context, message, result)
+  if timing is not None:
+    _lap(timing, 'serialize', start)
+  return callback
+
+async def _handleAsync(name: str, type, data: dict, timing: dict):
+  if not _matchManifest(name, data):
+    return None
+  hook = getattr(addons, _hooks[name])
+  start = perf_counter_ns() if timing is not None else 0
+  context = CaptureContext(data['context'])
+  message = type(data[name])
+  if timing is not None:
+    start = _lap(timing, 'parse', start)
+  result = hook(context, message)
+  if hasattr(result, '__await__'):
+    result = await result
+  if timing is not None:
+    start = _lap(timing, 'addon', start)
+  callback = _callback(name, context, message, result)
+  if timing is not None:
+    _lap(timing, 'serialize', start)
+  return callback
+
+# The addon hook of the message name.
+_hooks = {
+  'request': 'onRequest',
+  'response': 'onResponse',
+}
+
+# The manifest of the addon, see `AddonManifest`. The messages which are not matched are returned
+# as unchanged without parsing. The bodies which are not needed are not sent by the host, they are
+# omitted from the callback unless the addon changed them.
+def _loadManifest():
+  value = getattr(addons, 'manifest', None)
+  if value is None or isinstance(value, AddonManifest):
+    return value
+  if isinstance(value, dict):
+    return AddonManifest.parse(value)
+  raise Exception('The addon manifest must be an AddonManifest or a dict')
+
+manifest = _loadManifest()
+
+# Whether the message of the name is matched by the manifest.
+def _matchManifest(name: str, data: dict) -> bool:
+  if manifest is None:
+    return True
+  request = data[name] if name == 'request' else data[name].get('request') or {}
+  return manifest.matches(_hooks[name], data['context'].get('host'), request.get('method'),
+    request.get('path'))
+
+# Remove the bodies which are not needed by the manifest from the callback fields of the message,
+# unless the addon changed them.
+def _omitBodies(name: str, message, fields: dict):
+  if manifest is None or (manifest.requestBody and manifest.responseBody):
+    return
+  # The inline delta doesn't write the changed binary bodies to files.
+  delta = message.serializeDelta(True)
+  if name == 'request':
+    if not manifest.requestBody and 'body' not in delta:
+      fields.pop('body', None)
+    return
+  if not manifest.responseBody and 'body' not in delta:
+    fields.pop('body', None)
+  if not manifest.requestBody and 'body' not in delta.get('request', {}) and 'request' in fields:
+    fields['request'].pop('body', None)
+
+# Opt-in the phase timing with the environment variable `REQABLE_TIMING`, the nanoseconds spent in
+# every phase of a message are reported: `read` (load the message), `parse` (build the context and
+# the message), `addon` (the addon hook), `serialize` (build the callback) and `write` (write the
+# callback file).
+#   REQABLE_TIMING=callback  The `timing` field of the callback, or of the result frame in the serve
+#                            mode. The write phase is not included.
+#   REQABLE_TIMING=file      The `<message file>.timing` file next to the `.cb` file. In the serve
+#                            mode and the batch mode with the JSONL output, the lines of
+#                            `reqable-timing.jsonl` in the working directory:
+#                            {"id" | "source": ..., "timing": {...}}
+timingMode = os.environ.get('REQABLE_TIMING')
+if timingMode not in ('callback', 'file'):
+  timingMode = None
+
+# Record the nanoseconds since the start as the phase, returns the current time.
+def _lap(timing: dict, phase: str, start: int) -> int:
+  now = perf_counter_ns()
+  timing[phase] = now - start
+  return now
+
+# Append the timing entry to `reqable-timing.jsonl` in the file mode.
+def _appendTiming(entry: dict):
+  with open('reqable-timing.jsonl', 'a', encoding='UTF-8') as file:
+    file.write(json.dumps(entry) + '\n')
+
+# Opt-in the profiler with the environment variable `REQABLE_PROFILE` or the `--profile` option,
+# the parse, the addon hook and the serialize of a message are profiled:
+#   cprofile     The cProfile stats in `<message file>.prof`, read by `pstats.Stats(path)`.
+#   tracemalloc  The allocation snapshot in `<message file>.tracemalloc`, read by
+#                `tracemalloc.Snapshot.load(path)`.
+# The files of the serve mode jobs and the JSONL batch lines are `reqable-<id or line>.*` in the
+# working directory. Profile 1 in N messages with `REQABLE_PROFILE_SAMPLE=N` or the
+# `--profile-sample` option, so that it can stay on in the serve mode.
+profileMode = None
+profileSample = 1
+
+# The count of the messages since the profiler is enabled.
+_profileCount = 0
+
+# Whether a message is being profiled, the profilers can't be nested by the concurrent jobs.
+_profiling = False
+
+# Enable the profiler of the mode and the sample rate, the options take precedence over the
+# environment variables.
+def _useProfile(options: dict = None):
+  global profileMode, profileSample
+  options = options or {}
+  mode = options.get('--profile') or os.environ.get('REQABLE_PROFILE') or None
+  if mode not in (None, 'cprofile', 'tracemalloc'):
+    raise Exception('Unexpected profile mode ' + mode)
+  sample = int(options.get('--profile-sample') or os.environ.get('REQABLE_PROFILE_SAMPLE') or 1)
+  if sample < 1:
+    raise Exception('Invalid profile sample ' + str(sample))
+  profileMode = mode
+  profileSample = sample
+
+_useProfile()
+
+# Whether the next message is profiled, the first one of every `profileSample` messages.
+def _sampleProfile() -> bool:
+  global _profileCount
+  if profileMode is None:
+    return False
+  _profileCount += 1
+  return not _profiling and (_profileCount - 1) % profileSample == 0
+
+# Run the call, profile it if it is sampled and dump the profile next to the path.
+def _profile(path: str, call):
+  if not _sampleProfile():
+    return call()
+  global _profiling
+  _profiling = True
+  try:
+    if profileMode == 'cprofile':
+      import cProfile
+      profiler = cProfile.Profile()
+      try:
+        return profiler.runcall(call)
+      finally:
+        profiler.dump_stats(path + '.prof')
+    import tracemalloc
+    tracemalloc.start()
+    try:
+      return call()
+    finally:
+      snapshot = tracemalloc.take_snapshot()
+      tracemalloc.stop()
+      snapshot.dump(path + '.tracemalloc')
+  finally:
+    _profiling = False
+
+# Await the awaitable, profile it if it is sampled and dump the profile next to the path. The
+# other tasks running in the meantime are profiled too.
+async def _profileAsync(path: str, awaitable):
+  if not _sampleProfile():
+    return await awaitable
+  global _profiling
+  _profiling = True
+  try:
+    if profileMode == 'cprofile':
+      import cProfile
+      profiler = cProfile.Profile()
+      profiler.enable()
+      try:
+        return await awaitable
+      finally:
+        profiler.disable()
+        profiler.dump_stats(path + '.prof')
+    import tracemalloc
+    tracemalloc.start()
+    try:
+      return await awaitable
+    finally:
+      snapshot = tracemalloc.take_snapshot()
+      tracemalloc.stop()
+      snapshot.dump(path + '.tracemalloc')
+  finally:
+    _profiling = False
+
+# Opt-in the delta callback format with the environment variable `REQABLE_CALLBACK=delta`, only
+# the changed fields are written to the callback:
+#   {"delta": true, "request": {<changed request fields>}, <changed context fields>}
+# The host applies the present fields to the original message, the omitted fields are unchanged.
+callbackDelta = os.environ.get('REQABLE_CALLBACK') == 'delta'
+
+# Build the callback dict of the addon result. The message must be the one passed to the addon
+# to use the delta format, otherwise all the fields are written.
+def _callback(name: str, context, message, result):
+  if result is None:
+    return None
+  delta = callbackDelta and result is message
+  if delta:
+    callback = {
+      'delta': True,
+      name: result.serializeDelta(binaryProtocol),
+    }
+  else:
+    callback = {
+      name: result.serialize(binaryProtocol),
+    }
+    if result is message:
+      _omitBodies(name, message, callback[name])
+  callback.update(context.serializeCallback(delta))
+  return callback
+
+def _await(awaitable):
+  import asyncio
+  loop = asyncio.new_event_loop()
+  try:
+    return loop.run_until_complete(awaitable)
+  finally:
+    loop.close()
+
+# Whether the addon hooks are declared with `async def`.
+def _isAsyncAddons() -> bool:
+  import inspect
+  return inspect.iscoroutinefunction(getattr(addons, 'onRequest', None)) or \
+    inspect.iscoroutinefunction(getattr(addons, 'onResponse', None))
+
+# Run the addon with a parsed request or response message, the type is detected from the data.
+def handleCapture(data: dict, timing: dict = None):
+  if 'response' in data:
+    return handleResponse(data, timing)
+  return handleRequest(data, timing)
+
+####################################################################################################
+# Batch mode: process the exported captures in one invocation. The captures are streamed one by
+# one, so the memory is bounded by the largest capture rather than the count of captures.
+#
+# The source can be a directory (all the `*.json` files), a glob pattern or a JSONL file (one
+# capture per line). The callbacks are written to the `.cb` files like the one-shot mode, the
+# JSONL source is written to `<source>.cb` as JSONL. The `--output` option writes all the
+# callbacks to one JSONL stream:
+#   {"source": <file path or line number>, "result": <same as the .cb file, or null>}
+#   {"source": <file path or line number>, "error": "..."}
+####################################################################################################
+
+def batch(argv):
+  if len(argv) < 1:
+    raise Exception('Invalid reqable batch arguments')
+  source = argv[0]
+  options = _parseOptions(argv[1:], {
+    '--output': None,
+    '--profile': None,
+    '--profile-sample': None,
+  })
+  _useProfile(options)
+  output = options['--output']
+  if output is None and source.endswith('.jsonl'):
+    output = source + '.cb'
+  if output is None:
+    runBatch(_captures(source), None)
+  else:
+    with open(output, 'w', encoding='UTF-8') as writer:
+      runBatch(_captures(source), writer)
+
+# Process the captures, the callbacks are written to the JSONL writer or the `.cb` files if
+# the writer is None. Returns the count of processed captures and errors.
+def runBatch(captures, writer = None) -> tuple:
+  import time
+  import traceback
+  count = 0
+  errors = 0
+  start = time.perf_counter()
+  for source, load in captures:
+    count += 1
+    timing = {} if timingMode is not None else None
+    try:
+      begin = perf_counter_ns() if timing is not None else 0
+      data = load()
+      if timing is not None:
+        _lap(timing, 'read', begin)
+      path = source if isinstance(source, str) else f'reqable-{source}'
+      callback = _profile(path, lambda: handleCapture(data, timing))
+    except Exception as e:
+      traceback.print_exc()
+      errors += 1
+      if writer is not None:
+        writer.write(json.dumps({'source': source, 'error': str(e)}) + '\n')
+      continue
+    if writer is None:
+      _writeCallbackTiming(source, callback, timing)
+      continue
+    if timingMode == 'callback' and callback is not None:
+      callback['timing'] = timing
+    begin = perf_counter_ns() if timing is not None else 0
+    writeJson(writer, {'source': source, 'result': callback})
+    writer.write('\n')
+    if timingMode == 'file':
+      _lap(timing, 'write', begin)
+      _appendTiming({'source': source, 'timing': timing})
+  elapsed = time.perf_counter() - start
+  rate = count / elapsed if elapsed > 0 else 0
+  print(f'Processed {count} messages ({errors} errors) in {elapsed:.3f}s, {rate:.1f} msg/s', file=sys.stderr)
+  return count, errors
+
+# Iterate the captures of the source, yields the source name and a function to load the capture.
+def _captures(source: str):
+  if source.endswith('.jsonl'):
+    with open(source, 'r', encoding='UTF-8') as reader:
+      number = 0
+      for line in reader:
+        number += 1
+        if line.strip():
+          yield number, lambda line = line: jsonCodec.loads(line)
+    return
+  if os.path.isdir(source):
+    paths = (entry.path for entry in os.scandir(source) if entry.is_file() and entry.name.endswith('.json'))
+  else:
+    import glob
+    paths = (path for path in glob.iglob(source)
+      if not path.endswith(('.cb', '.timing', '.prof', '.tracemalloc')) and os.path.isfile(path))
+  for path in paths:
+    yield path, lambda path = path: _loadFile(path)
+
+def _loadFile(path: str) -> dict:
+  with open(path, 'rb') as content:
+    return jsonCodec.loadsLazy(content.read())
+
+####################################################################################################
+# Serve mode: keep the interpreter and addons alive across many messages.
+#
+# Every frame is a 4 bytes big-endian length followed by an UTF-8 JSON document.
+# Job frame:    {"id": 1, "session": 1, "type": "request" | "response", "data": <same as the message file>}
+# Result frame: {"id": 1, "result": <same as the .cb file, or null>}
+#          or:  {"id": 1, "error": "..."}
+#
+# The optional `session` is the session id (`context.id`) of the message. When `id` and `session`
+# come before `data`, the worker pool routes the job without decoding the message.
+#
+# With `--protocol binary` the documents are encoded by `BinaryCodec` instead of JSON, and the
+# binary bodies are carried as raw bytes in the payload rather than the paths of temp files.
+#
+# With `--ring <file>` the binary bodies are exchanged in the shared memory `RingBuffer` file
+# created by the host, the body payloads in the frames are the regions of the rings:
+#   {"type": 2, "payload": {"offset": <file offset>, "length": <bytes>}}
+# The job regions are released after the result frame is written. The result regions are written
+# to the second ring, or carried in the frame if the ring is full.
+####################################################################################################
+
+_frameHeader = struct.Struct('>I')
+
+# Whether the frames are encoded by `BinaryCodec`, see `serve --protocol`.
+binaryProtocol = False
+
+# The job and result rings of the bodies, see `serve --ring`.
+ringBuffers = None
+
+# The job regions to release after the result frame is written, keyed by the job id.
+_ringRegions = {}
+
+# Decode the frame payload with the protocol codec.
+def _decodeFrame(payload: bytes) -> dict:
+  if binaryProtocol:
+    return BinaryCodec.decode(payload)
+  return jsonCodec.loadsLazy(payload)
+
+# The leading scalar fields of a JSON frame.
+_jsonField = None
+
+# Decode only the named fields of the frame payload, the missing names are not in the returned
+# dict. The JSON fields are only read until the first non-scalar value, so the names should come
+# before the message.
+def _peekFrame(payload: memoryview, names: tuple) -> dict:
+  if binaryProtocol:
+    return BinaryCodec.peek(payload, names)
+  global _jsonField
+  if _jsonField is None:
+    import re
+    _jsonField = re.compile(rb'\s*[{,]\s*"([^"\\]*)"\s*:\s*'
+      rb'(-?\d+|"(?:[^"\\]|\\.)*"|null|true|false)\s*(?=[,}])')
+  keys = set(name.encode('UTF-8') for name in names)
+  fields = {}
+  offset = 0
+  while len(fields) < len(keys):
+    match = _jsonField.match(payload, offset)
+    if match is None:
+      break
+    if match.group(1) in keys:
+      fields[match.group(1).decode('UTF-8')] = json.loads(match.group(2))
+    offset = match.end()
+  return fields
+
+# Yield the body dicts of the message, including the request of the response and the parts of
+# the multipart bodies.
+def _bodies(message):
+  if not isinstance(message, dict):
+    return
+  for name in ('request', 'response'):
+    yield from _bodies(message.get(name))
+  body = message.get('body')
+  if isinstance(body, dict):
+    yield body
+    if isinstance(body.get('payload'), list):
+      for part in body['payload']:
+        yield from _bodies(part)
+
+# Replace the job body regions with the memoryviews of the job ring.
+def _loadRegions(job: dict):
+  regions = []
+  for body in _bodies(job.get('data')):
+    payload = body.get('payload')
+    if body.get('type') == 2 and isinstance(payload, dict):
+      body['payload'] = ringBuffers[0].region(payload['offset'], payload['length'])
+      regions.append((body['payload'], payload))
+  if regions:
+    _ringRegions.setdefault(job.get('id'), []).extend(regions)
+
+# Move the binary result bodies to the result ring, returns the job regions to release. The
+# unchanged job bodies are passed through as their job regions instead of being copied.
+def _storeRegions(frame: dict) -> list:
+  regions = _ringRegions.pop(frame.get('id'), [])
+  for body in _bodies(frame.get('result')):
+    payload = body.get('payload')
+    if body.get('type') == 2 and isinstance(payload, (bytes, bytearray, memoryview)):
+      source = next((region for view, region in regions if view is payload), None)
+      if source is not None:
+        body['payload'] = source
+        continue
+      region = ringBuffers[1].write(payload)
+      if region is not None:
+        body['payload'] = {'offset': region[0], 'length': region[1]}
+  return [region['offset'] for _, region in regions]
+
+# The frame which can't be decoded, an error frame is written for it and the next frames are still
+# processed.
+class FrameError(Exception):
+  def __init__(self, id, message: str):
+    super().__init__(message)
+    self.id = id
+
+# The id of the frame which can't be decoded, or None if it can't be found.
+def _frameId(payload: memoryview):
+  try:
+    return _peekFrame(payload, ('id', )).get('id')
+  except Exception:
+    return None
+
+# Decode the job frame payload, raises `FrameError` if it's not a valid frame.
+def _decodeJob(payload: bytes) -> dict:
+  try:
+    job = _decodeFrame(payload)
+  except Exception as e:
+    raise FrameError(_frameId(memoryview(payload)), f'Invalid frame: {e}')
+  if not isinstance(job, dict):
+    raise FrameError(None, 'Invalid frame: the frame must be an object')
+  return job
+
+# Read a frame from the binary stream, returns None at the end of stream. Raises `FrameError` if
+# the frame can't be decoded, the stream is still at the next frame.
+def readFrame(reader):
+  header = reader.read(_frameHeader.size)
+  if len(header) < _frameHeader.size:
+    return None
+  size = _frameHeader.unpack(header)[0]
+  payload = reader.read(size)
+  if len(payload) < size:
+    return None
+  frame = _decodeJob(payload)
+  if ringBuffers is not None:
+    _loadRegions(frame)
+  return frame
+
+# Encode a frame to bytes. The binary frames are encoded behind the reserved header in one buffer,
+# the body is copied only once.
+def encodeFrame(frame: dict) -> bytes:
+  regions = _storeRegions(frame) if ringBuffers is not None else []
+  if binaryProtocol:
+    buffer = bytearray(_frameHeader.size)
+    BinaryCodec.encodeInto(buffer, frame)
+    _frameHeader.pack_into(buffer, 0, len(buffer) - _frameHeader.size)
+  else:
+    payload = jsonCodec.dumps(frame)
+    buffer = _frameHeader.pack(len(payload)) + payload
+  # The result may still refer to the job regions until it is encoded.
+  for offset in regions:
+    ringBuffers[0].release(offset)
+  return buffer
+
+# Write a frame to the binary stream.
+def writeFrame(writer, frame: dict):
+  writer.write(encodeFrame(frame))
+  writer.flush()
+
+# Process a job frame and returns the result frame.
+def handleJob(job: dict) -> dict:
+  timing = {} if timingMode is not None else None
+  try:
+    type = job.get('type')
+    path = f'reqable-{job.get("id")}'
+    if type == 'request':
+      result = _profile(path, lambda: handleRequest(job['data'], timing))
+    elif type == 'response':
+      result = _profile(path, lambda: handleResponse(job['data'], timing))
+    else:
+      raise Exception('Unexpected type ' + str(type))
+    return _resultFrame(job, result, timing)
+  except Exception as e:
+    return _errorFrame(job, e)
+
+# Process a job frame in the running event loop and returns the result frame.
+async def handleJobAsync(job: dict) -> dict:
+  timing = {} if timingMode is not None else None
+  try:
+    type = job.get('type')
+    path = f'reqable-{job.get("id")}'
+    if type == 'request':
+      result = await _profileAsync(path, handleRequestAsync(job['data'], timing))
+    elif type == 'response':
+      result = await _profileAsync(path, handleResponseAsync(job['data'], timing))
+    else:
+      raise Exception('Unexpected type ' + str(type))
+    return _resultFrame(job, result, timing)
+  except Exception as e:
+    return _errorFrame(job, e)
+
+def _resultFrame(job: dict, result, timing: dict = None) -> dict:
+  frame = {
+    'id': job.get('id'),
+    'result': result,
+  }
+  if timingMode == 'callback' and timing is not None:
+    frame['timing'] = timing
+  elif timingMode == 'file' and timing is not None:
+    _appendTiming({'id': job.get('id'), 'timing': timing})
+  return frame
+
+def _errorFrame(job: dict, error: Exception) -> dict:
+  import traceback
+  traceback.print_exc()
+  return {
+    'id': job.get('id'),
+    'error': str(error),
+  }
+
+# The session of the job, the jobs of a session must be processed in order.
+def _session(job: dict):
+  if 'session' in job:
+    return job['session']
+  try:
+    return job['data']['context']['id']
+  except (KeyError, TypeError):
+    return job.get('id')
+
+# Split the frames from a byte stream which is read in arbitrary chunks.
+class FrameBuffer:
+  def __init__(self):
+    self._buffer = bytearray()
+
+  # Feed the received bytes, returns the complete frames (including the length header).
+  def feed(self, data: bytes) -> list:
+    self._buffer += data
+    frames = []
+    offset = 0
+    while len(self._buffer) - offset >= _frameHeader.size:
+      size = _frameHeader.size + _frameHeader.unpack_from(self._buffer, offset)[0]
+      if len(self._buffer) - offset < size:
+        break
+      frames.append(bytes(self._buffer[offset:offset + size]))
+      offset += size
+    if offset > 0:
+      del self._buffer[:offset]
+    return frames
+
+# Process jobs from the reader until the end of stream.
+def serveChannel(reader, writer):
+  while True:
+    try:
+      job = readFrame(reader)
+    except FrameError as e:
+      writeFrame(writer, _errorFrame({'id': e.id}, e))
+      continue
+    if job is None:
+      break
+    writeFrame(writer, handleJob(job))
+
+# Process jobs from the reader until the end of stream, the async hooks of many jobs run at once
+# in one event loop. The results are written once they are done, so they may be out of order,
+# but the jobs of a session are still processed one by one.
+def serveChannelAsync(reader, writer):
+  import asyncio
+  from concurrent.futures import ThreadPoolExecutor
+  loop = asyncio.new_event_loop()
+  executor = ThreadPoolExecutor(1)
+  try:
+    loop.run_until_complete(_serveChannelAsync(loop, executor, reader, writer))
+  finally:
+    executor.shutdown()
+    loop.close()
+
+async def _serveChannelAsync(loop, executor, reader, writer):
+  import asyncio
+  sessions = {}
+  tasks = set()
+  while True:
+    # The blocking reads are done in another thread to keep the loop running.
+    try:
+      job = await loop.run_in_executor(executor, readFrame, reader)
+    except FrameError as e:
+      writeFrame(writer, _errorFrame({'id': e.id}, e))
+      continue
+    if job is None:
+      break
+    session = _session(job)
+    task = loop.create_task(_runJobAsync(job, sessions.get(session), writer))
+    sessions[session] = task
+    tasks.add(task)
+    task.add_done_callback(lambda task, session = session: _doneJobAsync(task, session, sessions, tasks))
+  if tasks:
+    await asyncio.wait(list(tasks))
+
+async def _runJobAsync(job: dict, previous, writer):
+  import asyncio
+  if previous is not None:
+    await asyncio.wait([previous])
+  writeFrame(writer, await handleJobAsync(job))
+
+def _doneJobAsync(task, session, sessions: dict, tasks: set):
+  tasks.discard(task)
+  if sessions.get(session) is task:
+    del sessions[session]
+
+def serve(argv):
+  options = _parseOptions(argv, {
+    '--socket': None,
+    '--workers': '1',
+    '--zygote': False,
+    '--protocol': 'json',
+    '--ring': None,
+    '--profile': None,
+    '--profile-sample': None,
+  })
+  _useProfile(options)
+  if options['--protocol'] not in ('json', 'binary'):
+    raise Exception('Unexpected protocol ' + options['--protocol'])
+  global binaryProtocol, ringBuffers
+  binaryProtocol = options['--protocol'] == 'binary'
+  workers = int(options['--workers'])
+  if options['--ring'] is not None:
+    if not binaryProtocol:
+      raise Exception('The ring buffer requires the binary protocol')
+    if workers > 1 or options['--zygote']:
+      raise Exception('The ring buffer can not be used with workers or the zygote mode')
+    ringBuffers = RingBuffer.open(options['--ring'])
+  reader = writer = None
+  if options['--socket'] is None:
+    reader = sys.stdin.buffer
+    writer = sys.stdout.buffer
+    # The stdout is used by frames, redirect the addon prints to stderr before the workers are
+    # forked, so the workers inherit the redirection.
+    sys.stdout = sys.stderr
+  pool = None
+  if options['--zygote']:
+    if workers > 1:
+      raise Exception('The zygote mode can not be used with workers')
+    _preload()
+    handler = serveZygote
+  elif workers > 1:
+    pool = WorkerPool(workers)
+    pool.start()
+    handler = lambda reader, writer: pool.serve(reader.fileno(), writer)
+  else:
+    handler = _channel()
+  try:
+    if options['--socket'] is None:
+      handler(reader, writer)
+    else:
+      serveSocket(options['--socket'], handler)
+  finally:
+    if pool is not None:
+      pool.close()
+
+# Parse the `--name value` options and the `--name` flags (default to False), unknown options
+# are not allowed.
+def _parseOptions(argv: list, defaults: dict) -> dict:
+  options = dict(defaults)
+  i = 0
+  while i < len(argv):
+    name = argv[i]
+    if name not in options:
+      raise Exception('Unexpected option ' + name)
+    if defaults[name] is False:
+      options[name] = True
+      i += 1
+    elif i + 1 < len(argv):
+      options[name] = argv[i + 1]
+      i += 2
+    else:
+      raise Exception('Missing value of option ' + name)
+  return options
+
+# The channel handler for the addon hooks.
+def _channel():
+  return serveChannelAsync if _isAsyncAddons() else serveChannel
+
+# Accept connections from the unix socket, the connections are served one by one.
+def serveSocket(path: str, handler = serveChannel):
+  import socket
+  _removeSocket(path)
+  server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  try:
+    server.bind(path)
+    server.listen(1)
+    while True:
+      connection, _ = server.accept()
+      with connection:
+        reader = connection.makefile('rb')
+        writer = connection.makefile('wb')
+        try:
+          handler(reader, writer)
+        finally:
+          reader.close()
+          writer.close()
+  finally:
+    server.close()
+    _removeSocket(path)
+
+# Remove the stale socket file of the path, any other file at the path is never removed.
+def _removeSocket(path: str):
+  import stat
+  try:
+    mode = os.stat(path).st_mode
+  except FileNotFoundError:
+    return
+  if not stat.S_ISSOCK(mode):
+    raise Exception(f'The socket path {path} exists and is not a socket')
+  os.remove(path)
+
+####################################################################################################
+# Zygote mode: import everything once, then fork a fresh process for every job. The addons can't
+# leak states between the messages, but the interpreter boot and the imports are only paid once.
+####################################################################################################
+
+# Import the modules used while processing the messages, so that the forked processes don't
+# need to import them again.
+def _preload():
+  import urllib.parse
+  import uuid
+  import traceback
+  # Import the JSON codec backend.
+  jsonCodec.name
+
+# Process every job from the reader in a forked process until the end of stream.
+def serveZygote(reader, writer):
+  if not hasattr(os, 'fork'):
+    raise Exception('Zygote mode is not supported on this platform')
+  while True:
+    try:
+      job = readFrame(reader)
+    except FrameError as e:
+      writeFrame(writer, _errorFrame({'id': e.id}, e))
+      continue
+    if job is None:
+      break
+    writer.write(_forkJob(job))
+    writer.flush()
+    # Count the message which is sampled in the forked process.
+    _sampleProfile()
+
+# Process the job in a forked process, returns the result frame bytes.
+def _forkJob(job: dict) -> bytes:
+  read, write = os.pipe()
+  sys.stdout.flush()
+  sys.stderr.flush()
+  pid = os.fork()
+  if pid == 0:
+    code = 0
+    try:
+      os.close(read)
+      with os.fdopen(write, 'wb') as writer:
+        writeFrame(writer, handleJob(job))
+    except BaseException:
+      import traceback
+      traceback.print_exc()
+      code = 1
+    finally:
+      sys.stdout.flush()
+      sys.stderr.flush()
+      os._exit(code)
+  os.close(write)
+  buffer = FrameBuffer()
+  frames = []
+  with os.fdopen(read, 'rb') as reader:
+    while True:
+      data = reader.read(65536)
+      if not data:
+        break
+      frames += buffer.feed(data)
+  os.waitpid(pid, 0)
+  if len(frames) == 1:
+    return frames[0]
+  return encodeFrame({
+    'id': job.get('id'),
+    'error': 'Reqable script process exited unexpectedly',
+  })
+
+####################################################################################################
+# Worker pool: pre-fork the workers after `reqable` and `addons` are imported, so every worker
+# runs the addon hooks in its own interpreter and the CPU heavy addons can use all the cores.
+#
+# The jobs are routed by the session id (`context.id`), all the messages of a session are always
+# processed by the same worker, so the request and response of a session are kept in order.
+####################################################################################################
+
+class _Worker:
+  def __init__(self):
+    self.pid = 0
+    self.jobs = -1
+    self.results = -1
+    self.buffer = FrameBuffer()
+    # The pending job ids.
+    self.pending = deque()
+    self.outgoing = bytearray()
+    # Whether the worker is waiting to be writable.
+    self.waiting = False
+
+class WorkerPool:
+  def __init__(self, size: int):
+    if not hasattr(os, 'fork'):
+      raise Exception('Worker pool is not supported on this platform')
+    if size < 1:
+      raise Exception('Worker pool size must be a positive integer')
+    self._workers = [_Worker() for _ in range(size)]
+    self._selector = None
+    # The async workers may return the results out of order.
+    self._ordered = not _isAsyncAddons()
+
+  # Get the worker process ids.
+  @property
+  def pids(self) -> list:
+    return [worker.pid for worker in self._workers]
+
+  # Fork all the workers.
+  def start(self):
+    import selectors
+    self._selector = selectors.DefaultSelector()
+    for worker in self._workers:
+      self._fork(worker)
+
+  # Stop all the workers and wait for them to exit.
+  def close(self):
+    for worker in self._workers:
+      self._release(worker)
+    if self._selector is not None:
+      self._selector.close()
+      self._selector = None
+
+  # Dispatch the jobs read from the file descriptor until the end of stream, the results are
+  # written to the writer as soon as they are available.
+  def serve(self, fd: int, writer):
+    import selectors
+    selector = self._selector
+    selector.register(fd, selectors.EVENT_READ, None)
+    buffer = FrameBuffer()
+    reading = True
+    try:
+      while reading or any(worker.pending for worker in self._workers):
+        for key, _ in selector.select():
+          if key.data is None:
+            data = self._read(fd)
+            if data is None:
+              continue
+            if not data:
+              selector.unregister(fd)
+              reading = False
+              continue
+            for frame in buffer.feed(data):
+              self._dispatch(frame, writer)
+            continue
+          role, worker = key.data
+          if key.fd != (worker.results if role == 'results' else worker.jobs):
+            # The worker has been replaced during this round.
+            continue
+          if role == 'jobs':
+            self._flush(worker, writer)
+            continue
+          data = self._read(worker.results)
+          if data is None:
+            continue
+          if not data:
+            self._crash(worker, writer)
+            continue
+          for frame in worker.buffer.feed(data):
+            if self._ordered:
+              worker.pending.popleft()
+            else:
+              worker.pending.remove(self._resultId(frame))
+            writer.write(frame)
+          writer.flush()
+    finally:
+      if reading:
+        selector.unregister(fd)
+
+  # Read the available bytes, returns None if nothing is available yet and empty at the end.
+  def _read(self, fd: int) -> bytes:
+    try:
+      return os.read(fd, 65536)
+    except BlockingIOError:
+      return None
+    except OSError:
+      return b''
+
+  # Route the job frame by the top level `id` and `session`, the job is only decoded if they are
+  # not found before the message.
+  def _dispatch(self, frame: bytes, writer):
+    payload = memoryview(frame)[_frameHeader.size:]
+    try:
+      fields = _peekFrame(payload, ('id', 'session'))
+      if len(fields) < 2:
+        job = _decodeJob(bytes(payload))
+        fields = {'id': job.get('id'), 'session': _session(job)}
+      worker = self._workers[hash(fields['session']) % len(self._workers)]
+    except Exception as e:
+      # The invalid frame is answered by an error frame, the other jobs go on.
+      if not isinstance(e, FrameError):
+        e = FrameError(_frameId(payload), f'Invalid frame: {e}')
+      writeFrame(writer, _errorFrame({'id': e.id}, e))
+      return
+    worker.pending.append(fields['id'])
+    worker.outgoing += frame
+    if not worker.waiting:
+      self._flush(worker, writer)
+
+  # The id of the result frame, the workers always encode it as the first field.
+  def _resultId(self, frame: bytes):
+    payload = memoryview(frame)[_frameHeader.size:]
+    fields = _peekFrame(payload, ('id', ))
+    if not fields:
+      return _decodeFrame(bytes(payload)).get('id')
+    return fields['id']
+
+  # Write the queued jobs to the worker without blocking, the rest will be written when the
+  # worker is writable again.
+  def _flush(self, worker: _Worker, writer):
+    import selectors
+    try:
+      size = os.write(worker.jobs, worker.outgoing)
+    except BlockingIOError:
+      size = 0
+    except OSError:
+      self._crash(worker, writer)
+      return
+    del worker.outgoing[:size]
+    if worker.outgoing and not worker.waiting:
+      self._selector.register(worker.jobs, selectors.EVENT_WRITE, ('jobs', worker))
+      worker.waiting = True
+    elif not worker.outgoing and worker.waiting:
+      self._selector.unregister(worker.jobs)
+      worker.waiting = False
+
+  # The worker exited unexpectedly, fail its pending jobs and fork a new one.
+  def _crash(self, worker: _Worker, writer):
+    pending = worker.pending
+    self._release(worker)
+    for id in pending:
+      writeFrame(writer, {
+        'id': id,
+        'error': 'Reqable script worker exited unexpectedly',
+      })
+    self._fork(worker)
+
+  def _fork(self, worker: _Worker):
+    import selectors
+    jobsRead, jobsWrite = os.pipe()
+    resultsRead, resultsWrite = os.pipe()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+      code = 0
+      try:
+        os.close(jobsWrite)
+        os.close(resultsRead)
+        # Don't hold the pipes of the other workers and the served connection.
+        fds = set(key.fd for key in self._selector.get_map().values())
+        for other in self._workers:
+          if other.pid != 0:
+            fds.add(other.jobs)
+        for fd in fds:
+          os.close(fd)
+        with os.fdopen(jobsRead, 'rb') as reader, os.fdopen(resultsWrite, 'wb') as writer:
+          _channel()(reader, writer)
+      except BaseException:
+        import traceback
+        traceback.print_exc()
+        code = 1
+      finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code)
+    os.close(jobsRead)
+    os.close(resultsWrite)
+    os.set_blocking(jobsWrite, False)
+    os.set_blocking(resultsRead, False)
+    worker.pid = pid
+    worker.jobs = jobsWrite
+    worker.results = resultsRead
+    worker.buffer = FrameBuffer()
+    worker.pending = deque()
+    worker.outgoing = bytearray()
+    worker.waiting = False
+    self._selector.register(resultsRead, selectors.EVENT_READ, ('results', worker))
+
+  def _release(self, worker: _Worker):
+    if worker.pid == 0:
+      return
+    if worker.waiting:
+      self._selector.unregister(worker.jobs)
+    self._selector.unregister(worker.results)
+    os.close(worker.jobs)
+    os.close(worker.results)
+    try:
+      os.waitpid(worker.pid, 0)
+    except ChildProcessError:
+      pass
+    worker.pid = 0
+    worker.pending = deque()
+    worker.outgoing = bytearray()
+    worker.waiting = False
 
 if __name__== '__main__':
-  main()
\ No newline at end of file
+  main()
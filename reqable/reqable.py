@@ -1,7 +1,7 @@
 import json
-import uuid
 import os
-from email.message import EmailMessage
+import struct
+from collections import deque
 from enum import Enum
 from typing import Union, List, Tuple, Dict
 
@@ -124,7 +124,11 @@ class Context:
     self._env = json.get('env')
     self._comment = json.get('comment')
     self._highlight = None
-    self.shared = json.get('shared')
+    self._shared = json.get('shared')
+    # The env is a mutable dict, keep a copy to find the changes.
+    self._originEnv = None if self._env is None else dict(self._env)
+    self._changes = set()
+    self.mod = 0
 
   def __str__(self):
     return self.toJson()
@@ -217,6 +221,7 @@ class Context:
   @highlight.setter
   def highlight(self, highlight: Highlight):
     self._highlight = highlight.value
+    self._change('highlight')
 
   # Get the comment.
   @property
@@ -227,6 +232,49 @@ class Context:
   @comment.setter
   def comment(self, comment: str):
     self._comment = comment
+    self._change('comment')
+
+  # The data shared between the request and response of a session.
+  @property
+  def shared(self):
+    return self._shared
+
+  # Set the shared data.
+  @shared.setter
+  def shared(self, shared):
+    self._shared = shared
+    self._change('shared')
+
+  # Whether the highlight, comment, shared or env has been changed.
+  @property
+  def modified(self) -> bool:
+    return self.mod != 0 or self._env != self._originEnv
+
+  def _change(self, field: str):
+    self._changes.add(field)
+    self.mod += 1
+
+  # Serialize the context fields which will be written back to the callback. Only the changed
+  # fields are included if delta is True. Note that the content changes of the shared data can't
+  # be tracked, it is always included if not None.
+  def serializeCallback(self, delta: bool = False) -> dict:
+    if not delta:
+      return {
+        'env': self._env,
+        'highlight': self._highlight,
+        'comment': self._comment,
+        'shared': self._shared,
+      }
+    fields = {}
+    if self._env != self._originEnv:
+      fields['env'] = self._env
+    if 'highlight' in self._changes:
+      fields['highlight'] = self._highlight
+    if 'comment' in self._changes:
+      fields['comment'] = self._comment
+    if 'shared' in self._changes or self._shared is not None:
+      fields['shared'] = self._shared
+    return fields
 
   def toJson(self) -> str:
     return json.dumps({
@@ -239,7 +287,7 @@ class Context:
       'env': self._env,
       'connection': None if self._connection is None else self._connection.serialize(),
       'app': None if self._app is None else self._app.serialize(),
-      'shared': self.shared,
+      'shared': self._shared,
       'highlight': self._highlight,
       'comment': self._comment,
     })
@@ -251,17 +299,24 @@ class HttpQueries:
       self._entries = []
     else:
       self._entries = entries
+    # The name to positions index, built on the first lookup. Removed entries are left as `None`
+    # so that the positions are kept, the list is compacted when read as a whole. The list which
+    # may be held by the caller is compacted right away, it never sees the removed entries.
+    self._index = None
+    self._shared = entries is not None
+    # The list length the index is built for, the list may be changed by the holders of it.
+    self._indexed = 0
+    self._removed = 0
+    self._pending = False
     self.origin = origin
     self.mod = 0
 
+  # The query string is kept as it is and only tokenized on the first read or change.
   @classmethod
   def parse(cls, query: str):
-    if query is None:
-      entries = []
-    else:
-      from urllib.parse import parse_qsl
-      entries = parse_qsl(query, keep_blank_values = True)
-    return cls(entries, query)
+    queries = cls(None, query)
+    queries._pending = bool(query)
+    return queries
 
   @classmethod
   def of(cls, data):
@@ -279,13 +334,13 @@ class HttpQueries:
     raise Exception('Unsupported query parameters data type')
 
   def __len__(self):
-    return len(self._entries)
+    return len(self._load()) - self._removed
 
   def __iter__(self):
-    return iter(self._entries)
+    return iter(self._compact())
 
   def __str__(self):
-    return str(self._entries)
+    return str(self._compact())
 
   def __add__(self, other):
     return str(self) + other
@@ -295,72 +350,123 @@ class HttpQueries:
 
   def __getitem__(self, name: Union[str, int]) -> Union[str, None]:
     if isinstance(name, int):
-      return self._entries[name]
-    index = self.index(name)
-    if index >= 0:
-      return self._entries[index][1]
+      return self._compact()[name]
+    positions = self._positions(name)
+    if positions:
+      return self._entries[positions[0]][1]
     return None
 
   def __setitem__(self, name: str, value: str):
     if len(name) >= 1:
-      index = self.index(name)
-      if index >= 0:
-        self._entries[index] = (name, value)
+      positions = self._positions(name)
+      if positions:
+        self._entries[positions[0]] = (name, value)
       else:
-        self._entries.append((name, value))
+        self._append((name, value))
       self.mod += 1
 
   # Add a query paramater with name and value.
   def add(self, name: str, value: str):
     if not name:
       return
-    self._entries.append((name, value))
+    self._append((name, value))
     self.mod += 1
 
   # Remove query paramaters by name, all the matched query paramaters will be removed.
   def remove(self, name: str):
-    for index in reversed(self.indexes(name)):
-      self._entries.pop(index)
+    self._positions(name)
+    positions = self._index.pop(name, ())
+    for position in positions:
+      self._entries[position] = None
       self.mod += 1
+    self._removed += len(positions)
+    # Don't let the removed entries pile up.
+    if self._shared or (self._removed > 16 and self._removed * 2 > len(self._entries)):
+      self._compact()
 
   # Find the first query paramater index by name. If no matched, returns -1.
   def index(self, name: str) -> int:
-    for i in range(len(self._entries)):
-      if self._entries[i][0] == name:
-        return i
-    return -1
+    positions = self.indexes(name)
+    return positions[0] if positions else -1
 
   # Find query paramater indexes by name.
   def indexes(self, name: str) -> List[int]:
-    indexes = []
-    for i in range(len(self._entries)):
-      if self._entries[i][0] == name:
-        indexes.append(i)
-    return indexes
+    self._compact()
+    return list(self._positions(name))
 
   # Remove all query paramaters.
   def clear(self):
+    self._pending = False
     self._entries.clear()
+    self._index = None
+    self._removed = 0
     self.mod += 1
 
+  def _load(self) -> List[Tuple[str, str]]:
+    if self._pending:
+      from urllib.parse import parse_qsl
+      self._entries = parse_qsl(self.origin, keep_blank_values = True)
+      self._shared = False
+      self._pending = False
+    return self._entries
+
+  def _append(self, entry: Tuple[str, str]):
+    self._load().append(entry)
+    if self._index is not None and self._indexed == len(self._entries) - 1:
+      self._index.setdefault(entry[0], []).append(len(self._entries) - 1)
+      self._indexed += 1
+
+  def _positions(self, name: str) -> List[int]:
+    entries = self._load()
+    if self._index is not None and self._indexed == len(entries):
+      positions = self._index.get(name, ())
+      # The entries may be replaced through the list held by the caller.
+      if all(entries[i] is not None and entries[i][0] == name for i in positions):
+        return positions
+    index = {}
+    for i, entry in enumerate(entries):
+      if entry is not None:
+        index.setdefault(entry[0], []).append(i)
+    self._index = index
+    self._indexed = len(entries)
+    return index.get(name, ())
+
+  # Drop the removed entries, the positions are changed so the index is rebuilt on the next lookup.
+  def _compact(self) -> List[Tuple[str, str]]:
+    self._load()
+    if self._removed:
+      self._entries[:] = [entry for entry in self._entries if entry is not None]
+      self._index = None
+      self._removed = 0
+    return self._entries
+
+  # Whether the query paramaters have been changed.
+  @property
+  def modified(self) -> bool:
+    return self.mod != 0
+
   # Concat all the query paramaters to a query string.
   def concat(self, encode: bool = True) -> str:
     if encode:
       from urllib.parse import urlencode
       # Keep asterish to be safe
-      return urlencode(self._entries, safe='*=')
+      return urlencode(self._compact(), safe='*=')
     else:
-      return '&'.join(['='.join(entry) for entry in self._entries])
+      return '&'.join(['='.join(entry) for entry in self._compact()])
 
-  # Get all query paramaters.
+  # Get all query paramaters. The list might be changed by the caller, so the index is dropped and
+  # checked against the list before it's used again.
   @property
   def entries(self) -> List[str]:
+    self._compact()
+    self._index = None
+    self._shared = True
     return self._entries
 
   # Convert the query paramaters to a dict.
   def toDict(self) -> Dict[str, str]:
     map = {}
-    for entry in self.entries:
+    for entry in self._compact():
       map[entry[0]] = entry[1]
     return map
 
@@ -371,10 +477,20 @@ class HttpQueries:
   def serialize(self) -> str:
     return self.origin if self.mod == 0 and self.origin is not None else self.concat()
 
+# The lower case name of a header line, or None if the line is not in the `name: value` form.
+def _headerKey(entry: str) -> Union[str, None]:
+  index = entry.find(': ')
+  return entry[:index].lower() if index >= 0 else None
+
 class HttpHeaders:
 
   def __init__(self, entries = None):
     self._entries = ([] if entries is None else entries)
+    # The lower case name to positions index, built on the first lookup.
+    self._index = None
+    # The list length the index is built for, the list may be changed by the holders of it.
+    self._indexed = 0
+    self.mod = 0
 
   @classmethod
   def of(cls, data):
@@ -423,48 +539,89 @@ class HttpHeaders:
       if index >= 0:
         self._entries[index] = name + ': ' + value
       else:
-        self._entries.append(name + ': ' + value)
+        self._append(name + ': ' + value)
+      self.mod += 1
 
   # Add a header line with name and value.
   def add(self, name: str, value: str):
     if not name:
       return
-    self._entries.append(name + ': ' + value)
+    self._append(name + ': ' + value)
+    self.mod += 1
 
   # Remove headers by name, all the matched headers will be removed.
   def remove(self, name: str):
     if isinstance(name, str):
-      for index in reversed(self.indexes(name)):
+      indexes = self.indexes(name)
+      if not indexes:
+        return
+      for index in reversed(indexes):
         self._entries.pop(index)
+        self.mod += 1
+      # The positions after the removed lines are shifted, rebuild on the next lookup.
+      self._index = None
 
   # Find the first header index by name. If no matched, returns -1.
   def index(self, name: str) -> int:
-    for i in range(len(self._entries)):
-      if self._entries[i].lower().startswith(name.lower() + ': '):
-        return i
-    return -1
+    positions = self._positions(name)
+    return positions[0] if positions else -1
 
   # Find header indexes by name.
   def indexes(self, name: str) -> List[int]:
-    indexes = []
-    for i in range(len(self._entries)):
-      if self._entries[i].lower().startswith(name.lower() + ': '):
-        indexes.append(i)
-    return indexes
+    return list(self._positions(name))
+
+  def _append(self, entry: str):
+    self._entries.append(entry)
+    if self._index is not None and self._indexed == len(self._entries) - 1:
+      key = _headerKey(entry)
+      if key is not None:
+        self._index.setdefault(key, []).append(len(self._entries) - 1)
+      self._indexed += 1
+
+  def _positions(self, name: str) -> List[int]:
+    if ': ' in name:
+      # Such a name never equals an indexed key, fallback to the prefix matching.
+      prefix = name.lower() + ': '
+      return [i for i, entry in enumerate(self._entries) if entry.lower().startswith(prefix)]
+    key = name.lower()
+    entries = self._entries
+    if self._index is not None and self._indexed == len(entries):
+      positions = self._index.get(key, ())
+      # The lines may be replaced through the list held by the caller.
+      if all(_headerKey(entries[i]) == key for i in positions):
+        return positions
+    index = {}
+    for i, entry in enumerate(entries):
+      entryKey = _headerKey(entry)
+      if entryKey is not None:
+        index.setdefault(entryKey, []).append(i)
+    self._index = index
+    self._indexed = len(entries)
+    return index.get(key, ())
 
   # Remove all headers.
   def clear(self):
     self._entries.clear()
+    self._index = None
+    self.mod += 1
+
+  # Whether the headers have been changed. Like the query paramaters, the changes made to the
+  # `entries` list directly are not tracked.
+  @property
+  def modified(self) -> bool:
+    return self.mod != 0
 
-  # Get all header lines.
+  # Get all header lines. The list might be changed by the caller, so the index is dropped and
+  # checked against the list before it's used again.
   @property
   def entries(self) -> List[str]:
+    self._index = None
     return self._entries
 
   # Convert the headers to a dict.
   def toDict(self) -> Dict[str, str]:
     map = {}
-    for entry in self.entries:
+    for entry in self._entries:
       name, value = entry.split(': ')
       map[name] = value
     return map
@@ -476,6 +633,555 @@ class HttpHeaders:
   def serialize(self) -> List[str]:
     return self._entries
 
+# The JSON codec to decode the captures and jsonified bodies and to encode the frames, it is backed
+# by `orjson` or `ujson` if installed. The json strings visible to the addons and the host, such as
+# `toJson` and the jsonified body text, are always encoded by `json` to keep the format.
+class JsonCodec:
+  # The supported backends in the preferred order.
+  backends = ('orjson', 'ujson', 'json')
+
+  # The body texts longer than this in bytes are decoded on the first use by `loadsLazy`, unless
+  # they have more quotes than `lazyTextQuotes`.
+  lazyTextSize = 1 << 16
+  lazyTextQuotes = 4096
+
+  def __init__(self, name: Union[str, None] = None):
+    self.use(name)
+
+  # Select the backend by name, the first installed one is selected if None. The backend is
+  # imported on the first use.
+  def use(self, name: Union[str, None]):
+    if name is not None and name not in JsonCodec.backends:
+      raise Exception(f'Unsupported JSON codec {name}')
+    self._name = name
+    self._loads = None
+    self._dumps = None
+    self._bigInts = False
+
+  # The name of the backend in use.
+  @property
+  def name(self) -> str:
+    if self._loads is None:
+      self._resolve()
+    return self._name
+
+  # Decode the JSON str or UTF-8 bytes. The input rejected by the backend is decoded by `json`
+  # again, so the result and the errors are the same as `json.loads`.
+  def loads(self, data: Union[str, bytes]):
+    if self._loads is None:
+      self._resolve()
+    try:
+      value = self._loads(data)
+    except (TypeError, ValueError):
+      return json.loads(data)
+    if self._bigInts and _hasBigInt(value):
+      return json.loads(data)
+    return value
+
+  # Encode the value to UTF-8 bytes, the value not supported by the backend is encoded by `json`.
+  def dumps(self, value) -> bytes:
+    if self._dumps is None:
+      self._resolve()
+    try:
+      return self._dumps(value)
+    except (TypeError, ValueError, OverflowError):
+      return json.dumps(value).encode('UTF-8')
+
+  # Decode the capture like `loads`, but the long body texts are kept as the raw JSON strings and
+  # decoded on the first use. So the addons which never read the body don't pay for decoding it.
+  # The strings with too many quotes to skip quickly are decoded as usual.
+  def loadsLazy(self, data: bytes):
+    if len(data) <= JsonCodec.lazyTextSize:
+      return self.loads(data)
+    global _jsonTextKey
+    if _jsonTextKey is None:
+      import re
+      _jsonTextKey = re.compile(rb'"text"\s*:\s*"')
+    nonce = None
+    texts = {}
+    parts = []
+    start = 0
+    # The key is never found in a string, the quotes in strings are escaped.
+    position = data.find(b'"text"')
+    while position >= 0:
+      match = _jsonTextKey.match(data, position)
+      if match is None:
+        position = data.find(b'"text"', position + 1)
+        continue
+      position = match.end() - 1
+      end = _jsonStringEnd(data, position + 1, JsonCodec.lazyTextQuotes)
+      if end < 0:
+        # Searching the next key would scan through the string again, stop here.
+        break
+      if end - position > JsonCodec.lazyTextSize:
+        if nonce is None:
+          nonce = os.urandom(8).hex()
+        marker = f'\0reqable-{nonce}-{len(texts)}'
+        texts[marker] = data[position:end]
+        parts.append(data[start:position])
+        parts.append(json.dumps(marker).encode('UTF-8'))
+        start = end
+      position = data.find(b'"text"', end)
+    if not texts:
+      return self.loads(data)
+    parts.append(data[start:])
+    value = self.loads(b''.join(parts))
+    self._restoreTexts(value, texts)
+    return value
+
+  # Replace the markers with the lazily decoded texts. Only the texts of the text bodies are kept
+  # encoded, the others are decoded right away.
+  def _restoreTexts(self, value, texts: dict):
+    items = value.items() if isinstance(value, dict) else enumerate(value)
+    for key, item in items:
+      if isinstance(item, str):
+        raw = texts.get(item)
+        if raw is not None:
+          value[key] = self.loads(raw)
+      elif isinstance(item, (dict, list)):
+        if key == 'body' and isinstance(item, dict) and item.get('type') == 1:
+          payload = item.get('payload')
+          if isinstance(payload, dict) and isinstance(payload.get('text'), str) and \
+              payload['text'] in texts:
+            payload['text'] = _JsonString(texts[payload['text']], self)
+        self._restoreTexts(item, texts)
+
+  def _resolve(self):
+    for name in (JsonCodec.backends if self._name is None else (self._name, )):
+      if name == 'orjson':
+        try:
+          import orjson
+        except ImportError:
+          if self._name is not None:
+            raise
+          continue
+        self._loads = orjson.loads
+        self._dumps = orjson.dumps
+        # The integers out of the 64-bit range are decoded to floats by orjson, the documents with
+        # such floats are decoded by `json` again.
+        self._bigInts = True
+      elif name == 'ujson':
+        try:
+          import ujson
+        except ImportError:
+          if self._name is not None:
+            raise
+          continue
+        self._loads = ujson.loads
+        self._dumps = lambda value: ujson.dumps(value).encode('UTF-8')
+      else:
+        self._loads = json.loads
+        self._dumps = lambda value: json.dumps(value).encode('UTF-8')
+      self._name = name
+      return
+
+# The pattern used by `JsonCodec.loadsLazy`, compiled on the first use.
+_jsonTextKey = None
+
+# Whether the value decoded by orjson has a float out of the 64-bit integer range, which may be
+# decoded from an integer. Only the containers and the numbers are visited, the strings are never
+# scanned, so the long texts cost nothing.
+def _hasBigInt(value) -> bool:
+  if type(value) is float:
+    return value >= 18446744073709551616.0 or value <= -9223372036854775808.0
+  if type(value) is not dict and type(value) is not list:
+    return False
+  stack = [value]
+  while stack:
+    value = stack.pop()
+    for item in (value.values() if type(value) is dict else value):
+      kind = type(item)
+      if kind is float:
+        if item >= 18446744073709551616.0 or item <= -9223372036854775808.0:
+          return True
+      elif kind is dict or kind is list:
+        stack.append(item)
+  return False
+
+# Find the end of the JSON string starting at the position (after the opening quote), returns -1
+# if it's not found in the first quotes.
+def _jsonStringEnd(data: bytes, position: int, quotes: int) -> int:
+  for _ in range(quotes):
+    quote = data.find(b'"', position)
+    if quote < 0:
+      return -1
+    backslash = quote - 1
+    while data[backslash] == 0x5c:
+      backslash -= 1
+    if (quote - backslash) % 2 == 1:
+      return quote + 1
+    position = quote + 1
+  return -1
+
+# A JSON string kept encoded, it is decoded on the first use.
+class _JsonString:
+  def __init__(self, raw: bytes, codec: JsonCodec):
+    self._raw = raw
+    self._codec = codec
+
+  def decode(self) -> str:
+    return self._codec.loads(self._raw)
+
+jsonCodec = JsonCodec(os.environ.get('REQABLE_JSON_CODEC') or None)
+
+# The compact binary encoding of the frames, the strings and bytes are carried as they are without
+# any escaping. Every value starts with a type byte:
+#   0x00 None, 0x01 False, 0x02 True
+#   0x03 int: 8 bytes signed big-endian
+#   0x04 float: 8 bytes IEEE 754 big-endian
+#   0x05 str: 4 bytes big-endian length + UTF-8 bytes
+#   0x06 bytes: 4 bytes big-endian length + raw bytes
+#   0x07 list: 4 bytes big-endian count + values
+#   0x08 dict: 4 bytes big-endian count + (str key without the type byte, value) pairs
+#   0x09 int out of the 64-bit range: same as str, the decimal digits
+class BinaryCodec:
+  _none = 0x00
+  _false = 0x01
+  _true = 0x02
+  _int = 0x03
+  _float = 0x04
+  _str = 0x05
+  _bytes = 0x06
+  _list = 0x07
+  _dict = 0x08
+  _bigint = 0x09
+
+  _length = struct.Struct('>I')
+  _tagLength = struct.Struct('>BI')
+  _tagInt = struct.Struct('>Bq')
+  _tagFloat = struct.Struct('>Bd')
+
+  # Encode the value to bytes.
+  @classmethod
+  def encode(cls, value) -> bytes:
+    buffer = bytearray()
+    cls._encode(buffer, value)
+    return bytes(buffer)
+
+  # Encode the value to the end of the buffer, the caller can reserve a header in front of the value
+  # and write the buffer out without copying it again.
+  @classmethod
+  def encodeInto(cls, buffer: bytearray, value):
+    cls._encode(buffer, value)
+
+  # Decode the bytes to a value. The bytes values are decoded to read-only memoryviews of the data
+  # without copying.
+  @classmethod
+  def decode(cls, data: Union[bytes, bytearray, memoryview]):
+    view = memoryview(data)
+    if not view.readonly:
+      view = view.toreadonly()
+    value, offset = cls._decode(view, 0)
+    if offset != len(view):
+      raise Exception('Unexpected binary data after the value')
+    return value
+
+  # Decode only the named fields of the encoded dict, the other fields are skipped without being
+  # decoded and the walk stops once all the names are found. The missing names are not in the
+  # returned dict.
+  @classmethod
+  def peek(cls, data: Union[bytes, bytearray, memoryview], names: Tuple[str, ...]) -> dict:
+    view = memoryview(data)
+    if view[0] != cls._dict:
+      raise Exception('Unexpected binary value type, expected a dict')
+    count = cls._length.unpack_from(view, 1)[0]
+    offset = 5
+    keys = set(name.encode('UTF-8') for name in names)
+    fields = {}
+    for _ in range(count):
+      size = cls._length.unpack_from(view, offset)[0]
+      offset += 4
+      key = bytes(view[offset:offset + size])
+      offset += size
+      if key in keys:
+        fields[key.decode('UTF-8')], offset = cls._decode(view, offset)
+        if len(fields) == len(keys):
+          break
+      else:
+        offset = cls._skip(view, offset)
+    return fields
+
+  @classmethod
+  def _encode(cls, buffer: bytearray, value):
+    if value is None:
+      buffer.append(cls._none)
+    elif value is True:
+      buffer.append(cls._true)
+    elif value is False:
+      buffer.append(cls._false)
+    elif isinstance(value, int):
+      if -(1 << 63) <= value < (1 << 63):
+        buffer += cls._tagInt.pack(cls._int, value)
+      else:
+        digits = str(value).encode('ascii')
+        buffer += cls._tagLength.pack(cls._bigint, len(digits))
+        buffer += digits
+    elif isinstance(value, float):
+      buffer += cls._tagFloat.pack(cls._float, value)
+    elif isinstance(value, str):
+      encoded = value.encode('UTF-8')
+      buffer += cls._tagLength.pack(cls._str, len(encoded))
+      buffer += encoded
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+      buffer += cls._tagLength.pack(cls._bytes, memoryview(value).nbytes)
+      buffer += value
+    elif isinstance(value, (list, tuple)):
+      buffer += cls._tagLength.pack(cls._list, len(value))
+      for item in value:
+        cls._encode(buffer, item)
+    elif isinstance(value, dict):
+      buffer += cls._tagLength.pack(cls._dict, len(value))
+      for key, item in value.items():
+        if not isinstance(key, str):
+          raise Exception(f'Unsupported binary dict key type {type(key).__name__}')
+        encoded = key.encode('UTF-8')
+        buffer += cls._length.pack(len(encoded))
+        buffer += encoded
+        cls._encode(buffer, item)
+    else:
+      raise Exception(f'Unsupported binary value type {type(value).__name__}')
+
+  @classmethod
+  def _decode(cls, view: memoryview, offset: int):
+    tag = view[offset]
+    offset += 1
+    if tag == cls._none:
+      return None, offset
+    elif tag == cls._false:
+      return False, offset
+    elif tag == cls._true:
+      return True, offset
+    elif tag == cls._int:
+      return struct.unpack_from('>q', view, offset)[0], offset + 8
+    elif tag == cls._float:
+      return struct.unpack_from('>d', view, offset)[0], offset + 8
+    length = cls._length.unpack_from(view, offset)[0]
+    offset += 4
+    if tag == cls._str:
+      return str(view[offset:offset + length], 'UTF-8'), offset + length
+    elif tag == cls._bytes:
+      if offset + length > len(view):
+        raise Exception('Unexpected end of binary data')
+      return view[offset:offset + length], offset + length
+    elif tag == cls._bigint:
+      return int(str(view[offset:offset + length], 'ascii')), offset + length
+    elif tag == cls._list:
+      value = []
+      for _ in range(length):
+        item, offset = cls._decode(view, offset)
+        value.append(item)
+      return value, offset
+    elif tag == cls._dict:
+      value = {}
+      for _ in range(length):
+        size = cls._length.unpack_from(view, offset)[0]
+        offset += 4
+        key = str(view[offset:offset + size], 'UTF-8')
+        value[key], offset = cls._decode(view, offset + size)
+      return value, offset
+    raise Exception(f'Unexpected binary value type {tag}')
+
+  # Returns the offset after the value without decoding it.
+  @classmethod
+  def _skip(cls, view: memoryview, offset: int) -> int:
+    tag = view[offset]
+    offset += 1
+    if tag in (cls._none, cls._false, cls._true):
+      return offset
+    elif tag in (cls._int, cls._float):
+      return offset + 8
+    length = cls._length.unpack_from(view, offset)[0]
+    offset += 4
+    if tag in (cls._str, cls._bytes, cls._bigint):
+      return offset + length
+    elif tag == cls._list:
+      for _ in range(length):
+        offset = cls._skip(view, offset)
+      return offset
+    elif tag == cls._dict:
+      for _ in range(length):
+        offset += 4 + cls._length.unpack_from(view, offset)[0]
+        offset = cls._skip(view, offset)
+      return offset
+    raise Exception(f'Unexpected binary value type {tag}')
+
+# The single producer single consumer ring of the body payloads in a shared memory file, the frames
+# carry the `{"offset": <file offset>, "length": <bytes>}` of the regions instead of the bytes. The
+# file has two rings of the same capacity, the host writes the job bodies to the first one and the
+# script writes the result bodies to the second one. A result body which is not changed is passed
+# through as its job region, the host keeps its own copy of the body since the job region is
+# released as soon as the result is encoded.
+#
+# Every ring starts with a 64 bytes header of the head and the tail positions (little-endian u64).
+# The producer advances the head after a region is written, and the consumer advances the tail
+# after the regions are released in order. A region never wraps around the end of the ring, the
+# producer skips the rest of the ring instead.
+class RingBuffer:
+  headerSize = 64
+
+  _position = struct.Struct('<Q')
+  _head = 0
+  _tail = 8
+
+  def __init__(self, view: memoryview, offset: int, capacity: int):
+    self._view = view
+    self._header = offset
+    self._start = offset + RingBuffer.headerSize
+    self._capacity = capacity
+    self._released = self._read(RingBuffer._tail)
+    self._regions = deque()
+    self._done = set()
+
+  # Map the ring buffers file, returns the job ring and the result ring. The file is created if
+  # the capacity of the rings is given, otherwise the existing file is mapped.
+  @classmethod
+  def open(cls, path: str, capacity: int = 0) -> Tuple['RingBuffer', 'RingBuffer']:
+    import mmap
+    with open(path, mode = 'w+b' if capacity > 0 else 'r+b') as file:
+      if capacity > 0:
+        file.truncate(2 * (cls.headerSize + capacity))
+      else:
+        capacity = os.fstat(file.fileno()).st_size // 2 - cls.headerSize
+      if capacity <= 0:
+        raise Exception('Invalid ring buffer file ' + path)
+      view = memoryview(mmap.mmap(file.fileno(), 2 * (cls.headerSize + capacity)))
+    return cls(view, 0, capacity), cls(view, cls.headerSize + capacity, capacity)
+
+  @property
+  def capacity(self) -> int:
+    return self._capacity
+
+  def _read(self, field: int) -> int:
+    return RingBuffer._position.unpack_from(self._view, self._header + field)[0]
+
+  def _write(self, field: int, value: int):
+    RingBuffer._position.pack_into(self._view, self._header + field, value)
+
+  # Copy the data to a new region as the producer, returns the (offset, length) of the region, or
+  # None if the ring doesn't have enough free space.
+  def write(self, data) -> Union[Tuple[int, int], None]:
+    length = memoryview(data).nbytes
+    if length == 0 or length > self._capacity:
+      return None
+    head = self._read(RingBuffer._head)
+    tail = self._read(RingBuffer._tail)
+    position = head % self._capacity
+    start = head
+    if position + length > self._capacity:
+      start += self._capacity - position
+      position = 0
+    # The skipped space is free, only the unreleased regions between the tail and the head count.
+    if head != tail and start + length - tail > self._capacity:
+      return None
+    offset = self._start + position
+    self._view[offset:offset + length] = data
+    self._write(RingBuffer._head, start + length)
+    return offset, length
+
+  # Returns the region as a read-only memoryview as the consumer, the regions must be received in
+  # the order they are written. The memoryview must not be used after the region is released.
+  def region(self, offset: int, length: int) -> memoryview:
+    position = offset - self._start
+    if position < 0 or length <= 0 or position + length > self._capacity:
+      raise Exception(f'Invalid ring buffer region {offset}+{length}')
+    self._regions.append((offset, length))
+    return self._view[offset:offset + length].toreadonly()
+
+  # Release the region as the consumer, so that the producer can reuse the space. The regions can
+  # be released in any order, the tail is advanced when all the previous regions are released.
+  def release(self, offset: int):
+    self._done.add(offset)
+    tail = self._released
+    while self._regions and self._regions[0][0] in self._done:
+      offset, length = self._regions.popleft()
+      self._done.discard(offset)
+      position = tail % self._capacity
+      if offset - self._start != position:
+        tail += self._capacity - position
+      tail += length
+    if tail != self._released:
+      self._released = tail
+      self._write(RingBuffer._tail, tail)
+
+# Map the file to memory read-only, the content is loaded by pages when accessed.
+def _mapFile(path: str) -> Union[memoryview, bytes]:
+  with open(path, mode = 'rb') as file:
+    if os.fstat(file.fileno()).st_size == 0:
+      # Empty file can't be mapped.
+      return bytes()
+    import mmap
+    return memoryview(mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ))
+
+# Copy the file content in kernel with `copy_file_range` or `sendfile` if supported, so the content
+# is never copied through the Python bytes.
+def _copyFile(source: str, target: str):
+  with open(source, mode = 'rb') as input, open(target, mode = 'wb') as output:
+    size = os.fstat(input.fileno()).st_size
+    offset = 0
+    for copy in (_copyFileRange, _sendFile):
+      try:
+        while offset < size:
+          count = copy(input.fileno(), output.fileno(), offset, size - offset)
+          if count == 0:
+            break
+          offset += count
+      except (AttributeError, OSError):
+        continue
+      if offset >= size:
+        return
+    input.seek(offset)
+    output.seek(offset)
+    import shutil
+    shutil.copyfileobj(input, output)
+
+# Both write to the current position of the output file.
+def _copyFileRange(input: int, output: int, offset: int, count: int) -> int:
+  return os.copy_file_range(input, output, count, offset)
+
+def _sendFile(input: int, output: int, offset: int, count: int) -> int:
+  return os.sendfile(output, input, offset, count)
+
+# The compiled patterns of `HttpBody.replaceAll` keyed by the mapping items, they are kept across
+# the messages in the serve mode. The cache is cleared when it is full.
+_replacePatterns = {}
+_replacePatternsSize = 64
+
+# Compile the keys of the mapping to one alternation pattern, the longer keys are tried first at
+# the same position. Returns the pattern and the replacement function of the matches.
+def _replacePattern(mapping: dict, binary: bool):
+  key = (binary, tuple(mapping.items()))
+  try:
+    result = _replacePatterns.get(key)
+  except TypeError:
+    # The unhashable values such as bytearray are not cached.
+    key = None
+    result = None
+  if result is not None:
+    return result
+  import re
+  replacements = {}
+  for old, new in mapping.items():
+    if binary:
+      old = old.encode('UTF-8') if isinstance(old, str) else old
+      new = new.encode('UTF-8') if isinstance(new, str) else new
+      if not isinstance(old, (bytes, bytearray)) or not isinstance(new, (bytes, bytearray)):
+        raise Exception('The binary body replacements must be bytes or str')
+      old = bytes(old)
+      new = bytes(new)
+    elif not isinstance(old, str) or not isinstance(new, str):
+      raise Exception('The text body replacements must be str')
+    if len(old) == 0:
+      raise Exception('The replaced value must not be empty')
+    replacements[old] = new
+  keys = sorted(replacements, key = len, reverse = True)
+  pattern = re.compile((b'|' if binary else '|').join(re.escape(old) for old in keys))
+  result = (pattern, lambda match: replacements[match.group()])
+  if key is not None:
+    if len(_replacePatterns) >= _replacePatternsSize:
+      _replacePatterns.clear()
+    _replacePatterns[key] = result
+  return result
+
 class HttpBody:
 
   __type_none = 0
@@ -487,6 +1193,13 @@ class HttpBody:
     self._type = type
     self._payload = payload
     self._charset = charset
+    # The file of the binary payload, it is mapped on the first access.
+    self._file = None
+    # The binary payload file provided by the host, it is passed through if not modified.
+    self._source = None
+    # The encoded text payload, it is decoded on the first access.
+    self._text = None
+    self.mod = 0
 
   @classmethod
   def of(cls, data = None):
@@ -517,13 +1230,19 @@ class HttpBody:
     elif type == cls.__type_text:
       payload = dict['payload']['text']
       charset = dict['payload']['charset']
+      if isinstance(payload, _JsonString):
+        body = cls(type, None, charset)
+        body._text = payload
+        return body
     elif type == cls.__type_binary:
       payload = dict['payload']
       charset = None
       if isinstance(payload, str):
-        with open(payload, mode = 'rb') as file:
-          payload = file.read()
-      elif isinstance(payload, bytes):
+        body = cls(type, None, charset)
+        body._file = payload
+        body._source = payload
+        return body
+      elif isinstance(payload, (bytes, bytearray, memoryview)):
         payload = payload
       else:
         payload = bytes()
@@ -547,21 +1266,25 @@ class HttpBody:
     return other + str(self)
 
   def __len__(self):
-    return 0 if self.isNone else len(self._payload)
+    if self.isNone:
+      return 0
+    if self.isBinary and self._payload is None:
+      return os.path.getsize(self._file)
+    return len(self._view())
 
   def __iter__(self):
-    return iter(self._payload)
+    return iter(self._view())
 
   def __str__(self):
     if self.isNone:
       return ''
     elif self.isText:
-      if isinstance(self._payload, str):
+      if isinstance(self._view(), str):
         return self._payload
       else:
         return json.dumps(self._payload)
     elif self.isBinary:
-      return str(self._payload)
+      return str(self.payload)
     else:
       raise Exception('Unsupported str for multipart body')
 
@@ -571,9 +1294,36 @@ class HttpBody:
   def type(self) -> int:
     return self._type
 
-  # The http body payload.
+  # The http body payload. The mapped binary payload is copied to bytes, use `buffer` to read the
+  # binary payload without copying.
   @property
   def payload(self) -> Union[None, str, bytes, List]:
+    if self.isBinary and not isinstance(self._view(), (bytes, bytearray)):
+      self._payload = bytes(self._view())
+    return self._view()
+
+  # The binary payload as a read-only memoryview without copying, it can be used for hashing,
+  # comparing or writing. Returns None if the body type is not binary.
+  @property
+  def buffer(self) -> Union[memoryview, None]:
+    if not self.isBinary:
+      return None
+    view = memoryview(self._view())
+    return view if view.readonly else view.toreadonly()
+
+  # Whether the binary payload is still the same as the file content.
+  def _isFileContent(self) -> bool:
+    return self._file is not None and not isinstance(self._payload, bytearray)
+
+  # The payload, the binary file is mapped to memory and the encoded text is decoded if they have
+  # not been loaded.
+  def _view(self):
+    if self._payload is None:
+      if self._file is not None and self.isBinary:
+        self._payload = _mapFile(self._file)
+      elif self._text is not None and self.isText:
+        self._payload = self._text.decode()
+        self._text = None
     return self._payload
 
   # Determine whether the body is None.
@@ -600,32 +1350,43 @@ class HttpBody:
   def none(self):
     self._type = HttpBody.__type_none
     self._payload = None
+    self._file = None
+    self.mod += 1
 
   # Set the body to a text string.
   def text(self, value: str):
     self._type = HttpBody.__type_text
     self._payload = value
+    self._file = None
+    self._text = None
+    self.mod += 1
 
   # Set the body to a specified file content, the file content must be a text string.
   def textFromFile(self, value: str):
     with open(value, mode = 'r', encoding='UTF-8') as file:
       self._payload = file.read()
     self._type = HttpBody.__type_text
+    self._file = None
+    self._text = None
+    self.mod += 1
 
   # Set the body to the specified file content, the file content must be a binary bytes.
   def file(self, value: str):
     if isinstance(value, str):
       self.binary(value)
 
-  # Set the body to binary bytes.
+  # Set the body to binary bytes. The file is mapped to memory rather than read.
   def binary(self, value: Union[str, bytes]):
     if isinstance(value, str):
       self._type = HttpBody.__type_binary
-      with open(value, mode = 'rb') as file:
-        self._payload = file.read()
+      self._payload = _mapFile(value)
+      self._file = value
+      self.mod += 1
     if isinstance(value, bytes):
       self._type = HttpBody.__type_binary
       self._payload = value
+      self._file = None
+      self.mod += 1
 
   # Set the body to binary bytes.
   def multiparts(self, value: list):
@@ -639,64 +1400,111 @@ class HttpBody:
       return
     self._type = HttpBody.__type_multipart
     self._payload = payload
+    self._file = None
+    self.mod += 1
 
   # Convert the body content to a json dict.
   def jsonify(self):
     if self.isText:
-      self._payload = json.loads(self._payload)
+      self._payload = jsonCodec.loads(self._view())
+      # The payload will be encoded again, the content may be changed.
+      self.mod += 1
 
   # Replace old string to a new one. The body type must be a text.
   def replace(self, old: str, new: str, count: int = -1):
-    if self.isText and isinstance(self._payload, str):
+    if self.isText and isinstance(self._view(), str):
       self._payload = self._payload.replace(old, new, count)
+      self.mod += 1
+
+  # Replace all the keys of the mapping to the values in one scan, the replaced content is not
+  # scanned again, and the longest key wins at the same position. The text body takes the str
+  # mapping, the binary body takes the bytes or str (encoded as UTF-8) mapping. The compiled
+  # mappings are cached. Returns the count of the replacements.
+  def replaceAll(self, mapping: Dict[Union[str, bytes], Union[str, bytes]]) -> int:
+    if not mapping:
+      return 0
+    if self.isText and isinstance(self._view(), str):
+      pattern, replacement = _replacePattern(mapping, False)
+      payload, count = pattern.subn(replacement, self._payload)
+    elif self.isBinary:
+      pattern, replacement = _replacePattern(mapping, True)
+      payload, count = pattern.subn(replacement, self._view())
+    else:
+      return 0
+    if count > 0:
+      self._payload = payload
+      # The payload is not the file content anymore.
+      self._file = None
+      self.mod += 1
+    return count
 
   # If the body type is a json dict, returns the value. Note: you must call jsonify() before this.
-  # If the body type is binary, returns the value at the index.
+  # If the body type is binary, returns the value at the index, or a memoryview of the slice
+  # without copying.
   # If the body type is multipart, returns the part at the index.
-  def __getitem__(self, name: Union[str, int]):
+  def __getitem__(self, name: Union[str, int, slice]):
     if self.isText:
-      if not isinstance(self._payload, dict):
+      if not isinstance(self._view(), dict):
         raise Exception('Did you forget to call `jsonify()` before operating json dict?')
       return self._payload[name]
     if self.isBinary and isinstance(name, int):
-      return self._payload[name]
+      return self._view()[name]
+    if self.isBinary and isinstance(name, slice):
+      return self.buffer[name]
     if self.isMultipart and isinstance(name, int):
       return self._payload[name]
     return None
 
   # If the body type is a json dict, set the value. Note: you must call jsonify() before this.
-  # If the body type is binary, set the value at the index.
+  # If the body type is binary, set the value at the index, the payload is copied to a bytearray.
   # If the body type is multipart, set the part at the index.
   def __setitem__(self, name: Union[str, int], value):
     if self.isText:
-      if not isinstance(self._payload, dict):
+      if not isinstance(self._view(), dict):
         raise Exception('Did you forget to call `jsonify()` before operating json dict?')
       self._payload[name] = value
+      self.mod += 1
     if self.isBinary and isinstance(name, int):
+      if not isinstance(self._payload, bytearray):
+        self._payload = bytearray(self._view())
       self._payload[name] = value
+      self.mod += 1
     if self.isMultipart and isinstance(name, int):
       self._payload[name] = value
+      self.mod += 1
+
+  # Whether the body has been changed.
+  @property
+  def modified(self) -> bool:
+    if self.mod != 0:
+      return True
+    return self.isMultipart and any(part.modified for part in self._payload)
 
   # Write the body content to a file.
   def writeFile(self, path: str):
     if self.isText:
       with open(path, "w", encoding='UTF-8') as file:
-        if isinstance(self._payload, str):
+        if isinstance(self._view(), str):
           file.write(self._payload)
         else:
           file.write(json.dumps(self._payload))
     elif self.isBinary:
-      with open(path, "wb") as file:
-        file.write(self._payload)
+      if self._isFileContent():
+        _copyFile(self._file, path)
+      else:
+        with open(path, "wb") as file:
+          file.write(self._view())
     elif self.isMultipart:
       raise Exception('Write a multipart body to file is supported!')
 
-  def serialize(self):
+  # Serialize the body to a dict. The binary payload is written to a file and the path is returned,
+  # unless inline is True, then the payload is returned as it is for the binary protocol.
+  def serialize(self, inline: bool = False):
     type = self._type
     if self.isNone:
       payload = None
     elif self.isText:
-      if isinstance(self._payload, str):
+      if isinstance(self._view(), str):
         if len(self._payload) == 0:
           payload = None
           type = HttpBody.__type_none
@@ -711,13 +1519,18 @@ class HttpBody:
           'charset': self._charset
         }
     elif self.isBinary:
-      if len(self._payload) == 0:
+      if len(self) == 0:
         type = HttpBody.__type_none
         payload = None
+      elif self._source is not None and self.mod == 0:
+        # The body is the same as the host provided, pass the path through.
+        payload = self._source
+      elif inline:
+        payload = self._view()
       else:
+        import uuid
         payload = os.path.join(os.getcwd(), 'tmp-' + str(uuid.uuid4()))
-        with open(payload, 'wb') as file:
-          file.write(self._payload)
+        self.writeFile(payload)
     elif self.isMultipart:
       if len(self._payload) == 0:
         type = HttpBody.__type_none
@@ -725,7 +1538,7 @@ class HttpBody:
       else:
         payload = []
         for multipart in self._payload:
-          payload.append(multipart.serialize())
+          payload.append(multipart.serialize(inline))
     return {
       'type': type,
       'payload': payload,
@@ -736,7 +1549,10 @@ class HttpMultipartBody(HttpBody):
   def __init__(self, json: dict):
     self._headers = HttpHeaders(json['headers'])
     body = HttpBody.parse(json['body'])
-    super().__init__(body.type, body.payload)
+    super().__init__(body._type, body._payload)
+    self._file = body._file
+    self._source = body._source
+    self._text = body._text
 
   def _concatDisposition(name: str, filename: str, type: str):
     if name != '' and filename != '':
@@ -774,13 +1590,16 @@ class HttpMultipartBody(HttpBody):
     disposition = HttpMultipartBody._concatDisposition(name, filename, type)
     if disposition is not None:
       headers.append(f'content-disposition: {disposition}')
-    return cls({
+    part = cls({
       'headers': headers,
       'body': {
         'type': 2,
         'payload': file
       }
     })
+    # The file is not provided by the host, it must be copied when serializing.
+    part._source = None
+    return part
 
   # Get the part headers.
   @property
@@ -791,6 +1610,12 @@ class HttpMultipartBody(HttpBody):
   @headers.setter
   def headers(self, data: Union[List[str], List[Tuple[str, str]], Dict[str, str]]):
     self._headers = HttpHeaders.of(data)
+    self.mod += 1
+
+  # Whether the part headers or body has been changed.
+  @property
+  def modified(self) -> bool:
+    return super().modified or self._headers.modified
 
   # Get the part name.
   @property
@@ -812,41 +1637,153 @@ class HttpMultipartBody(HttpBody):
   def filename(self,  data: str):
     self._setDispositionParamValue('filename', data)
 
-  def serialize(self) -> dict:
+  def serialize(self, inline: bool = False) -> dict:
     return {
       'headers': self._headers.serialize(),
-      'body': super().serialize()
+      'body': super().serialize(inline)
     }
 
   def _getDispositionParamValue(self, param):
     disposition = self._headers['content-disposition']
     if disposition is None:
       return None
-    message = EmailMessage()
-    message.add_header('content-disposition', disposition)
-    return message.get_param(param, header='content-disposition')
+    return _parseHeaderParams(disposition)[1].get(param)
 
   def _setDispositionParamValue(self, param, value):
     disposition = self._headers['content-disposition']
     if disposition is None:
       return
-    message = EmailMessage()
-    message.add_header('content-disposition', disposition)
-    message.set_param(param, value, header='content-disposition')
-    self._headers['content-disposition'] = message.get('content-disposition')
+    self._headers['content-disposition'] = _setHeaderParam(disposition, param, value)
+
+# Whether the lazily constructed field has been constructed and changed.
+def _isModified(field) -> bool:
+  return field is not None and field.modified
+
+# Split the request path to the path, params and query like `urllib.parse.urlparse`, the fragment
+# is dropped. This avoids importing `urllib.parse` for every request.
+def _splitPath(path: str) -> Tuple[str, str, str]:
+  path = path.split('#', 1)[0]
+  path, _, query = path.partition('?')
+  index = path.find(';', max(path.rfind('/'), 0))
+  if index < 0:
+    return path, '', query
+  return path[:index], path[index + 1:], query
+
+# The parsed header parameters keyed by the header value, it is cleared when full.
+_headerParamsCache = {}
+_headerParamsCacheSize = 256
+
+# Split a header value by the `;` separators which are not quoted.
+def _splitHeaderParams(header: str) -> List[str]:
+  segments = []
+  start = 0
+  quoted = False
+  escaped = False
+  for i, c in enumerate(header):
+    if escaped:
+      escaped = False
+    elif c == '\\' and quoted:
+      escaped = True
+    elif c == '"':
+      quoted = not quoted
+    elif c == ';' and not quoted:
+      segments.append(header[start:i].strip())
+      start = i + 1
+  segments.append(header[start:].strip())
+  return segments
+
+def _unquoteHeaderParam(value: str) -> str:
+  if len(value) < 2 or value[0] != '"' or value[-1] != '"':
+    return value
+  value = value[1:-1]
+  if '\\' not in value:
+    return value
+  chars = []
+  escaped = False
+  for c in value:
+    if escaped or c != '\\':
+      chars.append(c)
+      escaped = False
+    else:
+      escaped = True
+  return ''.join(chars)
+
+# Decode the RFC 5987 extended value like `UTF-8'en'%E2%82%AC%20rates`.
+def _decodeHeaderParam(value: str) -> str:
+  parts = value.split("'", 2)
+  if len(parts) != 3:
+    return value
+  from urllib.parse import unquote
+  try:
+    return unquote(parts[2], encoding=parts[0] or 'UTF-8', errors='replace')
+  except LookupError:
+    return unquote(parts[2], encoding='ISO-8859-1')
+
+# Parse a header value with parameters such as `content-type` (RFC 7231) and `content-disposition`
+# (RFC 6266). Returns the lower case value and the parameters keyed by the lower case names, the
+# extended `name*` parameters take precedence over the plain ones. The result must not be changed.
+def _parseHeaderParams(header: str) -> Tuple[str, Dict[str, str]]:
+  result = _headerParamsCache.get(header)
+  if result is not None:
+    return result
+  segments = _splitHeaderParams(header)
+  params = {}
+  extended = set()
+  for segment in segments[1:]:
+    name, _, value = segment.partition('=')
+    name = name.strip().lower()
+    value = value.strip()
+    if name.endswith('*'):
+      name = name[:-1]
+      params[name] = _decodeHeaderParam(_unquoteHeaderParam(value))
+      extended.add(name)
+    elif name and name not in extended and name not in params:
+      params[name] = _unquoteHeaderParam(value)
+  result = (segments[0].lower(), params)
+  if len(_headerParamsCache) >= _headerParamsCacheSize:
+    _headerParamsCache.clear()
+  _headerParamsCache[header] = result
+  return result
+
+# Format a parameter as a quoted string, or as an extended value if it can't be quoted.
+def _formatHeaderParam(name: str, value: str) -> str:
+  if any(ord(c) < 0x20 or ord(c) == 0x7f for c in value):
+    from urllib.parse import quote
+    return f"{name}*=UTF-8''{quote(value, safe='')}"
+  value = value.replace('\\', '\\\\').replace('"', '\\"')
+  return f'{name}="{value}"'
+
+# Set a parameter of the header value, the other parameters are kept as they are.
+def _setHeaderParam(header: str, name: str, value: str) -> str:
+  segments = _splitHeaderParams(header)
+  param = _formatHeaderParam(name, value)
+  result = [segments[0]]
+  for segment in segments[1:]:
+    key = segment.partition('=')[0].strip().lower()
+    if not segment:
+      continue
+    elif key.rstrip('*') != name.lower():
+      result.append(segment)
+    elif param is not None:
+      result.append(param)
+      param = None
+  if param is not None:
+    result.append(param)
+  return '; '.join(result)
 
 class HttpRequest:
   def __init__(self, json):
+    self._json = json
     self._method = json['method']
     self._protocol = json['protocol']
-    self._headers = HttpHeaders(json.get('headers'))
-    self._body = HttpBody.parse(json.get('body'))
-    self._trailers = HttpHeaders(json.get('trailers'))
-    from urllib.parse import urlparse
-    url = urlparse('https://reqable.com' + json['path'])
-    self._params = url.params
-    self._path = url.path
-    self._queries = HttpQueries.parse(url.query)
+    self._path, self._params, self._query = _splitPath(json['path'])
+    # The queries, headers, trailers and body are constructed on the first access.
+    self._queries = None
+    self._headers = None
+    self._trailers = None
+    self._body = None
+    self._changes = set()
+    self.mod = 0
 
   def __str__(self):
     return self.toJson()
@@ -872,6 +1809,7 @@ class HttpRequest:
   def method(self, data) -> str:
     if isinstance(data, str) and data != '':
       self._method = data
+      self._change('method')
     else:
       raise Exception('Request method must be a non-empty string.')
 
@@ -885,97 +1823,144 @@ class HttpRequest:
   def path(self, data: str):
     if isinstance(data, str) and data != '':
       self._path = data
+      self._change('path')
     else:
       raise Exception('Request path must be a non-empty string.')
 
   # Get the request query paramaters.
   @property
   def queries(self) -> HttpQueries:
+    if self._queries is None:
+      self._queries = HttpQueries.parse(self._query)
     return self._queries
 
   # Set the request query paramaters.
   @queries.setter
   def queries(self, data: Union[str, List[Tuple[str, str]], Dict[str, str]]):
     self._queries = HttpQueries.of(data)
+    self._change('path')
 
   # Get the request headers.
   @property
   def headers(self) -> HttpHeaders:
+    if self._headers is None:
+      self._headers = HttpHeaders(self._json.get('headers'))
     return self._headers
 
   # Set the request headers.
   @headers.setter
   def headers(self, data: Union[List[str], List[Tuple[str, str]], Dict[str, str]]):
     self._headers = HttpHeaders.of(data)
+    self._change('headers')
 
   # Get the request trailers. Note that the implementation of this function is incomplete, please do not use it.
   @property
   def trailers(self) -> HttpHeaders:
+    if self._trailers is None:
+      self._trailers = HttpHeaders(self._json.get('trailers'))
     return self._trailers
 
   # Set the request trailers. Note that the implementation of this function is incomplete, please do not use it.
   @trailers.setter
   def trailers(self, data: Union[List[str], List[Tuple[str, str]], Dict[str, str]]):
     self._trailers = HttpHeaders.of(data)
+    self._change('trailers')
 
   # Get the request body.
   @property
   def body(self) -> HttpBody:
+    if self._body is None:
+      self._body = HttpBody.parse(self._json.get('body'))
     return self._body
 
   # Set the request body.
   @body.setter
   def body(self, data: Union[str, bytes, dict, HttpBody]):
     self._body = HttpBody.of(data)
+    self._change('body')
 
   # Get the request content type from headers.
   @property
   def contentType(self) -> Union[str, None]:
-    return self._headers['content-type']
+    return self.headers['content-type']
 
   # Set the request content type to headers.
   @contentType.setter
   def contentType(self, value: str):
-    self._headers['content-type'] = value
+    self.headers['content-type'] = value
 
   # Get the request mime type from headers.
   @property
   def mime(self) -> Union[str, None]:
-    contentType = self._headers['content-type']
+    contentType = self.headers['content-type']
     if contentType == None:
       return None
-    message = EmailMessage()
-    message.add_header('content-type', contentType)
-    return message.get_content_type()
+    mime = _parseHeaderParams(contentType)[0]
+    # Same as `EmailMessage.get_content_type`, the invalid types fallback to the default one.
+    return mime if mime.count('/') == 1 else 'text/plain'
 
-  # Serialize the request fields to a dict.
-  def serialize(self) -> dict:
+  # Whether any field of the request has been changed.
+  @property
+  def modified(self) -> bool:
+    return self.mod != 0 or _isModified(self._queries) or _isModified(self._headers) or \
+      _isModified(self._body) or _isModified(self._trailers)
+
+  def _change(self, field: str):
+    self._changes.add(field)
+    self.mod += 1
+
+  def _serializePath(self) -> str:
     path = self.path
     if self._params != None and self._params != '':
       path = path + ';' + self._params
-    if len(self.queries) != 0:
-      path = path + '?' + self.queries.serialize()
+    # The original query string is written back as it is unless the queries are changed.
+    query = self._query if self._queries is None else self._queries.serialize()
+    if query:
+      path = path + '?' + query
+    return path
+
+  # Serialize the request fields to a dict, see `HttpBody.serialize` for inline.
+  def serialize(self, inline: bool = False) -> dict:
     return {
       'method': self.method,
-      'path': path,
+      'path': self._serializePath(),
       'protocol': self._protocol,
-      'headers': self._headers.serialize(),
-      'body': self._body.serialize(),
-      'trailers': self._trailers.serialize(),
+      'headers': self.headers.serialize(),
+      'body': self.body.serialize(inline),
+      'trailers': self.trailers.serialize(),
     }
 
+  # Serialize the changed request fields to a dict, the unchanged fields are omitted.
+  def serializeDelta(self, inline: bool = False) -> dict:
+    fields = {}
+    if 'method' in self._changes:
+      fields['method'] = self._method
+    if 'path' in self._changes or _isModified(self._queries):
+      fields['path'] = self._serializePath()
+    if 'headers' in self._changes or _isModified(self._headers):
+      fields['headers'] = self._headers.serialize()
+    if 'body' in self._changes or _isModified(self._body):
+      fields['body'] = self._body.serialize(inline)
+    if 'trailers' in self._changes or _isModified(self._trailers):
+      fields['trailers'] = self._trailers.serialize()
+    return fields
+
   def toJson(self) -> str:
     return json.dumps(self.serialize())
 
 class HttpResponse:
   def __init__(self, json):
-    self._request = HttpRequest(json['request'])
+    self._json = json
     self._code = json['code']
     self._message = json['message']
     self._protocol = json['protocol']
-    self._headers = HttpHeaders(json.get('headers'))
-    self._body = HttpBody.parse(json.get('body'))
-    self._trailers = HttpHeaders(json.get('trailers'))
+    # The request, headers, trailers and body are constructed on the first access.
+    self._request = None
+    self._headers = None
+    self._trailers = None
+    self._body = None
+    self._changes = set()
+    self.mod = 0
 
   def __str__(self):
     return self.toJson()
@@ -989,6 +1974,8 @@ class HttpResponse:
   # Get the request informations.
   @property
   def request(self) -> HttpRequest:
+    if self._request is None:
+      self._request = HttpRequest(self._json['request'])
     return self._request
 
   # Get the response status code.
@@ -1001,6 +1988,7 @@ class HttpResponse:
   def code(self, data: int):
     if isinstance(data, int) and data >= 100 and data <= 600:
       self._code = data
+      self._change('code')
     else:
       raise Exception('Response code must be a int (100 - 600).')
 
@@ -1017,68 +2005,626 @@ class HttpResponse:
   # Get the response headers.
   @property
   def headers(self) -> HttpHeaders:
+    if self._headers is None:
+      self._headers = HttpHeaders(self._json.get('headers'))
     return self._headers
 
   # Set the response headers.
   @headers.setter
   def headers(self, data: Union[List[str], List[Tuple[str, str]], Dict[str, str]]):
     self._headers = HttpHeaders.of(data)
+    self._change('headers')
 
   # Set the response trailers. Note that the implementation of this function is incomplete, please do not use it.
   @property
   def trailers(self) -> HttpHeaders:
+    if self._trailers is None:
+      self._trailers = HttpHeaders(self._json.get('trailers'))
     return self._trailers
 
   # Get the response trailers. Note that the implementation of this function is incomplete, please do not use it.
   @trailers.setter
   def trailers(self, data: Union[List[str], List[Tuple[str, str]], Dict[str, str]]):
     self._trailers = HttpHeaders.of(data)
+    self._change('trailers')
 
   # Get the response body.
   @property
   def body(self) -> HttpBody:
+    if self._body is None:
+      self._body = HttpBody.parse(self._json.get('body'))
     return self._body
 
   # Set the response body.
   @body.setter
   def body(self, data: Union[str, bytes, dict, HttpBody]):
     self._body = HttpBody.of(data)
+    self._change('body')
 
   # Get the response content type from headers.
   @property
   def contentType(self) -> Union[str, None]:
-    return self._headers['content-type']
+    return self.headers['content-type']
 
   # Set the response content type to headers.
   @contentType.setter
   def contentType(self, value: str):
-    self._headers['content-type'] = value
+    self.headers['content-type'] = value
 
   # Get the response mime type from headers.
   @property
   def mime(self) -> Union[str, None]:
-    contentType = self._headers['content-type']
+    contentType = self.headers['content-type']
     if contentType == None:
       return None
-    message = EmailMessage()
-    message.add_header('content-type', contentType)
-    return message.get_content_type()
+    mime = _parseHeaderParams(contentType)[0]
+    # Same as `EmailMessage.get_content_type`, the invalid types fallback to the default one.
+    return mime if mime.count('/') == 1 else 'text/plain'
 
-  # Serialize the response fields to a dict.
-  def serialize(self) -> dict:
+  # Whether any field of the response has been changed.
+  @property
+  def modified(self) -> bool:
+    return self.mod != 0 or _isModified(self._headers) or _isModified(self._body) or \
+      _isModified(self._trailers) or _isModified(self._request)
+
+  def _change(self, field: str):
+    self._changes.add(field)
+    self.mod += 1
+
+  # Serialize the response fields to a dict, see `HttpBody.serialize` for inline.
+  def serialize(self, inline: bool = False) -> dict:
     return {
-      'request': self._request.serialize(),
+      'request': self.request.serialize(inline),
       'code': self.code,
       'message': self._message,
       'protocol': self._protocol,
-      'headers': self._headers.serialize(),
-      'body': self._body.serialize(),
-      'trailers': self._trailers.serialize(),
+      'headers': self.headers.serialize(),
+      'body': self.body.serialize(inline),
+      'trailers': self.trailers.serialize(),
+    }
+
+  # Serialize the changed response fields to a dict, the unchanged fields are omitted.
+  def serializeDelta(self, inline: bool = False) -> dict:
+    fields = {}
+    if _isModified(self._request):
+      fields['request'] = self._request.serializeDelta(inline)
+    if 'code' in self._changes:
+      fields['code'] = self._code
+    if 'headers' in self._changes or _isModified(self._headers):
+      fields['headers'] = self._headers.serialize()
+    if 'body' in self._changes or _isModified(self._body):
+      fields['body'] = self._body.serialize(inline)
+    if 'trailers' in self._changes or _isModified(self._trailers):
+      fields['trailers'] = self._trailers.serialize()
+    return fields
+
+  def toJson(self) -> str:
+    return json.dumps(self.serialize())
+
+# The capabilities of the addon, declared by the `manifest` of the addons module. The host reads it
+# with `python main.py manifest`, so that the messages which are not matched are not sent to the
+# script, and the bodies which are not needed are not serialized:
+#
+#   manifest = AddonManifest(
+#     hosts = ['reqable.com', '*.reqable.com'],
+#     paths = ['/api/*'],
+#     methods = ['GET', 'POST'],
+#     hooks = ['onRequest'],
+#     requestBody = False,
+#     responseBody = False,
+#   )
+#
+# The filters are glob patterns, `*` matches any characters and an empty filter matches all. The
+# hosts are matched ignoring the case, and the paths are matched without the query string.
+class AddonManifest:
+  hookNames = ('onRequest', 'onResponse')
+
+  def __init__(self, hosts: List[str] = None, paths: List[str] = None, methods: List[str] = None,
+      hooks: List[str] = None, requestBody: bool = True, responseBody: bool = True):
+    self._hosts = AddonManifest._strings('hosts', hosts)
+    self._paths = AddonManifest._strings('paths', paths)
+    self._methods = [method.upper() for method in AddonManifest._strings('methods', methods)]
+    self._hooks = AddonManifest._strings('hooks', AddonManifest.hookNames if hooks is None else hooks)
+    for hook in self._hooks:
+      if hook not in AddonManifest.hookNames:
+        raise Exception(f'Unexpected manifest hook {hook}')
+    if not isinstance(requestBody, bool) or not isinstance(responseBody, bool):
+      raise Exception('The manifest requestBody and responseBody must be bool')
+    self._requestBody = requestBody
+    self._responseBody = responseBody
+    self._hostPattern = AddonManifest._compile(self._hosts, True)
+    self._pathPattern = AddonManifest._compile(self._paths, False)
+    self._methodSet = frozenset(self._methods)
+
+  # Parse the manifest from a dict, the keys are the same as the constructor arguments.
+  @classmethod
+  def parse(cls, manifest: dict) -> 'AddonManifest':
+    if not isinstance(manifest, dict):
+      raise Exception('The manifest must be a dict')
+    for key in manifest:
+      if key not in ('hosts', 'paths', 'methods', 'hooks', 'requestBody', 'responseBody'):
+        raise Exception(f'Unexpected manifest field {key}')
+    return cls(**manifest)
+
+  @staticmethod
+  def _strings(name: str, values) -> List[str]:
+    if values is None:
+      return []
+    if isinstance(values, str):
+      values = [values]
+    if not isinstance(values, (list, tuple)) or not all(isinstance(value, str) and value for value in values):
+      raise Exception(f'The manifest {name} must be a list of non-empty strings')
+    return list(values)
+
+  # Compile the glob patterns to one regular expression, returns None if there is no pattern.
+  @staticmethod
+  def _compile(patterns: List[str], ignoreCase: bool):
+    if not patterns:
+      return None
+    import re
+    pattern = '|'.join('.*'.join(re.escape(part) for part in glob.split('*')) for glob in patterns)
+    return re.compile(f'(?:{pattern})\\Z', re.IGNORECASE if ignoreCase else 0)
+
+  # The host patterns, empty matches all hosts.
+  @property
+  def hosts(self) -> List[str]:
+    return list(self._hosts)
+
+  # The path patterns, empty matches all paths.
+  @property
+  def paths(self) -> List[str]:
+    return list(self._paths)
+
+  # The uppercase methods, empty matches all methods.
+  @property
+  def methods(self) -> List[str]:
+    return list(self._methods)
+
+  # The implemented hooks, `onRequest` and `onResponse`.
+  @property
+  def hooks(self) -> List[str]:
+    return list(self._hooks)
+
+  # Whether the request body is needed.
+  @property
+  def requestBody(self) -> bool:
+    return self._requestBody
+
+  # Whether the response body is needed.
+  @property
+  def responseBody(self) -> bool:
+    return self._responseBody
+
+  # Determine whether the hook should be called with the message of the host, method and path.
+  # The path may contain the query string.
+  def matches(self, hook: str, host: str, method: str, path: str) -> bool:
+    if hook not in self._hooks:
+      return False
+    if self._methodSet and (method or '').upper() not in self._methodSet:
+      return False
+    if self._hostPattern is not None and self._hostPattern.match(host or '') is None:
+      return False
+    if self._pathPattern is not None:
+      path = path or ''
+      end = path.find('?')
+      if end >= 0:
+        path = path[:end]
+      if self._pathPattern.match(path) is None:
+        return False
+    return True
+
+  # Serialize the manifest to a dict.
+  def serialize(self) -> dict:
+    return {
+      'hosts': self.hosts,
+      'paths': self.paths,
+      'methods': self.methods,
+      'hooks': self.hooks,
+      'requestBody': self._requestBody,
+      'responseBody': self._responseBody,
     }
 
   def toJson(self) -> str:
     return json.dumps(self.serialize())
 
+# The path segment trie of the routes.
+class _PathNode:
+  def __init__(self):
+    self.children = {}
+    # The node of the `*` segment.
+    self.star = None
+    # The handlers of the routes ending at this node, and of the trailing `**`, keyed by the
+    # uppercase method or None for any method.
+    self.handlers = None
+    self.rest = None
+
+  def insert(self, segments: List[str], method, handler):
+    node = self
+    for i, segment in enumerate(segments):
+      if segment == '**':
+        if i != len(segments) - 1:
+          raise Exception('The route path ** must be the last segment')
+        if node.rest is None:
+          node.rest = {}
+        handlers = node.rest
+        break
+      if segment == '*':
+        if node.star is None:
+          node.star = _PathNode()
+        node = node.star
+      else:
+        child = node.children.get(segment)
+        if child is None:
+          child = node.children[segment] = _PathNode()
+        node = child
+    else:
+      if node.handlers is None:
+        node.handlers = {}
+      handlers = node.handlers
+    if method in handlers:
+      raise Exception('Duplicated route ' + '/' + '/'.join(segments) + ' ' + (method or '*'))
+    handlers[method] = handler
+
+  # Find the handler of the most specific route, the literal segments are tried before `*` and
+  # `**` at every level.
+  def match(self, segments: List[str], i: int, method: str):
+    if i == len(segments):
+      handler = _PathNode._pick(self.handlers, method)
+      if handler is not None:
+        return handler
+    else:
+      child = self.children.get(segments[i])
+      if child is not None:
+        handler = child.match(segments, i + 1, method)
+        if handler is not None:
+          return handler
+      if self.star is not None:
+        handler = self.star.match(segments, i + 1, method)
+        if handler is not None:
+          return handler
+    return _PathNode._pick(self.rest, method)
+
+  # Collect the handlers of all the matched routes, the more specific ones first.
+  def collect(self, segments: List[str], i: int, method: str, handlers: list):
+    if i == len(segments):
+      _PathNode._pickAll(self.handlers, method, handlers)
+    else:
+      child = self.children.get(segments[i])
+      if child is not None:
+        child.collect(segments, i + 1, method, handlers)
+      if self.star is not None:
+        self.star.collect(segments, i + 1, method, handlers)
+    _PathNode._pickAll(self.rest, method, handlers)
+
+  @staticmethod
+  def _pick(handlers: dict, method: str):
+    if handlers is None:
+      return None
+    handler = handlers.get(method)
+    return handlers.get(None) if handler is None else handler
+
+  @staticmethod
+  def _pickAll(handlers: dict, method: str, values: list):
+    if handlers is None:
+      return
+    handler = handlers.get(method)
+    if handler is not None:
+      values.append(handler)
+    handler = handlers.get(None)
+    if handler is not None:
+      values.append(handler)
+
+# The reversed host label trie of the routes, every node has the path tries of the routes of the
+# exact host and of the `*.` wildcard host.
+class _HostNode:
+  def __init__(self):
+    self.children = {}
+    self.exact = None
+    self.wildcard = None
+
+# Dispatch the messages to the handlers by the host, path and method, the routes are compiled to a
+# host label trie and path segment tries, so the cost is independent of the count of the routes.
+#
+#   router = Router()
+#
+#   @router.route(host = '*.reqable.com', path = '/api/users/*', method = 'POST')
+#   def onUsers(context, request):
+#     return request
+#
+#   def onRequest(context, request):
+#     return router.dispatch(context, request)
+#
+# The host is an exact host, or `*.` followed by a domain to match all of its subdomains. The path
+# is matched by segments without the query string, a `*` segment matches any one segment and a
+# trailing `**` segment matches the rest segments. The host, path or method is None to match any.
+# The most specific route is dispatched: the exact host before the deeper wildcard hosts before
+# any host, then the literal path segments before `*` before `**`, then the method before any.
+class Router:
+  def __init__(self):
+    self._hosts = _HostNode()
+    self._anyHost = _PathNode()
+    self._count = 0
+
+  def __len__(self):
+    return self._count
+
+  # Returns a decorator to add the route of the handler, the handler is called with the context
+  # and the message, it returns the message or a new message like the addon hooks.
+  def route(self, host: str = None, path: str = None, method: Union[str, List[str]] = None):
+    def decorator(handler):
+      self.add(handler, host, path, method)
+      return handler
+    return decorator
+
+  # Add the route of the handler, the methods can be a list.
+  def add(self, handler, host: str = None, path: str = None, method: Union[str, List[str]] = None):
+    if not callable(handler):
+      raise Exception('The route handler must be callable')
+    self._insert(handler, host, path, method)
+
+  def _insert(self, handler, host: str, path: str, method: Union[str, List[str]]):
+    methods = method if isinstance(method, (list, tuple)) else [method]
+    segments = ['**'] if path is None else Router._segments(path)
+    paths = self._pathNode(host)
+    for method in methods:
+      if method is not None and (not isinstance(method, str) or method == ''):
+        raise Exception('The route method must be a non-empty string')
+      paths.insert(segments, None if method in (None, '*') else method.upper(), handler)
+      self._count += 1
+
+  def _pathNode(self, host: str) -> _PathNode:
+    if host is None or host == '*':
+      return self._anyHost
+    if not isinstance(host, str) or host == '':
+      raise Exception('The route host must be a non-empty string')
+    wildcard = host.startswith('*.')
+    labels = (host[2:] if wildcard else host).lower().split('.')
+    if '' in labels or any('*' in label for label in labels):
+      raise Exception('Unexpected route host ' + host)
+    node = self._hosts
+    for label in reversed(labels):
+      child = node.children.get(label)
+      if child is None:
+        child = node.children[label] = _HostNode()
+      node = child
+    if wildcard:
+      if node.wildcard is None:
+        node.wildcard = _PathNode()
+      return node.wildcard
+    if node.exact is None:
+      node.exact = _PathNode()
+    return node.exact
+
+  @staticmethod
+  def _segments(path: str) -> List[str]:
+    if not isinstance(path, str) or not path.startswith('/'):
+      raise Exception('The route path must start with /')
+    return path[1:].split('/')
+
+  # Find the handler of the most specific route of the host, method and path, returns None if no
+  # route is matched. The path may contain the query string.
+  def match(self, host: str, method: str, path: str):
+    segments = Router._split(path)
+    method = method.upper()
+    for paths in self._candidates(host):
+      handler = paths.match(segments, 0, method)
+      if handler is not None:
+        return handler
+    return None
+
+  # Find the handlers of all the matched routes of the host, method and path, the more specific
+  # ones first. The path may contain the query string.
+  def matchAll(self, host: str, method: str, path: str) -> list:
+    segments = Router._split(path)
+    method = method.upper()
+    handlers = []
+    for paths in self._candidates(host):
+      paths.collect(segments, 0, method, handlers)
+    return handlers
+
+  @staticmethod
+  def _split(path: str) -> List[str]:
+    end = path.find('?')
+    return (path if end < 0 else path[:end])[1:].split('/')
+
+  # The path tries of the host, the exact host first, then the deeper wildcard hosts and any host.
+  def _candidates(self, host: str) -> List[_PathNode]:
+    candidates = []
+    if host:
+      labels = host.lower().split('.')
+      node = self._hosts
+      for i in range(len(labels) - 1, -1, -1):
+        # The wildcard matches at least one more label.
+        if node.wildcard is not None:
+          candidates.append(node.wildcard)
+        node = node.children.get(labels[i])
+        if node is None:
+          break
+      else:
+        if node.exact is not None:
+          candidates.append(node.exact)
+    candidates.reverse()
+    candidates.append(self._anyHost)
+    return candidates
+
+  # Call the handler of the matched route with the context and the request or response, returns
+  # the message as it is if no route is matched.
+  def dispatch(self, context: Context, message):
+    request = message.request if isinstance(message, HttpResponse) else message
+    handler = self.match(context.host, request.method, request.path)
+    if handler is None:
+      return message
+    return handler(context, message)
+
+# The default router, so that the addon can use `@route(...)` and `router.dispatch`.
+router = Router()
+route = router.route
+
+# The declarative rules to rewrite the messages without the addon code. The rules are compiled to
+# the `Router` tries once, and all the matched rules of a message are applied in the order of the
+# rules, so the cost depends on the matched rules rather than all the rules:
+#
+#   {
+#     "rules": [
+#       {
+#         "hook": "request",
+#         "host": "*.reqable.com",
+#         "path": "/api/**",
+#         "method": ["GET", "POST"],
+#         "actions": [
+#           {"type": "setHeader", "name": "x-foo", "value": "bar"},
+#           {"type": "removeHeader", "name": "x-bar"},
+#           {"type": "rewriteHost", "host": "staging.reqable.com"},
+#           {"type": "addQuery", "name": "debug", "value": "1"},
+#           {"type": "replaceBody", "old": "foo", "new": "bar"}
+#         ]
+#       }
+#     ]
+#   }
+#
+# The hook is `request` (default) or `response`, the host, path and method are the same as the
+# `Router` routes and match any if omitted. The `rewriteHost` and `addQuery` actions are request
+# only. The consecutive `replaceBody` actions of a rule are applied in one scan by
+# `HttpBody.replaceAll`, so the replaced content is not replaced again. The engine can be the addon
+# hooks, or be applied in the hooks:
+#
+#   rules = RuleEngine.load('rules.json')
+#   onRequest = rules.onRequest
+#   onResponse = rules.onResponse
+class RuleEngine:
+  def __init__(self, rules: Union[dict, List[dict]]):
+    if isinstance(rules, dict):
+      rules = rules.get('rules')
+    if not isinstance(rules, list):
+      raise Exception('The rules must be a list')
+    self._routers = {
+      'request': Router(),
+      'response': Router(),
+    }
+    self._count = len(rules)
+    # The rules of the same route share one trie entry.
+    groups = {}
+    for index, rule in enumerate(rules):
+      if not isinstance(rule, dict):
+        raise Exception(f'The rule {index} must be a dict')
+      hook = rule.get('hook', 'request')
+      if hook not in self._routers:
+        raise Exception(f'Unexpected hook of the rule {index}')
+      actions = rule.get('actions')
+      if not isinstance(actions, list):
+        raise Exception(f'The actions of the rule {index} must be a list')
+      compiled = []
+      for action in actions:
+        action = RuleEngine._compileAction(index, hook, action)
+        # The consecutive body replacements are applied in one scan.
+        if compiled and hasattr(action, 'replacements') and hasattr(compiled[-1], 'replacements'):
+          compiled[-1].replacements.update(action.replacements)
+        else:
+          compiled.append(action)
+      actions = compiled
+      # The equivalent routes are normalized to the same key.
+      host = rule.get('host')
+      host = None if host == '*' else host
+      path = rule.get('path')
+      path = '/**' if path is None else path
+      methods = rule.get('method')
+      methods = methods if isinstance(methods, (list, tuple)) else [methods]
+      for method in methods:
+        if method is not None and not isinstance(method, str):
+          raise Exception(f'The method of the rule {index} must be a string')
+      methods = [None if method in (None, '*') else method.upper() for method in methods]
+      # A rule is added to a route once, the any method covers the others.
+      methods = [None] if None in methods else list(dict.fromkeys(methods))
+      for method in methods:
+        key = (hook, host.lower() if isinstance(host, str) else host, path, method)
+        group = groups.get(key)
+        if group is None:
+          group = groups[key] = []
+          try:
+            self._routers[hook]._insert(group, host, path, method)
+          except Exception as e:
+            raise Exception(f'Invalid route of the rule {index}: {e}')
+        group.append((index, actions))
+
+  # Load the rules from the JSON file.
+  @classmethod
+  def load(cls, path: str) -> 'RuleEngine':
+    with open(path, 'r', encoding='UTF-8') as content:
+      return cls(json.load(content))
+
+  def __len__(self):
+    return self._count
+
+  @staticmethod
+  def _compileAction(index: int, hook: str, action: dict):
+    def field(name: str) -> str:
+      value = action.get(name)
+      if not isinstance(value, str):
+        raise Exception(f'The {name} of the {type} action of the rule {index} must be a string')
+      return value
+    type = action.get('type') if isinstance(action, dict) else None
+    if type == 'setHeader':
+      name = field('name')
+      value = field('value')
+      def setHeader(message):
+        message.headers[name] = value
+      return setHeader
+    if type == 'removeHeader':
+      name = field('name')
+      def removeHeader(message):
+        message.headers.remove(name)
+      return removeHeader
+    if type == 'replaceBody':
+      replacements = {field('old'): field('new')}
+      def replaceBody(message):
+        message.body.replaceAll(replacements)
+      replaceBody.replacements = replacements
+      return replaceBody
+    if type in ('rewriteHost', 'addQuery') and hook != 'request':
+      raise Exception(f'The {type} action of the rule {index} is request only')
+    if type == 'rewriteHost':
+      host = field('host')
+      def rewriteHost(request):
+        # The HTTP/2 and HTTP/3 requests carry the host in the `:authority` pseudo header.
+        if request.headers[':authority'] is not None:
+          request.headers[':authority'] = host
+        else:
+          request.headers['host'] = host
+      return rewriteHost
+    if type == 'addQuery':
+      name = field('name')
+      value = field('value')
+      def addQuery(request):
+        request.queries.add(name, value)
+      return addQuery
+    raise Exception(f'Unexpected action {type} of the rule {index}')
+
+  # Apply all the matched rules to the request or response in the order of the rules, returns the
+  # message.
+  def apply(self, context: Context, message):
+    if isinstance(message, HttpResponse):
+      groups = self._routers['response'].matchAll(context.host, message.request.method, message.request.path)
+    else:
+      groups = self._routers['request'].matchAll(context.host, message.method, message.path)
+    if not groups:
+      return message
+    if len(groups) == 1:
+      rules = groups[0]
+    else:
+      # A rule is applied once even if it is in more than one of the matched groups.
+      rules = {rule[0]: rule for group in groups for rule in group}
+      rules = [rules[index] for index in sorted(rules)]
+    for _, actions in rules:
+      for action in actions:
+        action(message)
+    return message
+
+  def onRequest(self, context: Context, request):
+    return self.apply(context, request)
+
+  def onResponse(self, context: Context, response):
+    return self.apply(context, response)
+
 ####################################################################################################
 # Below is the legacy classes, they are deprecated and will be removed in the future.
 ####################################################################################################
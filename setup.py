@@ -18,5 +18,5 @@ setuptools.setup(
 		"License :: OSI Approved :: MIT License",
 		"Operating System :: OS Independent",
 	],
-	python_requires=">=3.6"
+	python_requires=">=3.8"
 )
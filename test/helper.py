@@ -0,0 +1,50 @@
+import io
+import os
+import json
+import main
+
+# The shared fixtures of the tests, run the tests from this directory.
+
+def load(path):
+  with open(path, 'r', encoding='UTF-8') as content:
+    return json.load(content)
+
+# Encode the job frames to a stream which is ready to read, the bytes are written as the raw
+# payloads of the frames.
+def frames(*jobs):
+  stream = io.BytesIO()
+  for job in jobs:
+    if isinstance(job, bytes):
+      stream.write(main._frameHeader.pack(len(job)) + job)
+    else:
+      main.writeFrame(stream, job)
+  stream.seek(0)
+  return stream
+
+# Read all the frames from the beginning of the stream.
+def readFrames(stream) -> list:
+  stream.seek(0)
+  frames = []
+  while True:
+    frame = main.readFrame(stream)
+    if frame is None:
+      return frames
+    frames.append(frame)
+
+# Process the jobs with the channel handler, returns the result frames.
+def serveJobs(handler, jobs) -> list:
+  writer = io.BytesIO()
+  handler(frames(*jobs), writer)
+  return readFrames(writer)
+
+# Process the jobs with the worker pool through a pipe, returns the result frames.
+def servePool(pool, jobs) -> list:
+  read, write = os.pipe()
+  os.write(write, frames(*jobs).getvalue())
+  os.close(write)
+  writer = io.BytesIO()
+  try:
+    pool.serve(read, writer)
+  finally:
+    os.close(read)
+  return readFrames(writer)
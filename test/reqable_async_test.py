@@ -0,0 +1,79 @@
+import unittest
+import asyncio
+import os
+import json
+import time
+import main
+from helper import load, serveJobs
+
+def _job(id, session, delay):
+  data = load('data/capture_request.json')
+  data['context']['id'] = session
+  data['request']['headers'].append('delay: ' + str(delay))
+  return {'id': id, 'type': 'request', 'data': data}
+
+class AsyncTest(unittest.TestCase):
+  def setUp(self):
+    self.onRequest = main.addons.onRequest
+    self.onResponse = main.addons.onResponse
+    self.processed = []
+    async def onRequest(context, request):
+      await asyncio.sleep(float(request.headers['delay'] or 0))
+      self.processed.append(context.id)
+      request.headers['async'] = 'true'
+      return request
+    main.addons.onRequest = onRequest
+
+  def tearDown(self):
+    main.addons.onRequest = self.onRequest
+    main.addons.onResponse = self.onResponse
+    if os.path.exists('data/capture_request.json.cb'):
+      os.remove('data/capture_request.json.cb')
+
+  def testOneShot(self):
+    main.onRequest('data/capture_request.json')
+    with open('data/capture_request.json.cb', 'r', encoding='UTF-8') as content:
+      request = json.load(content)['request']
+    self.assertEqual(request['headers'][-1], 'async: true')
+
+  def testDetectAsyncAddons(self):
+    self.assertTrue(main._isAsyncAddons())
+    self.assertEqual(main._channel(), main.serveChannelAsync)
+    main.addons.onRequest = self.onRequest
+    self.assertFalse(main._isAsyncAddons())
+    self.assertEqual(main._channel(), main.serveChannel)
+
+  def testConcurrent(self):
+    start = time.perf_counter()
+    frames = serveJobs(main.serveChannelAsync, [
+      _job(0, 0, 0.3),
+      _job(1, 1, 0.2),
+      _job(2, 2, 0.1),
+    ])
+    self.assertLess(time.perf_counter() - start, 0.55)
+    self.assertEqual([frame['id'] for frame in frames], [2, 1, 0])
+    for frame in frames:
+      self.assertEqual(frame['result']['request']['headers'][-1], 'async: true')
+
+  def testSessionOrder(self):
+    frames = serveJobs(main.serveChannelAsync, [
+      _job(0, 7, 0.2),
+      _job(1, 8, 0.1),
+      _job(2, 7, 0),
+    ])
+    self.assertEqual([frame['id'] for frame in frames], [1, 0, 2])
+    self.assertEqual(self.processed, [8, 7, 7])
+
+  def testSyncHooks(self):
+    main.addons.onRequest = self.onRequest
+    frames = serveJobs(main.serveChannelAsync, [_job(0, 0, 0), _job(1, 1, 0)])
+    self.assertEqual([frame['id'] for frame in frames], [0, 1])
+    self.assertEqual(frames[0]['result']['request']['headers'][-1], 'delay: 0')
+
+  def testInvalidFrame(self):
+    frames = serveJobs(main.serveChannelAsync, [b'{not json', _job(1, 1, 0)])
+    self.assertEqual([frame['id'] for frame in frames], [None, 1])
+    self.assertTrue(frames[0]['error'].startswith('Invalid frame: '))
+
+if __name__ == '__main__':
+  unittest.main()
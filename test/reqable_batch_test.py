@@ -0,0 +1,67 @@
+import unittest
+import os
+import json
+import shutil
+import tempfile
+import main
+from helper import load
+
+class BatchTest(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    for i in range(3):
+      shutil.copy('data/capture_request.json', os.path.join(self.directory, f'request-{i}.json'))
+    shutil.copy('data/capture_response.json', os.path.join(self.directory, 'response.json'))
+    with open(os.path.join(self.directory, 'readme.txt'), 'w') as file:
+      file.write('Not a capture')
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+    for name in os.listdir('.'):
+      if name.startswith('tmp-'):
+        os.remove(name)
+
+  def testDirectory(self):
+    main.batch([self.directory])
+    for i in range(3):
+      callback = load(os.path.join(self.directory, f'request-{i}.json.cb'))
+      self.assertEqual(callback['request'], load('data/capture_request.json')['request'])
+    callback = load(os.path.join(self.directory, 'response.json.cb'))
+    self.assertEqual(callback['response']['code'], 200)
+    self.assertFalse(os.path.exists(os.path.join(self.directory, 'readme.txt.cb')))
+
+    # The callback files are not processed again.
+    self.assertEqual(main.runBatch(main._captures(self.directory)), (4, 0))
+
+  def testGlob(self):
+    self.assertEqual(main.runBatch(main._captures(os.path.join(self.directory, 'request-*'))), (3, 0))
+    self.assertEqual(main.runBatch(main._captures(os.path.join(self.directory, 'request-*'))), (3, 0))
+    self.assertFalse(os.path.exists(os.path.join(self.directory, 'response.json.cb')))
+
+  def testOutput(self):
+    output = os.path.join(self.directory, 'results.jsonl')
+    main.batch([os.path.join(self.directory, 'request-*'), '--output', output])
+    with open(output, 'r', encoding='UTF-8') as reader:
+      results = [json.loads(line) for line in reader]
+    self.assertEqual(sorted(result['source'] for result in results),
+      [os.path.join(self.directory, f'request-{i}.json') for i in range(3)])
+    for result in results:
+      self.assertEqual(result['result']['request']['method'], 'POST')
+
+  def testJsonl(self):
+    source = os.path.join(self.directory, 'captures.jsonl')
+    with open(source, 'w', encoding='UTF-8') as writer:
+      writer.write(json.dumps(load('data/capture_request.json')) + '\n')
+      writer.write('\n')
+      writer.write('{"broken": \n')
+      writer.write(json.dumps(load('data/capture_response.json')) + '\n')
+    main.batch([source])
+    with open(source + '.cb', 'r', encoding='UTF-8') as reader:
+      results = [json.loads(line) for line in reader]
+    self.assertEqual([result['source'] for result in results], [1, 3, 4])
+    self.assertEqual(results[0]['result']['request']['method'], 'POST')
+    self.assertTrue('error' in results[1])
+    self.assertEqual(results[2]['result']['response']['code'], 200)
+
+if __name__ == '__main__':
+  unittest.main()
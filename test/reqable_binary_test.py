@@ -0,0 +1,132 @@
+import unittest
+import os
+import main
+
+from reqable import BinaryCodec, CaptureHttpRequest, CaptureHttpResponse
+from helper import load, serveJobs
+
+def _plain(value):
+  if isinstance(value, memoryview):
+    return bytes(value)
+  if isinstance(value, list):
+    return [_plain(item) for item in value]
+  if isinstance(value, dict):
+    return {key: _plain(item) for key, item in value.items()}
+  return value
+
+class BinaryCodecTest(unittest.TestCase):
+  def testRoundTrip(self):
+    value = {
+      'none': None,
+      'bool': [True, False],
+      'int': [0, -1, 1 << 62, -(1 << 63), 1 << 64, -(1 << 80)],
+      'float': 3.5,
+      'text': '脚本 "quoted" \\ \n',
+      'bytes': b'\x00\x01\xff',
+      'nested': [{'a': []}, {}],
+    }
+    data = BinaryCodec.encode(value)
+    decoded = BinaryCodec.decode(data)
+    self.assertIsInstance(decoded['bytes'], memoryview)
+    self.assertTrue(decoded['bytes'].readonly)
+    self.assertEqual(_plain(decoded), value)
+    self.assertEqual(BinaryCodec.decode(bytearray(data))['text'], value['text'])
+
+  def testRawBytes(self):
+    payload = bytes(range(256)) * 16
+    data = BinaryCodec.encode({'payload': payload})
+    # The bytes are not escaped or encoded.
+    self.assertEqual(len(data), 1 + 4 + 4 + len('payload') + 1 + 4 + len(payload))
+    self.assertTrue(payload in data)
+    buffer = bytearray(b'head')
+    BinaryCodec.encodeInto(buffer, {'payload': payload})
+    self.assertEqual(buffer, b'head' + data)
+
+  def testPeek(self):
+    data = BinaryCodec.encode({
+      'data': {'body': b'\x00' * 1024, 'headers': ['a: 1', 'b: 2'], 'code': [1.5, None, True, 1 << 64]},
+      'id': 7,
+      'session': '脚本',
+      'type': 'request',
+    })
+    self.assertEqual(BinaryCodec.peek(data, ('id', 'session')), {'id': 7, 'session': '脚本'})
+    self.assertEqual(BinaryCodec.peek(data, ('id', 'missing')), {'id': 7})
+    self.assertRaises(Exception, BinaryCodec.peek, BinaryCodec.encode([]), ('id', ))
+
+  def testInvalid(self):
+    self.assertRaises(Exception, BinaryCodec.encode, {1: 'foo'})
+    self.assertRaises(Exception, BinaryCodec.encode, object())
+    data = BinaryCodec.encode({'foo': b'bar'})
+    self.assertRaises(Exception, BinaryCodec.decode, data[:-1])
+    self.assertRaises(Exception, BinaryCodec.decode, data + b'\x00')
+    self.assertRaises(Exception, BinaryCodec.decode, b'\xff')
+
+class BinarySerializeTest(unittest.TestCase):
+  def tearDown(self):
+    main.binaryProtocol = False
+    for name in os.listdir('.'):
+      if name.startswith('tmp-'):
+        os.remove(name)
+
+  def testRequest(self):
+    data = load('data/capture_request.json')['request']
+    request = CaptureHttpRequest(BinaryCodec.decode(BinaryCodec.encode(data)))
+    self.assertEqual(request.serialize(True), data)
+
+    data['body'] = {
+      'type': 2,
+      'payload': b'\x00\x01\x02\xff',
+    }
+    request = CaptureHttpRequest(BinaryCodec.decode(BinaryCodec.encode(data)))
+    self.assertEqual(request.body.payload, b'\x00\x01\x02\xff')
+    self.assertEqual(_plain(request.serialize(True)), data)
+    request.body = b'\x03\x04'
+    self.assertEqual(_plain(request.serializeDelta(True)), {
+      'body': {
+        'type': 2,
+        'payload': b'\x03\x04',
+      },
+    })
+    self.assertEqual([name for name in os.listdir('.') if name.startswith('tmp-')], [])
+
+  def testResponse(self):
+    data = load('data/capture_response.json')['response']
+    response = CaptureHttpResponse(BinaryCodec.decode(BinaryCodec.encode(data)))
+    # The unchanged body file is passed through.
+    self.assertEqual(response.serialize(True), data)
+
+    response.body = b'\xff' * 1024
+    response.request.body = b'\x00'
+    serialized = response.serialize(True)
+    self.assertEqual(bytes(serialized['body']['payload']), b'\xff' * 1024)
+    self.assertEqual(bytes(serialized['request']['body']['payload']), b'\x00')
+    self.assertEqual(_plain(BinaryCodec.decode(BinaryCodec.encode(serialized))), _plain(serialized))
+
+  def testServe(self):
+    main.binaryProtocol = True
+    data = load('data/capture_request.json')
+    data['request']['body'] = {
+      'type': 2,
+      'payload': b'\x00\x01\x02',
+    }
+    onRequest = main.addons.onRequest
+    def reverse(context, request):
+      request.body = bytes(reversed(request.body.payload))
+      return request
+    main.addons.onRequest = reverse
+    try:
+      results = serveJobs(main.serveChannel, [{'id': 1, 'type': 'request', 'data': data}])
+    finally:
+      main.addons.onRequest = onRequest
+    self.assertEqual([frame['id'] for frame in results], [1])
+    self.assertEqual(bytes(results[0]['result']['request']['body']['payload']), b'\x02\x01\x00')
+    self.assertEqual([name for name in os.listdir('.') if name.startswith('tmp-')], [])
+
+  def testEncodeFrame(self):
+    main.binaryProtocol = True
+    frame = main.encodeFrame({'id': 1, 'result': {'body': b'\x00' * 1024}})
+    self.assertEqual(int.from_bytes(frame[:4], 'big'), len(frame) - 4)
+    self.assertEqual(bytes(BinaryCodec.decode(frame[4:])['result']['body']), b'\x00' * 1024)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -1,4 +1,6 @@
 import unittest
+import hashlib
+import os
 
 from reqable import CaptureHttpBody, CaptureHttpMultipartBody
 
@@ -114,6 +116,39 @@ class HttpBodyTest(unittest.TestCase):
     })
 
 
+  def testHttpBodyReplaceAll(self):
+    body = CaptureHttpBody.of('foo bar foobar baz')
+    self.assertEqual(body.replaceAll({}), 0)
+    self.assertFalse(body.modified)
+    # The longest key wins and the replaced content is not replaced again.
+    self.assertEqual(body.replaceAll({'foo': 'bar', 'bar': 'baz', 'foobar': 'qux'}), 3)
+    self.assertEqual(body.payload, 'bar baz qux baz')
+    self.assertTrue(body.modified)
+    self.assertEqual(body.replaceAll({'none': 'x'}), 0)
+    self.assertEqual(body.replaceAll({'a.': '!'}), 0)
+    self.assertRaises(Exception, body.replaceAll, {'': 'x'})
+    self.assertRaises(Exception, body.replaceAll, {b'bar': b'x'})
+
+    body = CaptureHttpBody.parse({
+      'type': 2,
+      'payload': 'data/body_binary.bin'
+    })
+    self.assertEqual(body.replaceAll({b'PNG': b'JPEG', '\x1a': bytearray(b'\x00')}), 2)
+    self.assertEqual(body.payload, b'\x89JPEG\x0D\x0A\x00\x0A')
+    body.writeFile('data/body_binary.bin.copy')
+    with open('data/body_binary.bin.copy', 'rb') as file:
+      self.assertEqual(file.read(), b'\x89JPEG\x0D\x0A\x00\x0A')
+    os.remove('data/body_binary.bin.copy')
+    with open('data/body_binary.bin', 'rb') as file:
+      self.assertEqual(file.read(), b'\x89\x50\x4E\x47\x0D\x0A\x1A\x0A')
+
+    body = CaptureHttpBody.of(b'abcabc')
+    # The payload is copied to a bytearray.
+    body[0] = ord('a')
+    self.assertEqual(body.replaceAll({b'b': b'', b'c': b'C'}), 4)
+    self.assertEqual(body.payload, b'aCaC')
+
+
   def testHttpBodyJson(self):
     body = CaptureHttpBody.of({"foo":"bar","abc":123,"hello":"world"})
     body.jsonify()
@@ -154,6 +189,73 @@ class HttpBodyTest(unittest.TestCase):
     # TODO test serialize
 
 
+  def testHttpBodyBinaryMapped(self):
+    body = CaptureHttpBody.parse({
+      'type': 2,
+      'payload': 'data/body_binary.bin'
+    })
+    self.assertEqual(len(body), 8)
+    self.assertEqual(body[0], 0x89)
+    self.assertEqual(body[-1], 0x0A)
+    self.assertTrue(isinstance(body[1:4], memoryview))
+    self.assertEqual(body[1:4], b'PNG')
+    self.assertEqual(list(body), list(b'\x89\x50\x4E\x47\x0D\x0A\x1A\x0A'))
+    self.assertEqual(hashlib.md5(body.buffer).hexdigest(),
+      hashlib.md5(b'\x89\x50\x4E\x47\x0D\x0A\x1A\x0A').hexdigest())
+    self.assertRaises(TypeError, body.buffer.__setitem__, 0, 0)
+    body.writeFile('data/body_binary.bin.copy')
+    with open('data/body_binary.bin.copy', 'rb') as file:
+      self.assertEqual(file.read(), b'\x89\x50\x4E\x47\x0D\x0A\x1A\x0A')
+    os.remove('data/body_binary.bin.copy')
+    self.assertFalse(body.modified)
+
+    body[0] = 0x00
+    self.assertTrue(body.modified)
+    self.assertEqual(body.payload, b'\x00\x50\x4E\x47\x0D\x0A\x1A\x0A')
+    with open('data/body_binary.bin', 'rb') as file:
+      self.assertEqual(file.read(), b'\x89\x50\x4E\x47\x0D\x0A\x1A\x0A')
+
+    body = CaptureHttpBody()
+    body.binary('data/body_binary.bin')
+    self.assertEqual(str(body), str(b'\x89\x50\x4E\x47\x0D\x0A\x1A\x0A'))
+
+
+  def testHttpBodyBinarySerialize(self):
+    # The unmodified body is passed through.
+    body = CaptureHttpBody.parse({
+      'type': 2,
+      'payload': 'data/body_binary.bin'
+    })
+    self.assertEqual(body[0], 0x89)
+    self.assertEqual(body.payload, b'\x89\x50\x4E\x47\x0D\x0A\x1A\x0A')
+    self.assertEqual(body.serialize(), {
+      'type': 2,
+      'payload': 'data/body_binary.bin'
+    })
+
+    # The modified body is written to a new file.
+    body[0] = 0x00
+    payload = body.serialize()['payload']
+    self.assertNotEqual(payload, 'data/body_binary.bin')
+    with open(payload, 'rb') as file:
+      self.assertEqual(file.read(), b'\x00\x50\x4E\x47\x0D\x0A\x1A\x0A')
+    os.remove(payload)
+
+    # The file not provided by the host is copied.
+    for body in [CaptureHttpBody.of(b''), CaptureHttpMultipartBody.file('data/body_binary.bin')]:
+      body.binary('data/body_binary.bin')
+      payload = CaptureHttpBody.serialize(body)['payload']
+      self.assertNotEqual(payload, 'data/body_binary.bin')
+      with open(payload, 'rb') as file:
+        self.assertEqual(file.read(), b'\x89\x50\x4E\x47\x0D\x0A\x1A\x0A')
+      os.remove(payload)
+
+    body = CaptureHttpMultipartBody.file('data/body_binary.bin')
+    payload = body.serialize()['body']['payload']
+    self.assertNotEqual(payload, 'data/body_binary.bin')
+    os.remove(payload)
+
+
   def testHttpBodyMultipart(self):
     data = {
       'type': 3,
@@ -0,0 +1,149 @@
+import unittest
+import os
+import main
+
+from reqable import CaptureContext, CaptureHttpRequest, CaptureHttpResponse, CaptureHttpMultipartBody, Highlight
+from helper import load
+
+class DeltaTest(unittest.TestCase):
+  def tearDown(self):
+    main.callbackDelta = False
+    for name in os.listdir('data'):
+      if name.endswith('.cb'):
+        os.remove(os.path.join('data', name))
+
+  def testContext(self):
+    context = CaptureContext(load('data/capture_request.json')['context'])
+    self.assertFalse(context.modified)
+    self.assertEqual(context.serializeCallback(True), {})
+    self.assertEqual(context.serializeCallback(), {
+      'env': {'foo': 'bar'},
+      'highlight': None,
+      'comment': None,
+      'shared': None,
+    })
+    context.highlight = Highlight.red
+    context.comment = 'Hello'
+    self.assertTrue(context.modified)
+    self.assertEqual(context.serializeCallback(True), {
+      'highlight': 1,
+      'comment': 'Hello',
+    })
+
+    context = CaptureContext(load('data/capture_request.json')['context'])
+    context.env['abc'] = '123'
+    self.assertTrue(context.modified)
+    self.assertEqual(context.serializeCallback(True), {
+      'env': {'foo': 'bar', 'abc': '123'},
+    })
+
+    context = CaptureContext(load('data/capture_response.json')['context'])
+    self.assertEqual(context.serializeCallback(True), {
+      'shared': {'count': 1},
+    })
+    context.shared = None
+    self.assertEqual(context.serializeCallback(True), {
+      'shared': None,
+    })
+
+  def testRequest(self):
+    request = CaptureHttpRequest(load('data/capture_request.json')['request'])
+    self.assertFalse(request.modified)
+    self.assertEqual(request.serializeDelta(), {})
+
+    self.assertEqual(request.headers['host'], 'reqable.com')
+    self.assertEqual(request.queries['page'], '1')
+    self.assertEqual(str(request.body)[0], '{')
+    self.assertFalse(request.modified)
+
+    request.headers['foo'] = 'bar'
+    self.assertTrue(request.headers.modified)
+    self.assertTrue(request.modified)
+    self.assertEqual(list(request.serializeDelta().keys()), ['headers'])
+    self.assertEqual(request.serializeDelta()['headers'][-1], 'foo: bar')
+
+    request.queries['page'] = '2'
+    self.assertEqual(request.serializeDelta()['path'], '/api/users?page=2&size=20')
+
+    request.method = 'PUT'
+    request.body.jsonify()
+    request.body['name'] = 'reqable'
+    request.trailers = ['foo: bar']
+    self.assertEqual(request.serializeDelta(), {
+      'method': 'PUT',
+      'path': '/api/users?page=2&size=20',
+      'headers': request.headers.serialize(),
+      'body': request.body.serialize(),
+      'trailers': ['foo: bar'],
+    })
+
+  def testBody(self):
+    request = CaptureHttpRequest(load('data/capture_request.json')['request'])
+    request.body.replace('megatron', 'reqable')
+    self.assertTrue(request.body.modified)
+    self.assertEqual(list(request.serializeDelta().keys()), ['body'])
+
+    request = CaptureHttpRequest(load('data/capture_request.json')['request'])
+    request.body = 'Hello World'
+    self.assertEqual(request.serializeDelta(), {
+      'body': {
+        'type': 1,
+        'payload': {
+          'text': 'Hello World',
+          'charset': 'UTF-8',
+        },
+      },
+    })
+
+    body = CaptureHttpMultipartBody.text('Hello World', name='foo')
+    self.assertFalse(body.modified)
+    body.name = 'bar'
+    self.assertTrue(body.modified)
+
+  def testResponse(self):
+    response = CaptureHttpResponse(load('data/capture_response.json')['response'])
+    self.assertFalse(response.modified)
+    self.assertEqual(response.serializeDelta(), {})
+    response.code = 404
+    response.request.headers['foo'] = 'bar'
+    self.assertTrue(response.modified)
+    delta = response.serializeDelta()
+    self.assertEqual(delta['code'], 404)
+    self.assertEqual(list(delta['request'].keys()), ['headers'])
+    self.assertFalse('body' in delta)
+
+  def testCallback(self):
+    main.callbackDelta = True
+    main.onRequest('data/capture_request.json')
+    self.assertEqual(load('data/capture_request.json.cb'), {
+      'delta': True,
+      'request': {},
+    })
+
+    main.onResponse('data/capture_response.json')
+    # The unchanged binary body is not written.
+    self.assertEqual(load('data/capture_response.json.cb'), {
+      'delta': True,
+      'response': {},
+      'shared': {'count': 1},
+    })
+
+  def testCallbackNewMessage(self):
+    main.callbackDelta = True
+    onRequest = main.addons.onRequest
+    main.addons.onRequest = lambda context, request: CaptureHttpRequest({
+      'method': 'GET',
+      'path': '/',
+      'protocol': 'h2',
+    })
+    try:
+      main.onRequest('data/capture_request.json')
+    finally:
+      main.addons.onRequest = onRequest
+    callback = load('data/capture_request.json.cb')
+    self.assertFalse('delta' in callback)
+    self.assertEqual(callback['request']['path'], '/')
+    self.assertEqual(callback['env'], {'foo': 'bar'})
+
+if __name__ == '__main__':
+  unittest.main()
@@ -187,5 +187,70 @@ class HttpHeadersTest(unittest.TestCase):
     self.assertEqual(d['abc'], '123')
     self.assertEqual(d['hello'], '')
 
+  def testHttpHeadersIndex(self):
+    headers = CaptureHttpHeaders([
+      'Foo: 1',
+      'abc: 123',
+      'foo: 2',
+      'invalid',
+      'FOO: 3',
+    ])
+    self.assertEqual(headers.index('foo'), 0)
+    self.assertEqual(headers.indexes('fOo'), [0, 2, 4])
+    self.assertEqual(headers.index('invalid'), -1)
+    self.assertEqual(headers.indexes('python'), [])
+    headers.add('Foo', '4')
+    self.assertEqual(headers.indexes('foo'), [0, 2, 4, 5])
+    headers['ABC'] = '456'
+    self.assertEqual(headers.indexes('abc'), [1])
+    headers.remove('foo')
+    self.assertEqual(headers.entries, ['ABC: 456', 'invalid'])
+    self.assertEqual(headers.index('abc'), 0)
+    headers['hello'] = 'world'
+    self.assertEqual(headers.index('hello'), 2)
+    headers.clear()
+    self.assertEqual(headers.index('abc'), -1)
+    headers['abc'] = '789'
+    self.assertEqual(headers.indexes('abc'), [0])
+
+  def testHttpHeadersIndexEntriesChanged(self):
+    headers = CaptureHttpHeaders([
+      'foo: bar',
+      'abc: 123',
+    ])
+    self.assertEqual(headers['abc'], '123')
+    headers.entries.insert(0, 'abc: 456')
+    self.assertEqual(headers.indexes('abc'), [0, 2])
+    self.assertEqual(headers['abc'], '456')
+
+  def testHttpHeadersIndexHeldEntries(self):
+    headers = CaptureHttpHeaders(['a: 1'])
+    entries = headers.entries
+    self.assertEqual(headers['a'], '1')
+    # The list held by the caller is changed after the index is built.
+    entries.append('B: 2')
+    self.assertEqual(headers['b'], '2')
+    entries[0] = 'c: 3'
+    self.assertIsNone(headers['a'])
+    self.assertEqual(headers['c'], '3')
+
+    lines = ['a: 1']
+    headers = CaptureHttpHeaders(lines)
+    self.assertEqual(headers['a'], '1')
+    lines.insert(0, 'b: 2')
+    headers.add('d', '4')
+    self.assertEqual(headers.indexes('a'), [1])
+    self.assertEqual(headers['b'], '2')
+    self.assertEqual(headers['d'], '4')
+
+  def testHttpHeadersIndexValueSeparator(self):
+    headers = CaptureHttpHeaders([
+      'foo: bar: baz',
+      'foo: qux',
+    ])
+    self.assertEqual(headers.indexes('foo'), [0, 1])
+    self.assertEqual(headers.indexes('foo: bar'), [0])
+    self.assertEqual(headers['Foo: Bar'], 'baz')
+
 if __name__ == '__main__':
   unittest.main()
\ No newline at end of file
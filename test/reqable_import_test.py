@@ -0,0 +1,47 @@
+import unittest
+import os
+import sys
+import subprocess
+
+# The cold import budget of `reqable` plus `main.py` in milliseconds.
+BUDGET = float(os.environ.get('REQABLE_IMPORT_BUDGET', '100'))
+
+# The modules that must be imported only when the feature is used.
+LAZY_MODULES = ['email', 'email.message', 'uuid', 'urllib.parse']
+
+def _run(code: str, *options) -> str:
+  process = subprocess.run([sys.executable] + list(options) + ['-c', code],
+    cwd=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'reqable'),
+    stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+  return process.stdout.decode() + process.stderr.decode()
+
+# Import `main` in a fresh interpreter, returns the cumulative import time in milliseconds.
+def _importTime() -> float:
+  for line in _run('import main', '-X', 'importtime').splitlines():
+    if line.startswith('import time:') and line.endswith('| main'):
+      return int(line.split('|')[1]) / 1000
+  raise Exception('Import time of main not found')
+
+class ImportTest(unittest.TestCase):
+  def testImportTime(self):
+    # The first run may write the byte code caches.
+    _importTime()
+    elapsed = min(_importTime() for _ in range(3))
+    self.assertLess(elapsed, BUDGET, f'Import reqable and main takes {elapsed}ms')
+
+  def testLazyModules(self):
+    modules = _run('import sys, main; print(sorted(sys.modules))')
+    for module in LAZY_MODULES:
+      self.assertNotIn(f"'{module}'", modules)
+
+  def testLazyModulesUsedByFeature(self):
+    modules = _run('import sys, main\n'
+      'request = main.CaptureHttpRequest({"method": "GET", "path": "/?foo=bar", "protocol": "h2",'
+      ' "headers": ["content-type: text/plain; charset=utf-8"]})\n'
+      'print(request.mime, request.queries["foo"], sorted(sys.modules))')
+    self.assertTrue(modules.startswith('text/plain bar '))
+    # The header parameters are parsed without `email`.
+    self.assertNotIn("'email'", modules)
+
+if __name__ == '__main__':
+  unittest.main()
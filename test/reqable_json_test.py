@@ -0,0 +1,194 @@
+import unittest
+from unittest import mock
+import json
+
+import reqable
+from reqable import JsonCodec, CaptureHttpBody, CaptureHttpRequest, CaptureHttpResponse
+
+# The documents which are decoded differently or rejected by some backends.
+DOCUMENTS = [
+  '{"a": 1, "b": [true, false, null], "c": {"d": "e"}}',
+  '{"a": 1, "a": 2}',
+  '["\\u811a\\u672c", "脚本", "\\ud83d\\ude00", "😀", "\\ud800", "\\/\\b\\f\\n\\r\\t\\"\\\\"]',
+  '[0, -0, 1.0, -0.0, 0.1, 1e-7, 5e-324, 1.7976931348623157e308, 1e400, -1e400]',
+  '[9223372036854775807, -9223372036854775808, 18446744073709551615]',
+  '[9223372036854775808, -9223372036854775809, 123456789012345678901234567890]',
+  '{"id": 1234567890123456789012, "text": "0123456789012345678901234"}',
+  '[NaN, Infinity, -Infinity]',
+  ' \n\t{ "a" : [ ] , "b" : { } } \n',
+  '"\\u0000\\u001f\\u007f"',
+]
+
+INVALID_DOCUMENTS = ['', '{', '[1,]', "{'a': 1}", '[1] [2]', '{"a": 1', '"\\x"']
+
+VALUES = [
+  None, True, 1, -1, 1.5, 'text', '脚本 😀', '\x00\x1f', '/',
+  [1, [2, [3]]], {'a': {'b': None}},
+  10 ** 30, {1: 'int key'}, '\ud800', (1, 2),
+]
+
+def _codecs():
+  codecs = []
+  for name in JsonCodec.backends:
+    try:
+      codec = JsonCodec(name)
+      codec.name
+      codecs.append(codec)
+    except ImportError:
+      pass
+  return codecs
+
+def _same(a, b) -> bool:
+  # Compare the types too, 1 == 1.0 and NaN != NaN.
+  return json.dumps(a) == json.dumps(b) and repr(a) == repr(b)
+
+class JsonCodecTest(unittest.TestCase):
+  def testSelect(self):
+    self.assertEqual(JsonCodec('json').name, 'json')
+    self.assertIn(JsonCodec().name, JsonCodec.backends)
+    self.assertRaises(Exception, JsonCodec, 'simplejson')
+    codec = JsonCodec('json')
+    codec.use(None)
+    self.assertEqual(codec.name, _codecs()[0].name)
+
+  def testLoads(self):
+    for codec in _codecs():
+      for document in DOCUMENTS:
+        with self.subTest(codec = codec.name, document = document):
+          expected = json.loads(document)
+          self.assertTrue(_same(codec.loads(document), expected))
+          self.assertTrue(_same(codec.loads(document.encode('UTF-8')), expected))
+
+  def testLoadsInvalid(self):
+    for codec in _codecs():
+      for document in INVALID_DOCUMENTS:
+        with self.subTest(codec = codec.name, document = document):
+          self.assertRaises(json.JSONDecodeError, codec.loads, document)
+          self.assertRaises(json.JSONDecodeError, codec.loads, document.encode('UTF-8'))
+
+  def testLoadsCaptures(self):
+    for codec in _codecs():
+      for path in ('data/capture_request.json', 'data/capture_response.json'):
+        with open(path, 'rb') as content:
+          data = content.read()
+        with self.subTest(codec = codec.name, path = path):
+          self.assertEqual(codec.loads(data), json.loads(data))
+
+  def testLoadsBigInts(self):
+    for codec in _codecs():
+      if codec.name != 'orjson':
+        continue
+      # The digits in the strings and the integers in the 64-bit range are decoded by orjson only.
+      document = '{"id": "12345678901234567890", "time": 1686556322722000000, "text": "%s", "n": [-9223372036854775808]}' % ('9' * 40)
+      with mock.patch('json.loads', side_effect = AssertionError('Decoded by json')):
+        self.assertEqual(codec.loads(document), {
+          'id': '12345678901234567890',
+          'time': 1686556322722000000,
+          'text': '9' * 40,
+          'n': [-9223372036854775808],
+        })
+      for document in ('[{"a": [18446744073709551616]}]', '{"a": -9223372036854775809}', '1e20'):
+        expected = json.loads(document)
+        with mock.patch('json.loads', wraps = json.loads) as loads:
+          self.assertTrue(_same(codec.loads(document), expected))
+        self.assertEqual(loads.call_count, 1)
+
+  def testDumps(self):
+    for codec in _codecs():
+      for value in VALUES:
+        with self.subTest(codec = codec.name, value = value):
+          # The formats differ, but the decoded values are the same as `json`.
+          encoded = codec.dumps(value)
+          self.assertIsInstance(encoded, bytes)
+          self.assertTrue(_same(json.loads(encoded), json.loads(json.dumps(value))))
+
+  def testJsonifyKeepsFormat(self):
+    text = '{"id": 12345678901234567890123, "name": "脚本", "list": [1.0, 2]}'
+    name = reqable.jsonCodec.name
+    try:
+      for codec in _codecs():
+        with self.subTest(codec = codec.name):
+          reqable.jsonCodec.use(codec.name)
+          body = CaptureHttpBody.of(text)
+          body.jsonify()
+          self.assertEqual(body['id'], 12345678901234567890123)
+          self.assertEqual(body.serialize()['payload']['text'], json.dumps(json.loads(text)))
+    finally:
+      reqable.jsonCodec.use(name)
+
+def _capture(text: str) -> dict:
+  with open('data/capture_response.json', 'r', encoding='UTF-8') as content:
+    data = json.load(content)
+  data['context']['env'] = {'text': text, 'charset': text}
+  data['response']['headers'].append('x-text: "text": ' + text)
+  data['response']['body'] = {'type': 1, 'payload': {'text': text, 'charset': 'UTF-8'}}
+  data['response']['request']['body'] = {'type': 3, 'payload': [{
+    'headers': ['content-disposition: form-data; name="text"'],
+    'body': {'type': 1, 'payload': {'charset': 'UTF-8', 'text': text[::-1]}},
+  }]}
+  return data
+
+class JsonCodecLazyTest(unittest.TestCase):
+  def setUp(self):
+    self.lazyTextSize = JsonCodec.lazyTextSize
+    self.lazyTextQuotes = JsonCodec.lazyTextQuotes
+    JsonCodec.lazyTextSize = 16
+
+  def tearDown(self):
+    JsonCodec.lazyTextSize = self.lazyTextSize
+    JsonCodec.lazyTextQuotes = self.lazyTextQuotes
+
+  def testLoadsLazy(self):
+    text = '{"text": "脚本 \\"quoted\\" \\\\ 😀\\n\\u0000"}' * 4
+    data = _capture(text)
+    for codec in _codecs():
+      with self.subTest(codec = codec.name):
+        value = codec.loadsLazy(json.dumps(data).encode('UTF-8'))
+        self.assertEqual(value['context'], data['context'])
+        self.assertEqual(value['response']['headers'], data['response']['headers'])
+        self.assertEqual(CaptureHttpResponse(value['response']).serialize(),
+          CaptureHttpResponse(data['response']).serialize())
+        # The short documents and the documents without long texts are decoded as usual.
+        self.assertEqual(codec.loadsLazy(b'{"text": "short"}'), {'text': 'short'})
+        self.assertEqual(codec.loadsLazy(json.dumps(DOCUMENTS).encode('UTF-8')), DOCUMENTS)
+
+  def testLoadsLazyQuotes(self):
+    text = 'C:\\Users\\' + '"quoted" ' * 8 + '\\'
+    data = _capture(text)
+    raw = json.dumps(data).encode('UTF-8')
+    for quotes in (1, 2, 3, 100):
+      JsonCodec.lazyTextQuotes = quotes
+      with self.subTest(quotes = quotes):
+        value = reqable.jsonCodec.loadsLazy(raw)
+        self.assertEqual(str(CaptureHttpResponse(value['response']).body), text)
+        self.assertEqual(value['context'], data['context'])
+
+  def testLoadsLazyInvalid(self):
+    for codec in _codecs():
+      for document in ('{"text": "' + 'a' * 32, '{"text": "' + 'a' * 32 + '"', '["' + 'a' * 32 + '" 1]'):
+        with self.subTest(codec = codec.name, document = document):
+          self.assertRaises(json.JSONDecodeError, codec.loadsLazy, document.encode('UTF-8'))
+
+  def testBodyDecodedOnAccess(self):
+    text = json.dumps({'name': 'reqable', 'list': list(range(10))})
+    data = _capture(text)
+    request = dict(data['response']['request'], body = data['response']['body'])
+    raw = json.dumps({'request': request}).encode('UTF-8')
+    with mock.patch.object(reqable._JsonString, 'decode', autospec = True,
+        side_effect = reqable._JsonString.decode) as decode:
+      request = CaptureHttpRequest(reqable.jsonCodec.loadsLazy(raw)['request'])
+      self.assertEqual(request.method, data['response']['request']['method'])
+      self.assertTrue(request.body.isText)
+      self.assertEqual(request.serializeDelta(), {})
+      self.assertEqual(decode.call_count, 0)
+      request.body.jsonify()
+      self.assertEqual(request.body['name'], 'reqable')
+      self.assertEqual(decode.call_count, 1)
+    for access in (str, len, lambda body: body.payload, lambda body: body.serialize()):
+      body = CaptureHttpRequest(reqable.jsonCodec.loadsLazy(raw)['request']).body
+      self.assertEqual(body._payload, None)
+      access(body)
+      self.assertEqual(body._payload, text)
+
+if __name__ == '__main__':
+  unittest.main()
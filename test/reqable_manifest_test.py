@@ -0,0 +1,140 @@
+import unittest
+import io
+import json
+import contextlib
+import main
+
+from reqable import AddonManifest
+from helper import load
+
+class AddonManifestTest(unittest.TestCase):
+  def testDefault(self):
+    manifest = AddonManifest()
+    self.assertEqual(manifest.serialize(), {
+      'hosts': [],
+      'paths': [],
+      'methods': [],
+      'hooks': ['onRequest', 'onResponse'],
+      'requestBody': True,
+      'responseBody': True,
+    })
+    self.assertTrue(manifest.matches('onRequest', 'reqable.com', 'GET', '/'))
+    self.assertTrue(manifest.matches('onResponse', None, None, None))
+
+  def testMatches(self):
+    manifest = AddonManifest(
+      hosts = ['reqable.com', '*.reqable.com'],
+      paths = ['/api/*', '/login'],
+      methods = ['get', 'POST'],
+      hooks = ['onRequest'],
+    )
+    self.assertEqual(manifest.methods, ['GET', 'POST'])
+    self.assertTrue(manifest.matches('onRequest', 'reqable.com', 'GET', '/api/users'))
+    self.assertTrue(manifest.matches('onRequest', 'API.Reqable.com', 'post', '/api/users?page=1'))
+    self.assertTrue(manifest.matches('onRequest', 'reqable.com', 'GET', '/login?next=/api/'))
+    self.assertFalse(manifest.matches('onResponse', 'reqable.com', 'GET', '/api/users'))
+    self.assertFalse(manifest.matches('onRequest', 'reqable.com.cn', 'GET', '/api/users'))
+    self.assertFalse(manifest.matches('onRequest', 'notreqable.com', 'GET', '/api/users'))
+    self.assertFalse(manifest.matches('onRequest', 'reqable.com', 'PUT', '/api/users'))
+    self.assertFalse(manifest.matches('onRequest', 'reqable.com', 'GET', '/login/'))
+    self.assertFalse(manifest.matches('onRequest', 'reqable.com', 'GET', '/v1/api/users'))
+
+  def testParse(self):
+    data = {
+      'hosts': ['*.reqable.com'],
+      'paths': [],
+      'methods': ['GET'],
+      'hooks': ['onResponse'],
+      'requestBody': False,
+      'responseBody': True,
+    }
+    manifest = AddonManifest.parse(data)
+    self.assertEqual(manifest.serialize(), data)
+    self.assertEqual(json.loads(manifest.toJson()), data)
+    self.assertEqual(AddonManifest.parse({'hosts': 'reqable.com'}).hosts, ['reqable.com'])
+    self.assertRaises(Exception, AddonManifest.parse, [])
+    self.assertRaises(Exception, AddonManifest.parse, {'host': ['reqable.com']})
+    self.assertRaises(Exception, AddonManifest.parse, {'hosts': [1]})
+    self.assertRaises(Exception, AddonManifest.parse, {'paths': ['']})
+    self.assertRaises(Exception, AddonManifest.parse, {'hooks': ['onMessage']})
+    self.assertRaises(Exception, AddonManifest.parse, {'requestBody': 'no'})
+
+class ManifestRuntimeTest(unittest.TestCase):
+  def tearDown(self):
+    main.manifest = None
+    main.callbackDelta = False
+
+  def testNotMatched(self):
+    main.manifest = AddonManifest(hosts = ['example.com'])
+    onRequest = main.addons.onRequest
+    main.addons.onRequest = lambda context, request: self.fail('The addon is called')
+    try:
+      self.assertIsNone(main.handleRequest(load('data/capture_request.json')))
+      self.assertEqual(main.handleJob({'id': 1, 'type': 'request', 'data': load('data/capture_request.json')}), {
+        'id': 1,
+        'result': None,
+      })
+    finally:
+      main.addons.onRequest = onRequest
+
+  def testHooks(self):
+    main.manifest = AddonManifest(hooks = ['onRequest'])
+    self.assertIsNone(main.handleResponse(load('data/capture_response.json')))
+    self.assertIsNotNone(main.handleRequest(load('data/capture_request.json')))
+    main.manifest = AddonManifest(hooks = ['onResponse'], paths = ['/api/*'])
+    self.assertIsNone(main.handleRequest(load('data/capture_request.json')))
+    self.assertIsNotNone(main.handleResponse(load('data/capture_response.json')))
+
+  def testBodies(self):
+    main.manifest = AddonManifest(requestBody = False, responseBody = False)
+    data = load('data/capture_request.json')
+    del data['request']['body']
+    callback = main.handleRequest(data)
+    self.assertFalse('body' in callback['request'])
+    self.assertEqual(callback['request']['headers'], data['request']['headers'])
+
+    data = load('data/capture_response.json')
+    del data['response']['body']
+    del data['response']['request']['body']
+    callback = main.handleResponse(data)
+    self.assertFalse('body' in callback['response'])
+    self.assertFalse('body' in callback['response']['request'])
+
+    # The body which is changed by the addon is written.
+    onRequest = main.addons.onRequest
+    def replace(context, request):
+      request.body = 'Hello World'
+      return request
+    main.addons.onRequest = replace
+    try:
+      data = load('data/capture_request.json')
+      del data['request']['body']
+      callback = main.handleRequest(data)
+    finally:
+      main.addons.onRequest = onRequest
+    self.assertEqual(callback['request']['body']['payload']['text'], 'Hello World')
+
+  def testCommand(self):
+    main.manifest = AddonManifest(hosts = ['reqable.com'], responseBody = False)
+    argv = main.sys.argv
+    main.sys.argv = ['main.py', 'manifest']
+    output = io.StringIO()
+    try:
+      with contextlib.redirect_stdout(output):
+        main.main()
+    finally:
+      main.sys.argv = argv
+    self.assertEqual(json.loads(output.getvalue()), main.manifest.serialize())
+
+  def testLoad(self):
+    main.addons.manifest = {'hooks': ['onRequest']}
+    try:
+      self.assertEqual(main._loadManifest().hooks, ['onRequest'])
+      main.addons.manifest = 'onRequest'
+      self.assertRaises(Exception, main._loadManifest)
+    finally:
+      del main.addons.manifest
+    self.assertIsNone(main._loadManifest())
+
+if __name__ == '__main__':
+  unittest.main()
@@ -83,5 +83,33 @@ class HttpMultipartBodyTest(unittest.TestCase):
     self.assertEqual(body.serialize(), data)
 
 
+  def testHttpMultipartBodyDisposition(self):
+    body = multipart.text('Hi World', 'python', 'image.png')
+    self.assertEqual(body.name, 'python')
+    self.assertEqual(body.filename, 'image.png')
+    body.name = 'say "hi"'
+    body.filename = 'a; b.txt'
+    self.assertEqual(body.headers['content-disposition'],
+      'form-data; name="say \\"hi\\""; filename="a; b.txt"')
+    self.assertEqual(body.name, 'say "hi"')
+    self.assertEqual(body.filename, 'a; b.txt')
+
+    body = multipart({
+      'headers': [
+        "Content-Disposition: attachment; filename=\"rates.txt\"; filename*=UTF-8''%e2%82%ac%20rates.txt",
+      ],
+      'body': {
+        'type': 0,
+        'payload': None
+      }
+    })
+    self.assertEqual(body.name, None)
+    self.assertEqual(body.filename, '€ rates.txt')
+    body.filename = 'rates.txt'
+    self.assertEqual(body.headers['content-disposition'], 'attachment; filename="rates.txt"')
+    body.name = 'rates'
+    self.assertEqual(body.headers['content-disposition'],
+      'attachment; filename="rates.txt"; name="rates"')
+
 if __name__ == '__main__':
   unittest.main()
\ No newline at end of file
@@ -0,0 +1,119 @@
+import unittest
+import io
+import os
+import sys
+import json
+import signal
+import subprocess
+import tempfile
+import time
+import main
+from helper import load, frames, readFrames, servePool
+
+def _jobs(count, sessions):
+  request = load('data/capture_request.json')
+  jobs = []
+  for i in range(count):
+    data = json.loads(json.dumps(request))
+    data['context']['id'] = i % sessions
+    data['request']['method'] = 'M' + str(i)
+    jobs.append({'id': i, 'type': 'request', 'data': data})
+  return jobs
+
+class WorkerPoolTest(unittest.TestCase):
+  def setUp(self):
+    self.pool = main.WorkerPool(3)
+    self.pool.start()
+
+  def tearDown(self):
+    self.pool.close()
+
+  def testServe(self):
+    frames = servePool(self.pool, _jobs(20, 5))
+    self.assertEqual(sorted(frame['id'] for frame in frames), list(range(20)))
+    for frame in frames:
+      self.assertEqual(frame['result']['request']['method'], 'M' + str(frame['id']))
+    # The messages of one session are kept in order.
+    for session in range(5):
+      ids = [frame['id'] for frame in frames if frame['id'] % 5 == session]
+      self.assertEqual(ids, sorted(ids))
+
+  def testServeAgain(self):
+    self.assertEqual(len(servePool(self.pool, _jobs(4, 2))), 4)
+    self.assertEqual(len(servePool(self.pool, _jobs(4, 2))), 4)
+
+  def testRestartCrashedWorker(self):
+    pids = self.pool.pids
+    os.kill(pids[0], signal.SIGKILL)
+    time.sleep(0.1)
+    frames = servePool(self.pool, _jobs(12, 6))
+    self.assertEqual(sorted(frame['id'] for frame in frames), list(range(12)))
+    for frame in frames:
+      self.assertTrue('result' in frame or 'error' in frame)
+    self.assertNotEqual(self.pool.pids[0], pids[0])
+    self.assertEqual(self.pool.pids[1:], pids[1:])
+    frames = servePool(self.pool, _jobs(12, 6))
+    for frame in frames:
+      self.assertTrue('result' in frame)
+
+  def testRouteWithoutDecoding(self):
+    # The routing fields come before the message.
+    jobs = [{'id': job['id'], 'session': job['data']['context']['id'], 'type': job['type'], 'data': job['data']}
+      for job in _jobs(12, 4)]
+    decodeFrame = main._decodeFrame
+    decoded = []
+    def record(payload):
+      frame = decodeFrame(payload)
+      decoded.append(frame)
+      return frame
+    main._decodeFrame = record
+    try:
+      frames = servePool(self.pool, jobs)
+    finally:
+      main._decodeFrame = decodeFrame
+    self.assertEqual(sorted(frame['id'] for frame in frames), list(range(12)))
+    # Only the result frames are decoded, by the test itself.
+    self.assertEqual([frame for frame in decoded if 'type' in frame], [])
+
+  def testServeInvalidFrames(self):
+    jobs = _jobs(4, 2)
+    frames = servePool(self.pool, [b'{not json', jobs[0], b'{"id": 9, "session": 1, "data": {', jobs[1]])
+    self.assertEqual(sorted(str(frame['id']) for frame in frames), ['0', '1', '9', 'None'])
+    for frame in frames:
+      if frame['id'] in (None, 9):
+        self.assertTrue(frame['error'].startswith('Invalid frame: '))
+      else:
+        self.assertTrue('result' in frame)
+    # The workers are still serving.
+    self.assertEqual(len(servePool(self.pool, jobs)), 4)
+
+  def testPeekFrame(self):
+    payload = json.dumps({'id': 'a"b', 'type': 'request', 'session': -1, 'data': {'id': 2}}).encode()
+    self.assertEqual(main._peekFrame(memoryview(payload), ('id', 'session')), {'id': 'a"b', 'session': -1})
+    # The fields after the message are not read.
+    payload = json.dumps({'id': 1, 'data': {'session': 2}, 'session': 3}).encode()
+    self.assertEqual(main._peekFrame(memoryview(payload), ('id', 'session')), {'id': 1})
+    self.assertEqual(self.pool._resultId(main.encodeFrame({'id': 'a"b', 'result': {'id': 2}})), 'a"b')
+
+class WorkerPoolStdoutTest(unittest.TestCase):
+  def testAddonPrint(self):
+    with tempfile.TemporaryDirectory() as directory:
+      with open(os.path.join(directory, 'addons.py'), 'w', encoding='UTF-8') as file:
+        file.write('def onRequest(context, request):\n'
+          '  print(\'hello from addon \' + context.url)\n'
+          '  return request\n')
+      code = f'import sys; sys.path.insert(0, {directory!r}); import main; ' \
+        'sys.argv = ["main.py", "serve", "--workers", "2"]; main.main()'
+      process = subprocess.run([sys.executable, '-c', code],
+        cwd=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'reqable'),
+        input=frames(*_jobs(4, 2)).getvalue(), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        check=True, timeout=30)
+    # The addon prints go to the stderr, the stdout only carries the frames.
+    results = readFrames(io.BytesIO(process.stdout))
+    self.assertEqual(sorted(frame['id'] for frame in results), [0, 1, 2, 3])
+    for frame in results:
+      self.assertTrue('result' in frame)
+    self.assertEqual(process.stderr.decode().count('hello from addon '), 4)
+
+if __name__ == '__main__':
+  unittest.main()
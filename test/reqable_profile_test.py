@@ -0,0 +1,80 @@
+import unittest
+import asyncio
+import os
+import shutil
+import pstats
+import tempfile
+import tracemalloc
+import main
+from helper import load
+
+class ProfileTest(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.cwd = os.getcwd()
+    self.request = os.path.join(self.directory, 'request.json')
+    shutil.copy('data/capture_request.json', self.request)
+
+  def tearDown(self):
+    main.profileMode = None
+    main.profileSample = 1
+    main._profileCount = 0
+    os.chdir(self.cwd)
+    shutil.rmtree(self.directory)
+
+  def testOptions(self):
+    main._useProfile({'--profile': 'cprofile', '--profile-sample': '10'})
+    self.assertEqual(main.profileMode, 'cprofile')
+    self.assertEqual(main.profileSample, 10)
+    self.assertRaises(Exception, main._useProfile, {'--profile': 'unknown'})
+    self.assertRaises(Exception, main._useProfile, {'--profile': 'cprofile', '--profile-sample': '0'})
+    main._useProfile({})
+    self.assertIsNone(main.profileMode)
+
+  def testCProfile(self):
+    main.profileMode = 'cprofile'
+    main.onRequest(self.request)
+    self.assertEqual(load(self.request + '.cb')['request'], load(self.request)['request'])
+    stats = pstats.Stats(self.request + '.prof')
+    self.assertTrue(any(function[2] == 'onRequest' for function in stats.stats))
+
+  def testTracemalloc(self):
+    main.profileMode = 'tracemalloc'
+    main.onRequest(self.request)
+    snapshot = tracemalloc.Snapshot.load(self.request + '.tracemalloc')
+    self.assertTrue(len(snapshot.traces) > 0)
+    self.assertFalse(tracemalloc.is_tracing())
+
+  def testSample(self):
+    main.profileMode = 'cprofile'
+    main.profileSample = 3
+    os.chdir(self.directory)
+    data = load(self.request)
+    for i in range(7):
+      frame = main.handleJob({'id': i, 'type': 'request', 'data': data})
+      self.assertEqual(frame['id'], i)
+    self.assertEqual(sorted(name for name in os.listdir('.') if name.endswith('.prof')),
+      ['reqable-0.prof', 'reqable-3.prof', 'reqable-6.prof'])
+
+  def testAsync(self):
+    main.profileMode = 'cprofile'
+    os.chdir(self.directory)
+    data = load(self.request)
+    async def onRequest(context, request):
+      await asyncio.sleep(0.01)
+      return request
+    async def run():
+      return await asyncio.gather(*(main.handleJobAsync({'id': i, 'type': 'request', 'data': data}) for i in range(3)))
+    hook = main.addons.onRequest
+    main.addons.onRequest = onRequest
+    try:
+      frames = asyncio.run(run())
+    finally:
+      main.addons.onRequest = hook
+    self.assertEqual([frame['id'] for frame in frames], [0, 1, 2])
+    # The concurrent jobs are not profiled while another one is being profiled.
+    self.assertEqual(sorted(name for name in os.listdir('.') if name.endswith('.prof')), ['reqable-0.prof'])
+    self.assertFalse(main._profiling)
+
+if __name__ == '__main__':
+  unittest.main()
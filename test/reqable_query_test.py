@@ -144,5 +144,76 @@ class HttpQueriesTest(unittest.TestCase):
     self.assertEqual(d['abc'], '123')
     self.assertEqual(d['hello'], '')
 
+  def testHttpQueriesRemoveKeepsOrder(self):
+    queries = CaptureHttpQueries.parse('a=1&b=2&a=3&c=4&b=5')
+    self.assertEqual(queries['b'], '2')
+    queries.remove('a')
+    self.assertEqual(queries.mod, 2)
+    self.assertEqual(len(queries), 3)
+    self.assertEqual(queries['a'], None)
+    queries['b'] = '6'
+    queries.add('a', '7')
+    self.assertEqual(queries['c'], '4')
+    self.assertEqual(queries.mod, 4)
+    self.assertEqual(list(queries), [('b', '6'), ('c', '4'), ('b', '5'), ('a', '7')])
+    self.assertEqual(queries.indexes('b'), [0, 2])
+    self.assertEqual(queries.index('a'), 3)
+    self.assertEqual(queries.serialize(), 'b=6&c=4&b=5&a=7')
+    queries.remove('python')
+    self.assertEqual(queries.mod, 4)
+
+  def testHttpQueriesManyRemoves(self):
+    queries = CaptureHttpQueries.parse('&'.join(f'p{i}={i}' for i in range(100)))
+    for i in range(0, 100, 2):
+      queries.remove(f'p{i}')
+    self.assertEqual(len(queries), 50)
+    self.assertEqual(queries['p51'], '51')
+    self.assertEqual(queries.index('p99'), 49)
+    self.assertEqual(queries.entries[0], ('p1', '1'))
+    queries.entries.insert(0, ('p0', 'x'))
+    self.assertEqual(queries['p0'], 'x')
+
+  def testHttpQueriesIndexHeldEntries(self):
+    queries = CaptureHttpQueries.parse('a=1')
+    entries = queries.entries
+    self.assertEqual(queries['a'], '1')
+    # The list held by the caller is changed after the index is built.
+    entries.append(('b', '2'))
+    self.assertEqual(queries['b'], '2')
+    entries[0] = ('c', '3')
+    self.assertIsNone(queries['a'])
+    self.assertEqual(queries['c'], '3')
+
+    pairs = [('a', '1')]
+    queries = CaptureHttpQueries(pairs)
+    self.assertEqual(queries['a'], '1')
+    pairs.insert(0, ('b', '2'))
+    queries.add('d', '4')
+    self.assertEqual(queries.indexes('a'), [1])
+    self.assertEqual(queries['b'], '2')
+    self.assertEqual(queries['d'], '4')
+
+  def testHttpQueriesRemoveHeldEntries(self):
+    queries = CaptureHttpQueries.parse('a=1&b=2&a=3&c=4')
+    entries = queries.entries
+    queries.remove('a')
+    # The held list never sees the removed entries.
+    self.assertEqual([(name, value) for name, value in entries], [('b', '2'), ('c', '4')])
+    self.assertEqual(queries['c'], '4')
+
+    pairs = [('a', '1'), ('b', '2')]
+    queries = CaptureHttpQueries(pairs)
+    queries.remove('a')
+    self.assertEqual(pairs, [('b', '2')])
+    self.assertEqual(len(queries), 1)
+
+  def testHttpQueriesSerializeOrigin(self):
+    queries = CaptureHttpQueries.parse('b=%20&a')
+    self.assertEqual(queries['b'], ' ')
+    queries.remove('c')
+    self.assertEqual(queries.serialize(), 'b=%20&a')
+    queries.remove('a')
+    self.assertEqual(queries.serialize(), 'b=+')
+
 if __name__ == '__main__':
   unittest.main()
\ No newline at end of file
@@ -1,4 +1,5 @@
 import unittest
+from unittest import mock
 
 from reqable import CaptureHttpRequest
 
@@ -262,5 +263,22 @@ class HttpRequestTest(unittest.TestCase):
       ]
     })
 
+  def testHttpRequestQueriesDeferred(self):
+    request = CaptureHttpRequest({
+      'method': 'GET',
+      'path': '/api;v=1?b=%7e&a&&c=%zz',
+      'protocol': 'HTTP/1.1',
+    })
+    with mock.patch('urllib.parse.parse_qsl') as parse:
+      self.assertEqual(request.serialize()['path'], '/api;v=1?b=%7e&a&&c=%zz')
+      self.assertEqual(request.queries.serialize(), 'b=%7e&a&&c=%zz')
+      self.assertFalse(parse.called)
+    self.assertEqual(request.queries['b'], '~')
+    self.assertEqual(request.serialize()['path'], '/api;v=1?b=%7e&a&&c=%zz')
+    request.queries.remove('c')
+    self.assertEqual(request.serialize()['path'], '/api;v=1?b=~&a=')
+    request.queries.clear()
+    self.assertEqual(request.serialize()['path'], '/api;v=1')
+
 if __name__ == '__main__':
   unittest.main()
\ No newline at end of file
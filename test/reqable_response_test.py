@@ -256,5 +256,41 @@ class HttpResponseTest(unittest.TestCase):
       ]
     })
 
+  def testHttpResponseLazy(self):
+    response = CaptureHttpResponse({
+      'request': {
+        'method': 'POST',
+        'path': '/?foo=bar',
+        'protocol': 'HTTP/1.1',
+        'body': {
+          'type': 2,
+          'payload': 'data/not_exists.bin'
+        },
+      },
+      'code': 200,
+      'message': 'OK',
+      'protocol': 'HTTP/1.1',
+      'headers': [
+        'content-type: application/octet-stream',
+      ],
+      'body': {
+        'type': 2,
+        'payload': 'data/not_exists.bin'
+      },
+    })
+    # The bodies are not loaded until accessed.
+    self.assertEqual(response.code, 200)
+    self.assertFalse(response.modified)
+    self.assertEqual(response.serializeDelta(), {})
+    response.code = 404
+    self.assertEqual(response.serializeDelta(), {
+      'code': 404,
+    })
+    self.assertEqual(response.request.method, 'POST')
+    self.assertEqual(response.request.queries['foo'], 'bar')
+    self.assertEqual(response.contentType, 'application/octet-stream')
+    self.assertRaises(FileNotFoundError, len, response.body)
+    self.assertRaises(FileNotFoundError, len, response.request.body)
+
 if __name__ == '__main__':
   unittest.main()
\ No newline at end of file
@@ -0,0 +1,109 @@
+import unittest
+import os
+import tempfile
+import main
+
+from reqable import RingBuffer
+from helper import load, serveJobs
+
+class RingBufferTest(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.TemporaryDirectory()
+    self.path = os.path.join(self.directory.name, 'ring')
+
+  def tearDown(self):
+    main.binaryProtocol = False
+    main.ringBuffers = None
+    main._ringRegions.clear()
+    self.directory.cleanup()
+
+  def testOpen(self):
+    jobs, results = RingBuffer.open(self.path, 32)
+    self.assertEqual(os.path.getsize(self.path), 2 * (RingBuffer.headerSize + 32))
+    offset, length = jobs.write(b'hello')
+    self.assertEqual((offset, length), (RingBuffer.headerSize, 5))
+    # The other process maps the same file.
+    peer, _ = RingBuffer.open(self.path)
+    self.assertEqual(peer.capacity, 32)
+    view = peer.region(offset, length)
+    self.assertEqual(view, b'hello')
+    self.assertTrue(view.readonly)
+    offset, _ = results.write(b'world')
+    self.assertEqual(offset, 2 * RingBuffer.headerSize + 32)
+    self.assertRaises(Exception, peer.region, offset, 5)
+    self.assertRaises(Exception, peer.region, RingBuffer.headerSize + 30, 5)
+
+  def testWrapAround(self):
+    producer, _ = RingBuffer.open(self.path, 16)
+    consumer, _ = RingBuffer.open(self.path)
+    first = producer.write(b'0123456789')
+    self.assertEqual(first[0], RingBuffer.headerSize)
+    # The region doesn't fit the rest of the ring, and the first region is not released yet.
+    self.assertIsNone(producer.write(b'abcdefgh'))
+    second = producer.write(b'abcd')
+    self.assertEqual(second[0], RingBuffer.headerSize + 10)
+    self.assertEqual(consumer.region(*first), b'0123456789')
+    self.assertEqual(consumer.region(*second), b'abcd')
+    # The tail is not advanced until the previous regions are released.
+    consumer.release(second[0])
+    self.assertIsNone(producer.write(b'abcdefgh'))
+    consumer.release(first[0])
+    third = producer.write(b'abcdefgh')
+    self.assertEqual(third[0], RingBuffer.headerSize)
+    self.assertEqual(consumer.region(*third), b'abcdefgh')
+    consumer.release(third[0])
+    self.assertEqual(producer.write(b'x' * 16)[0], RingBuffer.headerSize)
+    self.assertIsNone(producer.write(b'x' * 17))
+    self.assertIsNone(producer.write(b''))
+
+  def testServe(self):
+    jobs, results = RingBuffer.open(self.path, 1024)
+    main.binaryProtocol = True
+    main.ringBuffers = RingBuffer.open(self.path)
+    data = load('data/capture_request.json')
+    offset, length = jobs.write(b'\x00\x01\x02')
+    data['request']['body'] = {
+      'type': 2,
+      'payload': {'offset': offset, 'length': length},
+    }
+    onRequest = main.addons.onRequest
+    def reverse(context, request):
+      self.assertIsInstance(request.body.buffer, memoryview)
+      self.assertEqual(request.body.buffer, b'\x00\x01\x02')
+      request.body = bytes(reversed(request.body.buffer))
+      return request
+    main.addons.onRequest = reverse
+    try:
+      frame, = serveJobs(main.serveChannel, [{'id': 1, 'type': 'request', 'data': data}])
+    finally:
+      main.addons.onRequest = onRequest
+    payload = frame['result']['request']['body']['payload']
+    self.assertEqual(results.region(payload['offset'], payload['length']), b'\x02\x01\x00')
+    # The job region is released after the result is written.
+    self.assertEqual(main._ringRegions, {})
+    self.assertEqual(RingBuffer.open(self.path)[0]._released, length)
+
+  def testServeUnchanged(self):
+    jobs, results = RingBuffer.open(self.path, 1024)
+    main.binaryProtocol = True
+    main.ringBuffers = RingBuffer.open(self.path)
+    data = load('data/capture_request.json')
+    offset, length = jobs.write(b'\x00\x01\x02')
+    data['request']['body'] = {
+      'type': 2,
+      'payload': {'offset': offset, 'length': length},
+    }
+    onRequest = main.addons.onRequest
+    main.addons.onRequest = lambda context, request: request
+    try:
+      frame, = serveJobs(main.serveChannel, [{'id': 1, 'type': 'request', 'data': data}])
+    finally:
+      main.addons.onRequest = onRequest
+    # The body is passed through as the job region, nothing is written to the result ring.
+    self.assertEqual(frame['result']['request']['body']['payload'], {'offset': offset, 'length': length})
+    self.assertEqual(results._read(RingBuffer._head), 0)
+    self.assertEqual(main._ringRegions, {})
+    self.assertEqual(RingBuffer.open(self.path)[0]._released, length)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+
+from reqable import Router, CaptureContext, CaptureHttpRequest, CaptureHttpResponse
+from helper import load
+
+class RouterTest(unittest.TestCase):
+  def testRoute(self):
+    router = Router()
+
+    @router.route(host = '*.example.com', path = '/v1/users/*', method = 'POST')
+    def createUser(context, request):
+      return request
+
+    self.assertEqual(len(router), 1)
+    self.assertIs(router.match('api.example.com', 'post', '/v1/users/1'), createUser)
+    self.assertIs(router.match('a.b.Example.COM', 'POST', '/v1/users/1?foo=bar'), createUser)
+    self.assertIsNone(router.match('example.com', 'POST', '/v1/users/1'))
+    self.assertIsNone(router.match('api.example.org', 'POST', '/v1/users/1'))
+    self.assertIsNone(router.match('api.example.com', 'GET', '/v1/users/1'))
+    self.assertIsNone(router.match('api.example.com', 'POST', '/v1/users'))
+    self.assertIsNone(router.match('api.example.com', 'POST', '/v1/users/1/posts'))
+
+  def testSpecific(self):
+    router = Router()
+    anyHost = lambda context, message: 'any'
+    wildcard = lambda context, message: 'wildcard'
+    deeper = lambda context, message: 'deeper'
+    exact = lambda context, message: 'exact'
+    star = lambda context, message: 'star'
+    rest = lambda context, message: 'rest'
+    get = lambda context, message: 'get'
+    router.add(anyHost)
+    router.add(wildcard, '*.example.com')
+    router.add(deeper, '*.api.example.com')
+    router.add(exact, 'api.example.com')
+    router.add(star, 'example.com', '/users/*')
+    router.add(rest, 'example.com', '/users/**')
+    router.add(get, 'example.com', '/users/me', ['GET', 'HEAD'])
+    self.assertEqual(len(router), 8)
+    self.assertIs(router.match('reqable.com', 'GET', '/'), anyHost)
+    self.assertIs(router.match('', 'GET', '/'), anyHost)
+    self.assertIs(router.match('www.example.com', 'GET', '/'), wildcard)
+    self.assertIs(router.match('v1.api.example.com', 'GET', '/'), deeper)
+    self.assertIs(router.match('api.example.com', 'GET', '/'), exact)
+    self.assertIs(router.match('example.com', 'GET', '/users/me'), get)
+    self.assertIs(router.match('example.com', 'HEAD', '/users/me'), get)
+    self.assertIs(router.match('example.com', 'POST', '/users/me'), star)
+    self.assertIs(router.match('example.com', 'POST', '/users'), rest)
+    self.assertIs(router.match('example.com', 'POST', '/users/me/posts'), rest)
+    # Fallback to the less specific host if the path is not matched.
+    self.assertIs(router.match('example.com', 'GET', '/posts'), anyHost)
+
+  def testBacktrack(self):
+    router = Router()
+    literal = lambda context, message: 'literal'
+    star = lambda context, message: 'star'
+    router.add(literal, path = '/a/b/c')
+    router.add(star, path = '/a/*/d')
+    self.assertIs(router.match('example.com', 'GET', '/a/b/c'), literal)
+    self.assertIs(router.match('example.com', 'GET', '/a/b/d'), star)
+    self.assertIsNone(router.match('example.com', 'GET', '/a/b/e'))
+
+  def testInvalid(self):
+    router = Router()
+    handler = lambda context, message: message
+    router.add(handler, 'example.com', '/', 'GET')
+    self.assertRaises(Exception, router.add, handler, 'example.com', '/', 'get')
+    self.assertRaises(Exception, router.add, None)
+    self.assertRaises(Exception, router.add, handler, 'api.*.com')
+    self.assertRaises(Exception, router.add, handler, 'example..com')
+    self.assertRaises(Exception, router.add, handler, None, 'users')
+    self.assertRaises(Exception, router.add, handler, None, '/**/users')
+    self.assertRaises(Exception, router.add, handler, None, None, '')
+
+  def testDispatch(self):
+    router = Router()
+
+    @router.route(host = 'reqable.com', path = '/api/users', method = 'POST')
+    def onUsers(context, message):
+      message.headers['foo'] = 'bar'
+      return message
+
+    data = load('data/capture_request.json')
+    context = CaptureContext(data['context'])
+    request = CaptureHttpRequest(data['request'])
+    self.assertIs(router.dispatch(context, request), request)
+    self.assertEqual(request.headers['foo'], 'bar')
+
+    data = load('data/capture_response.json')
+    response = CaptureHttpResponse(data['response'])
+    self.assertIs(router.dispatch(CaptureContext(data['context']), response), response)
+    self.assertEqual(response.headers['foo'], 'bar')
+
+    request = CaptureHttpRequest({
+      'method': 'GET',
+      'path': '/api/users',
+      'protocol': 'HTTP/1.1',
+    })
+    self.assertIs(router.dispatch(context, request), request)
+    self.assertIsNone(request.headers['foo'])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,163 @@
+import unittest
+import os
+import json
+import tempfile
+
+from reqable import RuleEngine, Router, CaptureContext, CaptureHttpRequest, CaptureHttpResponse
+from helper import load
+
+def _request():
+  data = load('data/capture_request.json')
+  return CaptureContext(data['context']), CaptureHttpRequest(data['request'])
+
+def _response():
+  data = load('data/capture_response.json')
+  return CaptureContext(data['context']), CaptureHttpResponse(data['response'])
+
+class RuleEngineTest(unittest.TestCase):
+  def testActions(self):
+    engine = RuleEngine({
+      'rules': [
+        {
+          'host': 'reqable.com',
+          'path': '/api/users',
+          'method': 'POST',
+          'actions': [
+            {'type': 'setHeader', 'name': 'x-foo', 'value': 'bar'},
+            {'type': 'removeHeader', 'name': 'accept'},
+            {'type': 'rewriteHost', 'host': 'staging.reqable.com'},
+            {'type': 'addQuery', 'name': 'debug', 'value': '1'},
+            {'type': 'replaceBody', 'old': 'megatron', 'new': 'optimus'},
+          ],
+        },
+      ],
+    })
+    self.assertEqual(len(engine), 1)
+    context, request = _request()
+    self.assertIs(engine.onRequest(context, request), request)
+    self.assertEqual(request.headers['x-foo'], 'bar')
+    self.assertIsNone(request.headers['accept'])
+    self.assertEqual(request.headers['host'], 'staging.reqable.com')
+    self.assertEqual(request.queries['debug'], '1')
+    self.assertEqual(request.queries['page'], '1')
+    self.assertTrue('optimus' in str(request.body))
+    self.assertFalse('megatron' in str(request.body))
+
+  def testReplaceBody(self):
+    engine = RuleEngine([
+      {
+        'actions': [
+          {'type': 'replaceBody', 'old': 'megatron', 'new': 'optimus'},
+          {'type': 'replaceBody', 'old': 'optimus', 'new': 'bumblebee'},
+          {'type': 'setHeader', 'name': 'x-foo', 'value': 'bar'},
+          {'type': 'replaceBody', 'old': 'bumblebee', 'new': 'reqable'},
+        ],
+      },
+    ])
+    context, request = _request()
+    engine.apply(context, request)
+    self.assertTrue('reqable' in str(request.body))
+    self.assertFalse('megatron' in str(request.body))
+
+    context, request = _request()
+    # The consecutive replacements are merged into one scan, the replaced text is not replaced again.
+    request.body = b'megatron'
+    engine.apply(context, request)
+    self.assertEqual(request.body.payload, b'optimus')
+
+  def testAuthority(self):
+    engine = RuleEngine([
+      {'actions': [{'type': 'rewriteHost', 'host': 'staging.reqable.com'}]},
+    ])
+    context, request = _request()
+    request.headers = [':authority: reqable.com']
+    engine.apply(context, request)
+    self.assertEqual(request.headers.entries, [':authority: staging.reqable.com'])
+
+  def testOrder(self):
+    engine = RuleEngine([
+      {'actions': [{'type': 'setHeader', 'name': 'x-order', 'value': 'any'}]},
+      {'host': '*.com', 'actions': [{'type': 'setHeader', 'name': 'x-order', 'value': 'wildcard'}]},
+      {'host': '*', 'path': '/**', 'actions': [{'type': 'setHeader', 'name': 'x-any', 'value': '1'}]},
+      {'host': 'reqable.com', 'path': '/api/*', 'actions': [{'type': 'setHeader', 'name': 'x-order', 'value': 'exact'}]},
+      {'host': 'reqable.com', 'method': 'GET', 'actions': [{'type': 'setHeader', 'name': 'x-order', 'value': 'get'}]},
+      {'host': 'example.com', 'actions': [{'type': 'setHeader', 'name': 'x-example', 'value': '1'}]},
+    ])
+    context, request = _request()
+    engine.apply(context, request)
+    # All the matched rules are applied in the order of the rules.
+    self.assertEqual(request.headers['x-order'], 'exact')
+    self.assertEqual(request.headers['x-any'], '1')
+    self.assertIsNone(request.headers['x-example'])
+
+  def testOverlappedMethods(self):
+    engine = RuleEngine([
+      {'method': ['POST', 'post'], 'actions': [{'type': 'addQuery', 'name': 'a', 'value': '1'}]},
+      {'method': ['POST', '*'], 'actions': [{'type': 'addQuery', 'name': 'b', 'value': '1'}]},
+      {'host': 'reqable.com', 'actions': [{'type': 'addQuery', 'name': 'c', 'value': '1'}]},
+    ])
+    context, request = _request()
+    engine.apply(context, request)
+    # Every rule is applied once.
+    self.assertEqual(request.queries.entries, [('page', '1'), ('size', '20'), ('a', '1'), ('b', '1'), ('c', '1')])
+
+  def testResponse(self):
+    engine = RuleEngine([
+      {'hook': 'response', 'host': 'reqable.com', 'actions': [{'type': 'setHeader', 'name': 'x-foo', 'value': 'bar'}]},
+      {'hook': 'request', 'actions': [{'type': 'setHeader', 'name': 'x-request', 'value': '1'}]},
+    ])
+    context, response = _response()
+    self.assertIs(engine.onResponse(context, response), response)
+    self.assertEqual(response.headers['x-foo'], 'bar')
+    self.assertIsNone(response.headers['x-request'])
+    self.assertIsNone(response.request.headers['x-request'])
+
+  def testNotMatched(self):
+    engine = RuleEngine([
+      {'host': 'example.com', 'actions': [{'type': 'setHeader', 'name': 'x-foo', 'value': 'bar'}]},
+    ])
+    context, request = _request()
+    engine.apply(context, request)
+    self.assertFalse(request.modified)
+
+  def testInvalid(self):
+    self.assertRaises(Exception, RuleEngine, 'rules')
+    self.assertRaises(Exception, RuleEngine, [[]])
+    self.assertRaises(Exception, RuleEngine, [{'hook': 'connect', 'actions': []}])
+    self.assertRaises(Exception, RuleEngine, [{}])
+    self.assertRaises(Exception, RuleEngine, [{'actions': [{'type': 'unknown'}]}])
+    self.assertRaises(Exception, RuleEngine, [{'actions': [{'type': 'setHeader', 'name': 'foo'}]}])
+    self.assertRaises(Exception, RuleEngine, [{'hook': 'response', 'actions': [{'type': 'addQuery', 'name': 'a', 'value': 'b'}]}])
+    self.assertRaises(Exception, RuleEngine, [{'path': 'api', 'actions': []}])
+    self.assertRaises(Exception, RuleEngine, [{'method': ['GET', 1], 'actions': []}])
+
+  def testLoad(self):
+    with tempfile.TemporaryDirectory() as directory:
+      path = os.path.join(directory, 'rules.json')
+      with open(path, 'w', encoding='UTF-8') as file:
+        json.dump({'rules': [{'actions': [{'type': 'setHeader', 'name': 'x-foo', 'value': 'bar'}]}]}, file)
+      engine = RuleEngine.load(path)
+    context, request = _request()
+    engine.onRequest(context, request)
+    self.assertEqual(request.headers['x-foo'], 'bar')
+
+class RouterMatchAllTest(unittest.TestCase):
+  def testMatchAll(self):
+    router = Router()
+    values = {}
+    for name, host, path, method in [
+      ('any', None, None, None),
+      ('wildcard', '*.example.com', None, None),
+      ('exact', 'api.example.com', '/users/*', None),
+      ('get', 'api.example.com', '/users/me', 'GET'),
+      ('other', 'example.org', None, None),
+    ]:
+      values[name] = lambda context, message, name = name: name
+      router.add(values[name], host, path, method)
+    handlers = router.matchAll('api.example.com', 'GET', '/users/me')
+    self.assertEqual([handler(None, None) for handler in handlers], ['get', 'exact', 'wildcard', 'any'])
+    handlers = router.matchAll('example.org', 'POST', '/')
+    self.assertEqual([handler(None, None) for handler in handlers], ['other', 'any'])
+
+if __name__ == '__main__':
+  unittest.main()
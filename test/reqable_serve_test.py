@@ -0,0 +1,80 @@
+import unittest
+import os
+import tempfile
+import main
+from helper import load, frames, serveJobs
+
+class ServeTest(unittest.TestCase):
+  def tearDown(self):
+    for name in os.listdir('.'):
+      if name.startswith('tmp-'):
+        os.remove(name)
+    if os.path.exists('data/capture_request.json.cb'):
+      os.remove('data/capture_request.json.cb')
+
+  def testFrame(self):
+    stream = frames({'id': 1}, {'id': 2, 'text': '脚本'})
+    self.assertEqual(main.readFrame(stream), {'id': 1})
+    self.assertEqual(main.readFrame(stream), {'id': 2, 'text': '脚本'})
+    self.assertEqual(main.readFrame(stream), None)
+
+  def testServeMatchesCallbackFile(self):
+    main.onRequest('data/capture_request.json')
+    expected = load('data/capture_request.json.cb')
+    self.assertEqual(serveJobs(main.serveChannel, [{
+      'id': 7,
+      'type': 'request',
+      'data': load('data/capture_request.json'),
+    }]), [{
+      'id': 7,
+      'result': expected,
+    }])
+
+  def testServeMultipleJobs(self):
+    request = load('data/capture_request.json')
+    response = load('data/capture_response.json')
+    results = serveJobs(main.serveChannel, [
+      {'id': 1, 'type': 'request', 'data': request},
+      {'id': 2, 'type': 'response', 'data': response},
+      {'id': 3, 'type': 'unknown', 'data': request},
+      {'id': 4, 'type': 'request', 'data': request},
+    ])
+    self.assertEqual([frame['id'] for frame in results], [1, 2, 3, 4])
+    self.assertEqual(results[0]['result']['request']['path'], '/api/users?page=1&size=20')
+    self.assertEqual(results[1]['result']['response']['code'], 200)
+    self.assertEqual(results[1]['result']['shared'], {'count': 1})
+    self.assertEqual(results[2]['error'], 'Unexpected type unknown')
+    self.assertEqual(results[3]['result']['request']['method'], 'POST')
+
+  def testSocketPath(self):
+    import socket
+    with tempfile.TemporaryDirectory() as directory:
+      path = os.path.join(directory, 'file')
+      with open(path, 'w') as file:
+        file.write('keep')
+      # A file which is not a socket is never removed.
+      self.assertRaises(Exception, main.serveSocket, path)
+      self.assertTrue(os.path.isfile(path))
+      path = os.path.join(directory, 'socket')
+      server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+      server.bind(path)
+      server.close()
+      main._removeSocket(path)
+      self.assertFalse(os.path.exists(path))
+      main._removeSocket(path)
+
+  def testServeInvalidFrames(self):
+    request = load('data/capture_request.json')
+    results = serveJobs(main.serveChannel, [
+      b'{not json',
+      b'[1]',
+      b'{"id": 2, "type": "request", "data": {',
+      {'id': 3, 'type': 'request', 'data': request},
+    ])
+    self.assertEqual([frame['id'] for frame in results], [None, None, 2, 3])
+    for frame in results[:3]:
+      self.assertTrue(frame['error'].startswith('Invalid frame: '))
+    self.assertEqual(results[3]['result']['request']['method'], 'POST')
+
+if __name__ == '__main__':
+  unittest.main()
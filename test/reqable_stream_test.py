@@ -0,0 +1,49 @@
+import unittest
+import io
+import os
+import json
+import main
+from helper import load
+
+def _write(value) -> str:
+  file = io.StringIO()
+  main.writeJson(file, value)
+  return file.getvalue()
+
+class StreamTest(unittest.TestCase):
+  def setUp(self):
+    self.chunkSize = main._chunkSize
+
+  def tearDown(self):
+    main._chunkSize = self.chunkSize
+    for name in os.listdir('data'):
+      if name.endswith('.cb'):
+        os.remove(os.path.join('data', name))
+
+  def testSameAsDumps(self):
+    values = [
+      None, True, False, 0, -1, 1.5, 1e100, float('nan'), '', 'text',
+      'quote " backslash \\ newline \n tab \t nul \x00 unicode 脚本 emoji 😀',
+      [], {}, [1, 'a', None, [2, {}]], (1, 2),
+      {'a': {'b': [1, 2, {'c': None}]}, 'd': '😀'},
+      {1: 'int key', None: 'none key', 2.5: 'float key'},
+    ]
+    for value in values:
+      self.assertEqual(_write(value), json.dumps(value))
+
+  def testChunkedText(self):
+    main._chunkSize = 7
+    text = ''.join(chr(c) for c in range(0, 0x3000, 37)) + '😀😀😀"\\\\' * 5
+    value = {'request': {'body': {'type': 1, 'payload': {'text': text, 'charset': 'UTF-8'}}}}
+    self.assertEqual(_write(value), json.dumps(value))
+
+  def testCallbackFile(self):
+    main._chunkSize = 5
+    main.onRequest('data/capture_request.json')
+    with open('data/capture_request.json.cb', 'r', encoding='UTF-8') as content:
+      written = content.read()
+    expected = main.handleRequest(load('data/capture_request.json'))
+    self.assertEqual(written, json.dumps(expected))
+
+if __name__ == '__main__':
+  unittest.main()
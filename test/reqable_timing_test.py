@@ -0,0 +1,70 @@
+import unittest
+import os
+import json
+import shutil
+import tempfile
+import main
+from helper import load
+
+class TimingTest(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.cwd = os.getcwd()
+    self.request = os.path.join(self.directory, 'request.json')
+    shutil.copy('data/capture_request.json', self.request)
+    shutil.copy('data/capture_response.json', os.path.join(self.directory, 'response.json'))
+
+  def tearDown(self):
+    main.timingMode = None
+    os.chdir(self.cwd)
+    shutil.rmtree(self.directory)
+
+  def assertPhases(self, timing, phases):
+    self.assertEqual(sorted(timing.keys()), sorted(phases))
+    for value in timing.values():
+      self.assertIsInstance(value, int)
+      self.assertGreaterEqual(value, 0)
+
+  def testDisabled(self):
+    main.onRequest(self.request)
+    self.assertFalse('timing' in load(self.request + '.cb'))
+    self.assertFalse(os.path.exists(self.request + '.timing'))
+    self.assertFalse('timing' in main.handleJob({'id': 1, 'type': 'request', 'data': load(self.request)}))
+
+  def testCallback(self):
+    main.timingMode = 'callback'
+    main.onRequest(self.request)
+    callback = load(self.request + '.cb')
+    self.assertPhases(callback.pop('timing'), ['read', 'parse', 'addon', 'serialize'])
+    self.assertEqual(callback['request'], load(self.request)['request'])
+    self.assertFalse(os.path.exists(self.request + '.timing'))
+
+    frame = main.handleJob({'id': 1, 'type': 'request', 'data': load(self.request)})
+    self.assertPhases(frame['timing'], ['parse', 'addon', 'serialize'])
+    self.assertFalse('timing' in frame['result'])
+
+  def testFile(self):
+    main.timingMode = 'file'
+    main.onRequest(self.request)
+    self.assertFalse('timing' in load(self.request + '.cb'))
+    self.assertPhases(load(self.request + '.timing'), ['read', 'parse', 'addon', 'serialize', 'write'])
+
+    os.chdir(self.directory)
+    frame = main.handleJob({'id': 7, 'type': 'request', 'data': load(self.request)})
+    self.assertFalse('timing' in frame)
+    with open('reqable-timing.jsonl', 'r', encoding='UTF-8') as reader:
+      entries = [json.loads(line) for line in reader]
+    self.assertEqual(len(entries), 1)
+    self.assertEqual(entries[0]['id'], 7)
+    self.assertPhases(entries[0]['timing'], ['parse', 'addon', 'serialize'])
+
+  def testBatch(self):
+    main.timingMode = 'file'
+    self.assertEqual(main.runBatch(main._captures(os.path.join(self.directory, '*'))), (2, 0))
+    self.assertPhases(load(os.path.join(self.directory, 'response.json.timing')),
+      ['read', 'parse', 'addon', 'serialize', 'write'])
+    # The sidecar files are not processed again.
+    self.assertEqual(main.runBatch(main._captures(os.path.join(self.directory, '*'))), (2, 0))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+import os
+import main
+from helper import load, serveJobs
+
+def _jobs(count):
+  request = load('data/capture_request.json')
+  return [{'id': i, 'type': 'request', 'data': request} for i in range(count)]
+
+class ZygoteTest(unittest.TestCase):
+  def setUp(self):
+    self.onRequest = main.addons.onRequest
+    self.counter = 0
+    def onRequest(context, request):
+      # A leaking addon, it counts the processed messages in a global state.
+      self.counter += 1
+      request.headers['counter'] = str(self.counter)
+      return request
+    main.addons.onRequest = onRequest
+
+  def tearDown(self):
+    main.addons.onRequest = self.onRequest
+
+  def testIsolation(self):
+    frames = serveJobs(main.serveZygote, _jobs(3))
+    self.assertEqual([frame['id'] for frame in frames], [0, 1, 2])
+    for frame in frames:
+      self.assertEqual(frame['result']['request']['headers'][-1], 'counter: 1')
+    self.assertEqual(self.counter, 0)
+
+    frames = serveJobs(main.serveChannel, _jobs(3))
+    self.assertEqual([frame['result']['request']['headers'][-1] for frame in frames], [
+      'counter: 1',
+      'counter: 2',
+      'counter: 3',
+    ])
+
+  def testCrash(self):
+    main.addons.onRequest = lambda context, request: os._exit(3)
+    frames = serveJobs(main.serveZygote, _jobs(2))
+    self.assertEqual(frames, [
+      {'id': 0, 'error': 'Reqable script process exited unexpectedly'},
+      {'id': 1, 'error': 'Reqable script process exited unexpectedly'},
+    ])
+
+if __name__ == '__main__':
+  unittest.main()